@@ -0,0 +1,114 @@
+"""
+    學員資料合併的回歸測試 (不需要 Access driver):
+    以亂數產生 member001 ~ member007 的測試資料 (SQLite), 分別用原本逐步執行的合併及一次合併
+    (PzMemberMergeEngine) 處理, 比對兩者產生的 MemberData 是否完全相同.
+
+    python -m debugging.member_merge_regression [組數] [--save 資料夾]
+      --save: 把產生的測試資料存成 SQLite 檔案 (fixture_<seed>.sqlite), 方便重現
+"""
+import contextlib
+import io
+import os
+import random
+import sys
+from typing import Any
+
+from pz.sqlite.db import PzSqliteDatabase
+from pz.utils import personal_id_verification
+from services.member_merging_service import MemberMergingService
+
+TARGET_TABLE = 'MemberData'
+TARGET_COLUMNS = ['學員編號', '姓名', '法名', '性別', '身分證字號', '出生日期', '行動電話', '住家電話', '緊急聯絡人',
+                  '緊急聯絡人法名', '緊急聯絡人稱謂', '緊急聯絡人電話', '備註', '資料來源']
+
+NAMES = ['王小明', '陳大文', '林美麗', '張三 (法師)', '李四', '李四 ', '黃五', None]
+STUDENT_IDS = [f'{100000000 + i}' for i in range(12)] + ['缺生日', '12345']
+PHONES = [None, '', '0912345678', '0912-345678', '02-1234567', '無', '12', '-']
+BIRTHDAYS = [None, '1980-01-02', '1990-03-04']
+GENDERS = [None, '男', '女']
+
+
+def random_personal_id(rng: random.Random) -> str:
+    while True:
+        prefix = rng.choice('AB') + rng.choice('12') + ''.join(rng.choice('0123456789') for _ in range(7))
+        for digit in '0123456789':
+            if personal_id_verification(prefix + digit):
+                return prefix + digit
+
+
+def build_fixture(seed: int, db_path: str | None = None) -> PzSqliteDatabase:
+    """
+        依 seed 產生一組測試資料, 同一個 seed 一定產生相同的資料
+    """
+    rng = random.Random(seed)
+
+    def pick(pool: list[Any]) -> Any:
+        return rng.choice(pool)
+
+    if db_path is not None and os.path.exists(db_path):
+        os.remove(db_path)
+    db = PzSqliteDatabase(db_path)
+    columns = [f'"{x}" TEXT' for x in TARGET_COLUMNS]
+    columns[0] += ' PRIMARY KEY'
+    db.connection.execute(f'CREATE TABLE {TARGET_TABLE} ({",".join(columns)})')
+    db.create_table('member001', ['學員編號', '姓名', '法名', '性別', '出生日期', '行動電話', '住家電話', '緊急聯絡人',
+                                  '緊急聯絡人法名', '緊急聯絡人稱謂', '緊急聯絡人電話'],
+                    [[x, pick(NAMES), pick([None, '', '法1']), pick(GENDERS), pick(BIRTHDAYS), pick(PHONES),
+                      pick(PHONES), pick([None, '某人']), pick([None, '法x']), '父', pick(PHONES)]
+                     for x in rng.sample(STUDENT_IDS[:12], 6)])
+    db.create_table('member002', ['學員編號', '姓名', '法名', '性別'],
+                    [[pick(STUDENT_IDS), pick(NAMES), pick([None, ' ', '法2']), pick(GENDERS)] for _ in range(6)])
+    for table_name in ['member003', 'member004']:
+        db.create_table(table_name, ['姓名', '性別', '身分證字號', '出生日期'],
+                        [[pick(NAMES), pick(GENDERS), pick([random_personal_id(rng), None]), pick(BIRTHDAYS)]
+                         for _ in range(6)])
+    db.create_table('member005', ['學員編號', '學員姓名', '法名', '手機', '住宅'],
+                    [[pick(STUDENT_IDS), pick(NAMES), pick([None, '法5']), pick(PHONES), pick(PHONES)]
+                     for _ in range(6)])
+    db.create_table('member006', ['身份証號', '學員編號', '姓名', '性別', '出生日', '行動', '住宅電', '緊急連絡人',
+                                  '連絡人關係', '連絡人電話'],
+                    [[pick([random_personal_id(rng), None]), pick(STUDENT_IDS), pick(NAMES), pick(GENDERS),
+                      pick([None, '69.01.02', '79.03.04']), pick(PHONES), pick(PHONES), pick([None, '某']), '母',
+                      pick(PHONES)] for _ in range(6)])
+    db.create_table('member007', ['學員編號', '姓名', '法名', '性別'],
+                    [[pick(STUDENT_IDS), pick(NAMES), pick([None, '法7']), pick(GENDERS)] for _ in range(6)])
+    return db
+
+
+def merge_fixture(seed: int, single_pass: bool) -> list[tuple]:
+    db = build_fixture(seed)
+    service = MemberMergingService(':memory:', TARGET_TABLE, db.clone)
+    # 原本的合併步驟會 print 很多訊息
+    with contextlib.redirect_stdout(io.StringIO()):
+        service.reemerging(True, single_pass=single_pass)
+    service.close()
+    _, rows = db.query(f'SELECT * FROM {TARGET_TABLE} ORDER BY [學員編號]')
+    return [tuple(x) for x in rows]
+
+
+def check(count: int) -> int:
+    mismatches = 0
+    for seed in range(count):
+        step_by_step = merge_fixture(seed, single_pass=False)
+        single_pass = merge_fixture(seed, single_pass=True)
+        if step_by_step != single_pass:
+            mismatches += 1
+            print(f'[seed {seed}] 結果不同 ({len(step_by_step)} / {len(single_pass)} 筆)')
+            for a, b in zip(step_by_step, single_pass):
+                if a != b:
+                    print(f'  逐步: {a}')
+                    print(f'  一次: {b}')
+    print(f'{count} 組測試資料, {mismatches} 組結果不同')
+    return mismatches
+
+
+if __name__ == '__main__':
+    arguments = sys.argv[1:]
+    if '--save' in arguments:
+        folder = arguments[arguments.index('--save') + 1]
+        arguments = [x for x in arguments if x not in ('--save', folder)]
+        os.makedirs(folder, exist_ok=True)
+        for i in range(int(arguments[0]) if len(arguments) > 0 else 300):
+            build_fixture(i, os.path.join(folder, f'fixture_{i}.sqlite'))
+    else:
+        sys.exit(1 if check(int(arguments[0]) if len(arguments) > 0 else 300) > 0 else 0)
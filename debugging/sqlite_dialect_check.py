@@ -0,0 +1,221 @@
+"""
+    檢查 PzSqliteDialect 的 MySQL 規則 (不需要 MySQL server):
+    1. 程式中送出的每一種 MySQL 語法, 轉換後的結果是否與預期相同
+    2. 以 SQLite 實際執行用到這些語法的 service 方法, 檢查寫入的資料
+
+    python -m debugging.sqlite_dialect_check
+"""
+import contextlib
+import io
+import sys
+import types
+from typing import Any, Callable
+
+from pz.models.member_detail_model import MemberDetailModel
+from pz.models.mysql_class_member_entity import MysqlClassMemberEntity
+from pz.models.mysql_member_basic_entity import MysqlMemberBasicEntity
+from pz.models.mysql_member_more_basic_entity import MysqlMemberMoreBasicEntity
+from pz.sqlite.db import PzSqliteDatabase, PzSqliteDialect
+from services.access_db_migration import AccessDBMigration
+from services.member_merging_service import MemberMergingService
+from services.mysql_import_and_fetching import MySqlImportAndFetchingService
+
+# (程式中的寫法, MySQL 語法, 轉換後的 SQLite 語法)
+RULE_CASES: list[tuple[str, str, str]] = [
+    ('_swap_in_staging_table',
+     'RENAME TABLE `t_1` TO `t_2`, `t` TO `t_1`, `t_staging` TO `t`',
+     'ALTER TABLE "t_1" RENAME TO "t_2";\nALTER TABLE "t" RENAME TO "t_1";\nALTER TABLE "t_staging" RENAME TO "t"'),
+    ('_ensure_checkin_view',
+     'CREATE OR REPLACE VIEW `v` AS SELECT 1',
+     'DROP VIEW IF EXISTS "v";\nCREATE VIEW "v" AS SELECT 1'),
+    ('CREATE TEMPORARY TABLE ... LIKE',
+     'CREATE TEMPORARY TABLE `tmp` LIKE `member_details`',
+     'CREATE TEMPORARY TABLE "tmp" AS SELECT * FROM "member_details" WHERE 0'),
+    ('import_and_update_in_batch',
+     'DROP TEMPORARY TABLE IF EXISTS `tmp`',
+     'DROP TABLE IF EXISTS "tmp"'),
+    ('_load_into_table',
+     'TRUNCATE TABLE `t`',
+     'DELETE FROM "t"'),
+    ('existing_tables',
+     "SELECT TABLE_NAME FROM information_schema.TABLES \n"
+     "        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME IN ('a','b')",
+     "SELECT name FROM sqlite_master WHERE name IN ('a','b')"),
+    ('import_and_update_in_batch',
+     'UPDATE `member_details` d JOIN `tmp` t USING (student_id) SET d.`gender` = t.`gender`,d.`birthday` = t.`birthday` '
+     'WHERE t.column_set = 1',
+     'UPDATE "member_details" AS d SET "gender" = t."gender","birthday" = t."birthday" FROM "tmp" AS t '
+     'WHERE (d.student_id = t.student_id) AND (t.column_set = 1)'),
+    ('UPDATE ... JOIN ... ON',
+     'UPDATE `a` x INNER JOIN `b` y ON x.`id` = y.`id` SET x.`n` = y.`n`',
+     'UPDATE "a" AS x SET "n" = y."n" FROM "b" AS y WHERE (x."id" = y."id")'),
+    ('import_and_update_in_batch',
+     'DELETE d FROM `member_details` d JOIN `tmp` t USING (student_id) WHERE t.is_delete = 1',
+     'DELETE FROM "member_details" WHERE rowid IN '
+     '(SELECT d.rowid FROM "member_details" d JOIN "tmp" t USING (student_id) WHERE t.is_delete = 1)'),
+    ('AccessDBMigration._last_migrated_id',
+     '\n            DELETE b FROM `b1` b LEFT JOIN `m1` m ON b.`id` = m.`id` WHERE m.`id` IS NULL\n        ',
+     'DELETE FROM "b1" WHERE rowid IN (SELECT b.rowid FROM "b1" b LEFT JOIN "m1" m ON b."id" = m."id" '
+     'WHERE m."id" IS NULL)'),
+    ('_ensure_checkin_view / google_class_members_sync_to_mysql',
+     'INSERT INTO `v` (`a`,`b`) VALUES (%s,%s) ON DUPLICATE KEY UPDATE `b`=VALUES(`b`)',
+     'INSERT INTO "v" ("a","b") VALUES (?,?) ON CONFLICT DO UPDATE SET "b"=excluded."b"'),
+    ('MemberDetailModel.generate_query',
+     'INSERT INTO member_details (id,gender) VALUES (%s,%s) ON DUPLICATE KEY UPDATE gender=%s',
+     'INSERT INTO member_details (id,gender) VALUES (?,?) ON CONFLICT DO UPDATE SET gender=?'),
+    ('_class_members_creation_query',
+     'CREATE TABLE `c` (\n  `id` int NOT NULL AUTO_INCREMENT,\n'
+     "  `name` varchar(5) CHARACTER SET utf8mb4 COLLATE utf8mb4_general_ci NOT NULL COMMENT '班級',\n"
+     '  PRIMARY KEY (`id`),\n  UNIQUE KEY `u` (`name`,`id`),\n  KEY `idx` (`name`)\n'
+     ') ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;',
+     'CREATE TABLE "c" (\n  "id" INTEGER PRIMARY KEY AUTOINCREMENT,\n  "name" varchar(5) NOT NULL,\n'
+     '  UNIQUE ("name","id")\n)'),
+    ('import_and_update_in_batch',
+     'SELECT CAST(t.student_id AS UNSIGNED) FROM t WHERE d.`x` <=> t.`x`',
+     'SELECT CAST(t.student_id AS INTEGER) FROM t WHERE d."x" IS t."x"'),
+]
+
+
+def check_rules() -> list[str]:
+    dialect = PzSqliteDialect(PzSqliteDialect.MYSQL)
+    failures = []
+    for source, query, expected in RULE_CASES:
+        translated = dialect.translate(query)
+        if translated != expected:
+            failures.append(f'[{source}]\n  預期: {expected!r}\n  實際: {translated!r}')
+    return failures
+
+
+def new_service() -> tuple[PzSqliteDatabase, MySqlImportAndFetchingService]:
+    db = PzSqliteDatabase(dialect=PzSqliteDialect.MYSQL)
+    config = types.SimpleNamespace(semester='113_1', previous_semester='112_2',
+                                   mysql=types.SimpleNamespace(host='sqlite', database=db.uri, batch_size=1000,
+                                                               bulk_load=True))
+    return db, MySqlImportAndFetchingService(config, db=db)
+
+
+def table_rows(db: PzSqliteDatabase, query: str) -> list[tuple]:
+    return [tuple(x) for x in db.query(query)[1]]
+
+
+def check_member_import() -> list[str]:
+    access = PzSqliteDatabase()
+    columns = list(MysqlMemberBasicEntity.PZ_MYSQL_COLUMN_NAMES.keys())
+    access.create_table('MemberData', columns,
+                        [[str(100000 + i), f'名{i}'] + [None] * (len(columns) - 2) for i in range(50)])
+    merging = MemberMergingService(':memory:', 'MemberData', database_factory=access.clone)
+    db, service = new_service()
+    service.access_db_member_to_mysql(merging)
+    service.access_db_member_to_mysql(merging)
+    tables = table_rows(db, "SELECT name FROM sqlite_master WHERE type = 'table' ORDER BY name")
+    count = table_rows(db, 'SELECT COUNT(*) FROM member_details')
+    if count != [(50,)] or tables != [('member_details',)]:
+        return [f'access_db_member_to_mysql: {count} {tables}']
+    return []
+
+
+def check_checkin_view() -> list[str]:
+    db, service = new_service()
+    db.perform_update('CREATE TABLE member_details (student_id INT, real_name TEXT, dharma_name TEXT, gender TEXT, '
+                      'personal_id TEXT, mobile_phone TEXT)')
+    db.perform_update(service._class_members_creation_query(service.current_table))
+    view_name = 'view_member_only_for_checkin'
+    _, template = service.CHECKIN_VIEWS[view_name]
+    results = [service._ensure_checkin_view(view_name)]
+    # 版本變更時重建 view 並更新版本記錄
+    service.CHECKIN_VIEWS = {view_name: (2, template)}
+    MySqlImportAndFetchingService._ensured_views.clear()
+    results.append(service._ensure_checkin_view(view_name))
+    versions = table_rows(db, f'SELECT view_name, version FROM {service.VIEW_VERSION_TABLE}')
+    if results != [True, True] or versions != [(view_name, 2)]:
+        return [f'_ensure_checkin_view: {results} {versions}']
+    return []
+
+
+def class_member(student_id: int, class_name: str, group: int, name: str) -> tuple:
+    values = {'student_id': student_id, 'class_name': class_name, 'class_group': group, 'real_name': name,
+              'dharma_name': None, 'gender': '男', 'next_classes': None, 'senior': name, 'deacon': '', 'notes': None}
+    return tuple([values[x] for x in MysqlClassMemberEntity.VARIABLE_MAP.keys()])
+
+
+def check_class_member_sync() -> list[str]:
+    db, service = new_service()
+    service._full_import_class_members([class_member(1, 'A', 1, '甲'), class_member(2, 'A', 1, '乙'),
+                                        class_member(3, 'B', 2, '丙')], True)
+    params = [class_member(1, 'A', 2, '甲'), class_member(3, 'B', 2, '丙'), class_member(4, 'B', 1, '丁')]
+    service._read_google_class_member_params = lambda check_formula: params
+    result = service.google_class_members_sync_to_mysql()
+    rows = table_rows(db, f'SELECT student_id, class_name, class_group FROM `{service.current_table}` '
+                          f'ORDER BY student_id')
+    if ((result.inserted, result.updated, result.unchanged, result.deleted, result.failed) != (1, 1, 1, 1, 0) or
+            rows != [(1, 'A', 2), (3, 'B', 2), (4, 'B', 1)]):
+        return [f'google_class_members_sync_to_mysql: {result} {rows}']
+    return []
+
+
+def member_details_after(update: Callable[[MySqlImportAndFetchingService, list[MemberDetailModel]], Any]) -> \
+        list[tuple]:
+    db, service = new_service()
+    db.perform_update('CREATE TABLE `member_details` (`id` INT NOT NULL, `student_id` VARCHAR(255), '
+                      '`real_name` VARCHAR(255), `dharma_name` VARCHAR(255), `gender` VARCHAR(255), '
+                      '`birthday` VARCHAR(255), `mobile_phone` VARCHAR(255), `home_phone` VARCHAR(255), '
+                      'PRIMARY KEY (`student_id`))')
+    db.load_data('member_details', ['id', 'student_id', 'real_name', 'gender', 'mobile_phone'],
+                 [(100000001, '100000001', '甲', '男', '0911'), (100000002, '100000002', '乙', '女', None),
+                  (100000003, '100000003', '丙', '男', '0933')])
+    entries = [MemberDetailModel(dict([(x, '') for x in MemberDetailModel.VARIABLE_MAP.values()] + list(x.items())))
+               for x in [{'學員編號': '100000001', '姓名': '甲', '行動電話': '0912'},
+                         {'學員編號': '100000002'},
+                         {'學員編號': '100000003', '姓名': '丙', '性別': '男', '行動電話': '0933'},
+                         {'學員編號': '100000004', '姓名': '丁', '生日': '0101'}]]
+    update(service, entries)
+    return table_rows(db, 'SELECT * FROM member_details ORDER BY student_id')
+
+
+def check_member_details_update() -> list[str]:
+    row_by_row = member_details_after(lambda service, entries: service.import_and_update(entries))
+
+    def update_in_batch(service: MySqlImportAndFetchingService, entries: list[MemberDetailModel]):
+        # 批次更新失敗時會改用逐筆更新, 這裡要確認批次更新本身可以執行
+        def fallback(ignored: list[MemberDetailModel]):
+            raise RuntimeError('批次更新失敗, 改用逐筆更新')
+
+        service.import_and_update = fallback
+        service.import_and_update_in_batch(entries)
+
+    in_batch = member_details_after(update_in_batch)
+    if row_by_row != in_batch or len(in_batch) != 3:
+        return [f'import_and_update_in_batch:\n  逐筆: {row_by_row}\n  批次: {in_batch}']
+    return []
+
+
+def check_last_migrated_id() -> list[str]:
+    db, service = new_service()
+    db.create_table(MysqlMemberBasicEntity.TABLE_NAME, ['id'], [[1], [2], [3]])
+    db.create_table(MysqlMemberMoreBasicEntity.TABLE_NAME, ['id'], [[1], [2]])
+    migration = AccessDBMigration(service.config, db.uri, pz_db=db, db=db)
+    service.existing_tables = lambda names: set(names)
+    last_migrated_id = migration._last_migrated_id(service)
+    basics = table_rows(db, f'SELECT id FROM {MysqlMemberBasicEntity.TABLE_NAME} ORDER BY id')
+    if last_migrated_id != '2' or basics != [('1',), ('2',)]:
+        return [f'_last_migrated_id: {last_migrated_id} {basics}']
+    return []
+
+
+def check() -> int:
+    failures = check_rules()
+    for flow in [check_member_import, check_checkin_view, check_class_member_sync, check_member_details_update,
+                 check_last_migrated_id]:
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                failures.extend(flow())
+        except Exception as e:
+            failures.append(f'{flow.__name__}: {type(e).__name__}: {e}')
+    for failure in failures:
+        print(failure)
+    print(f'{len(RULE_CASES)} 個語法, 5 個流程, {len(failures)} 個錯誤')
+    return len(failures)
+
+
+if __name__ == '__main__':
+    sys.exit(1 if check() > 0 else 0)
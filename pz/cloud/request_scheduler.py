@@ -0,0 +1,227 @@
+import random
+import threading
+import time
+from typing import Any
+
+import httplib2
+from googleapiclient.errors import HttpError
+from loguru import logger
+
+
+class SpreadsheetRequestStatistics:
+    method: str
+    calls: int
+    coalesced: int
+    retries: int
+    failures: int
+    bytes: int
+    total_seconds: float
+    max_seconds: float
+    throttled_seconds: float
+
+    def __init__(self, method: str):
+        self.method = method
+        self.calls = 0
+        self.coalesced = 0
+        self.retries = 0
+        self.failures = 0
+        self.bytes = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.throttled_seconds = 0.0
+
+    def __str__(self) -> str:
+        average = self.total_seconds / self.calls if self.calls > 0 else 0.0
+        return (f'{self.method}: {self.calls} 次, 合併 {self.coalesced} 次, 重試 {self.retries} 次, '
+                f'失敗 {self.failures} 次, 回應 {self.bytes} bytes, 平均 {average * 1000:.0f} ms, '
+                f'最長 {self.max_seconds * 1000:.0f} ms, 等待配額 {self.throttled_seconds:.1f}s')
+
+
+class SpreadsheetPendingRequest:
+    done: threading.Event
+    response: Any
+    error: Exception | None
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.response = None
+        self.error = None
+
+
+class SpreadsheetRequestScheduler:
+    """
+    所有 Google API 呼叫都經過這裡執行:
+      token bucket 控制每分鐘的呼叫次數 (配合 API 配額),
+      429 / 5xx / 網路錯誤以指數退避加隨機延遲重試,
+      同時進行中的相同讀取只送出一次,
+      並依 API 方法統計呼叫次數, 資料量及花費時間
+    """
+    RETRYABLE_STATUS = (429, 500, 502, 503, 504)
+
+    requests_per_minute: int = 60
+    max_retries: int = 5
+    base_backoff_seconds: float = 1.0
+    max_backoff_seconds: float = 64.0
+    tokens: float = 60.0
+    refilled_at: float = 0.0
+    statistics: dict[str, SpreadsheetRequestStatistics] = {}
+    pending: dict[str, SpreadsheetPendingRequest] = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def configure(cls, requests_per_minute: int, max_retries: int):
+        with cls._lock:
+            cls.requests_per_minute = max(1, requests_per_minute)
+            cls.max_retries = max(0, max_retries)
+            cls.tokens = float(cls.requests_per_minute)
+            cls.refilled_at = time.monotonic()
+
+    @classmethod
+    def _statistics(cls, method: str) -> SpreadsheetRequestStatistics:
+        if method not in cls.statistics:
+            cls.statistics[method] = SpreadsheetRequestStatistics(method)
+        return cls.statistics[method]
+
+    @classmethod
+    def _acquire(cls) -> float:
+        """
+        取得一個 token, 傳回等待的秒數
+        """
+        waited = 0.0
+        while True:
+            with cls._lock:
+                now = time.monotonic()
+                if cls.refilled_at == 0.0:
+                    cls.refilled_at = now
+                cls.tokens = min(float(cls.requests_per_minute),
+                                 cls.tokens + (now - cls.refilled_at) * cls.requests_per_minute / 60)
+                cls.refilled_at = now
+                if cls.tokens >= 1:
+                    cls.tokens -= 1
+                    return waited
+                wait = (1 - cls.tokens) * 60 / cls.requests_per_minute
+            time.sleep(wait)
+            waited += wait
+
+    @classmethod
+    def transient_error(cls, error: Exception) -> bool:
+        """
+        網路錯誤或 429 / 5xx, 稍後再試可能成功; 400 / 403 / 404 等請求本身的錯誤傳回 False
+        """
+        if isinstance(error, HttpError):
+            return error.resp.status in cls.RETRYABLE_STATUS
+        # httplib2.ServerNotFoundError (DNS) 等不是 OSError
+        return isinstance(error, (OSError, TimeoutError, httplib2.HttpLib2Error))
+
+    @classmethod
+    def _retry_delay(cls, attempt: int, error: Exception) -> float | None:
+        """
+        可以重試時傳回等待的秒數, 不能重試時傳回 None
+        """
+        if not cls.transient_error(error):
+            return None
+        if isinstance(error, HttpError):
+            retry_after = error.resp.get('retry-after')
+            if retry_after is not None and str(retry_after).isdigit():
+                return float(retry_after)
+        # full jitter
+        return random.uniform(0, min(cls.max_backoff_seconds, cls.base_backoff_seconds * (2 ** attempt)))
+
+    @staticmethod
+    def _measure_content(request) -> list[int]:
+        """
+        HttpRequest 以 postproc(resp, content) 解析回應, 在這裡記錄回應內容 (HTTP body) 的長度
+        """
+        size = [0]
+        postproc = getattr(request, 'postproc', None)
+        if postproc is not None:
+            def measured(resp, content):
+                size[0] = len(content) if content is not None else 0
+                return postproc(resp, content)
+
+            request.postproc = measured
+        return size
+
+    @classmethod
+    def _execute_with_retry(cls, request, method: str) -> Any:
+        size = cls._measure_content(request)
+        attempt = 0
+        while True:
+            throttled = cls._acquire()
+            start = time.perf_counter()
+            try:
+                response = request.execute()
+            except Exception as e:
+                elapsed = time.perf_counter() - start
+                delay = cls._retry_delay(attempt, e) if attempt < cls.max_retries else None
+                with cls._lock:
+                    statistics = cls._statistics(method)
+                    statistics.calls += 1
+                    statistics.total_seconds += elapsed
+                    statistics.throttled_seconds += throttled
+                    if delay is None:
+                        statistics.failures += 1
+                    else:
+                        statistics.retries += 1
+                if delay is None:
+                    raise
+                logger.warning(f'{method}: {e}, {delay:.1f}s 後重試 ({attempt + 1}/{cls.max_retries})')
+                time.sleep(delay)
+                attempt += 1
+                continue
+
+            elapsed = time.perf_counter() - start
+            with cls._lock:
+                statistics = cls._statistics(method)
+                statistics.calls += 1
+                statistics.bytes += size[0]
+                statistics.total_seconds += elapsed
+                statistics.max_seconds = max(statistics.max_seconds, elapsed)
+                statistics.throttled_seconds += throttled
+            return response
+
+    @classmethod
+    def execute(cls, request) -> Any:
+        method = getattr(request, 'methodId', None) or 'unknown'
+
+        # 只合併讀取 (GET), 相同的 uri 表示相同的請求
+        key = None
+        if getattr(request, 'method', 'GET') == 'GET' and getattr(request, 'uri', None) is not None:
+            key = request.uri
+
+        if key is None:
+            return cls._execute_with_retry(request, method)
+
+        with cls._lock:
+            pending = cls.pending.get(key)
+            owner = pending is None
+            if owner:
+                pending = SpreadsheetPendingRequest()
+                cls.pending[key] = pending
+            else:
+                cls._statistics(method).coalesced += 1
+
+        if not owner:
+            pending.done.wait()
+            if pending.error is not None:
+                raise pending.error
+            return pending.response
+
+        try:
+            pending.response = cls._execute_with_retry(request, method)
+            return pending.response
+        except Exception as e:
+            pending.error = e
+            raise
+        finally:
+            with cls._lock:
+                del cls.pending[key]
+            pending.done.set()
+
+    @classmethod
+    def report(cls):
+        if len(cls.statistics) == 0:
+            return
+        logger.info('Google API 呼叫統計:')
+        for statistics in sorted(cls.statistics.values(), key=lambda x: x.method):
+            logger.info(f'  {statistics}')
@@ -1,10 +1,13 @@
 import json
+import re
 from typing import Any
 
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
 from loguru import logger
 
+from pz.cloud.request_scheduler import SpreadsheetRequestScheduler
+from pz.cloud.spreadsheet_cache import SpreadsheetCache
 from pz.config import PzProjectGoogleSpreadsheetConfig
 from pz.utils import safe_index
 
@@ -13,6 +16,10 @@ from pz.utils import safe_index
 #           "https://www.googleapis.com/auth/spreadsheets"]
 # SCOPES = ["https://www.googleapis.com/auth/spreadsheets.readonly"]
 SCOPES = ["https://www.googleapis.com/auth/spreadsheets"]
+# 只有啟用快取時才需要查詢 Drive 的修改時間
+DRIVE_SCOPES = ["https://www.googleapis.com/auth/drive.metadata.readonly"]
+# USER_ENTERED 會轉成數字的文字
+NUMBER_PATTERN = re.compile(r'^[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?$')
 
 
 class SpreadsheetValueData:
@@ -36,6 +43,35 @@ class SpreadsheetValueWithFormula:
         return f"{self.value} {self.formula}"
 
 
+class SpreadsheetHeaders:
+    """
+    表頭列的快取內容; grid 為讀取時的 (rowCount, columnCount, frozenRowCount), 工作表格線變更時失效.
+    欄位名稱對應的位置 (safe_index) 也一併快取
+    """
+    headers: list[str]
+    header_row: int
+    grid: tuple[int, int, int]
+    indexes: dict[str, int]
+    last_indexes: dict[str, int]
+
+    def __init__(self, headers: list[str], header_row: int, grid: tuple[int, int, int]):
+        self.headers = headers
+        self.header_row = header_row
+        self.grid = grid
+        self.indexes = {}
+        self.last_indexes = {}
+
+    def index_of(self, col_name: str) -> int:
+        if col_name not in self.indexes:
+            self.indexes[col_name] = safe_index(self.headers, col_name, -1)
+        return self.indexes[col_name]
+
+    def last_index_of(self, col_name: str) -> int:
+        if col_name not in self.last_indexes:
+            self.last_indexes[col_name] = len(self.headers) - 1 - self.headers[::-1].index(col_name)
+        return self.last_indexes[col_name]
+
+
 class Spreadsheet:
     sheetId: int
     title: str
@@ -64,47 +100,164 @@ class Spreadsheet:
     def to_json(self) -> str:
         return json.dumps(self, default=lambda o: o.__dict__, sort_keys=True, indent=4)
 
-    def get_headers(self, specify_header_row: int | None = None) -> tuple[list[str], int]:
+    def grid(self) -> tuple[int, int, int]:
+        return self.rowCount, self.columnCount, self.frozenRowCount
+
+    def header_row(self, specify_header_row: int | None = None) -> int:
         logger.debug(f'frozenRowCount: {self.frozenRowCount}')
         header_row = 1 if self.frozenRowCount == 0 else self.frozenRowCount
+        return specify_header_row if specify_header_row is not None else header_row
+
+    def rows_range(self, first_row: int, last_row: int) -> str:
+        return f"'{self.title}'!R{first_row}C1:R{last_row}C{self.columnCount}"
+
+    def cells_range(self, first_row: int, last_row: int, first_column: int, last_column: int) -> str:
+        return f"'{self.title}'!R{first_row}C{first_column}:R{last_row}C{last_column}"
+
+    @staticmethod
+    def normalize_headers(values: list[Any]) -> list[str]:
+        return [v.replace('\n', '') for v in values]
+
+    def get_header_info(self, specify_header_row: int | None = None) -> SpreadsheetHeaders:
+        header_row = self.header_row(specify_header_row)
+        cached = self.service.cached_headers(self, header_row)
+        if cached is not None:
+            return cached
 
-        header_row = specify_header_row if specify_header_row is not None else header_row
         # self.service.fetch_range("03-活動調查(所有學員)!R1C1:R10C10")
-        header_row_range = f"'{self.title}'!R{header_row}C1:R{header_row}C{self.columnCount}"
+        header_row_range = self.rows_range(header_row, header_row)
         # print(header_row_range)
         result = self.service.fetch_range(header_row_range)
         # logger.debug(f'{result['values'][0]}')
-        headers = [v.replace('\n', '') for v in result['values'][0]]
+        headers = self.normalize_headers(result['values'][0])
         logger.trace(f'{headers}')
 
-        return headers, header_row
+        return self.service.cache_headers(self, header_row, headers)
+
+    def get_headers(self, specify_header_row: int | None = None) -> tuple[list[str], int]:
+        info = self.get_header_info(specify_header_row)
+        return info.headers, info.header_row
 
 
 class GoogleSpreadsheetService:
     sheets: dict[str, dict[str, str | int | dict[str, int]]]
     spreadsheet_id: str
+    headers_cache: dict[tuple[int, int], SpreadsheetHeaders]
+    drive_files: Any
+    revision: str | None
+    revision_checked: bool
+    sheets_stale: bool
+    # 無法查詢 Drive 修改時間的試算表, 不再重複查詢及警告
+    revision_unavailable: set[str] = set()
 
     def __init__(self, settings: PzProjectGoogleSpreadsheetConfig, secret_file: str) -> None:
         self.spreadsheet_id = settings.spreadsheet_id
-        credentials = service_account.Credentials.from_service_account_file(secret_file, scopes=SCOPES)
+        cache_enabled = SpreadsheetCache.enabled()
+        credentials = service_account.Credentials.from_service_account_file(
+            secret_file, scopes=SCOPES + DRIVE_SCOPES if cache_enabled else SCOPES)
         service = build("sheets", "v4", credentials=credentials)
+        self.drive_files = build("drive", "v3", credentials=credentials).files() if cache_enabled else None
 
         # Call the Sheets API
         self.sheet = service.spreadsheets()
+        self.headers_cache = {}
+        self.revision = None
+        self.revision_checked = False
+        self.sheets_stale = False
+        self.refresh_sheets()
 
-        result = self.sheet.get(spreadsheetId=self.spreadsheet_id,
-                                fields="properties.title,sheets.properties").execute()
+    def current_revision(self) -> str | None:
+        """
+        Drive 的 version/modifiedTime, 每個 service 只查詢一次 (自己寫入後會重新查詢); 查不到時傳回 None
+        """
+        if not self.revision_checked:
+            self.revision_checked = True
+            self.revision = None
+            if self.spreadsheet_id in GoogleSpreadsheetService.revision_unavailable:
+                return None
+            try:
+                result = SpreadsheetRequestScheduler.execute(
+                    self.drive_files.get(fileId=self.spreadsheet_id, fields='version,modifiedTime'))
+                self.revision = f"{result.get('version')}/{result.get('modifiedTime')}"
+            except Exception as e:
+                if not SpreadsheetRequestScheduler.transient_error(e):
+                    # 例如沒有啟用 Drive API, 之後也不會成功
+                    GoogleSpreadsheetService.revision_unavailable.add(self.spreadsheet_id)
+                logger.warning(f'無法取得試算表的修改時間, 不使用快取: {e}')
+        return self.revision
+
+    def _cached_execute(self, kind: str, ranges: str | list[str], request) -> dict[str, Any]:
+        """
+        試算表沒有變更時使用本機快取; 網路錯誤或 429 / 5xx 重試後仍失敗時也改用快取.
+        取不到修改時間時不寫入快取 (無法判斷是否過期)
+        """
+        if not SpreadsheetCache.enabled():
+            return SpreadsheetRequestScheduler.execute(request)
+
+        revision = self.current_revision()
+        cached = SpreadsheetCache.load(self.spreadsheet_id, kind, ranges)
+        if cached is not None and revision is not None and cached['revision'] == revision:
+            logger.debug(f'cached: {ranges}')
+            return cached['response']
+
+        try:
+            response = SpreadsheetRequestScheduler.execute(request)
+        except Exception as e:
+            if cached is None or not SpreadsheetRequestScheduler.transient_error(e):
+                raise
+            logger.warning(f'讀取失敗, 使用本機快取 ({cached["revision"]}): {e}')
+            return cached['response']
+
+        if revision is not None:
+            SpreadsheetCache.store(self.spreadsheet_id, kind, ranges, revision, response)
+        return response
+
+    def _written(self):
+        # 自己寫入後試算表的版本會改變, 寫到格線外時工作表的列數也會改變;
+        # 下次取得工作表時重新讀取屬性
+        self.revision_checked = False
+        self.sheets_stale = True
+
+    def refresh_sheets(self):
+        """
+        重新讀取工作表的屬性; 格線 (列數, 欄數, 凍結列數) 改變的工作表, 表頭快取在下次讀取時失效
+        """
+        result = self._cached_execute('properties', '', self.sheet.get(
+            spreadsheetId=self.spreadsheet_id, fields="properties.title,sheets.properties"))
 
         self.sheets = {entry['properties']['title']: entry['properties'] for entry in result['sheets']}
+        self.sheets_stale = False
         # print(self.sheets)
 
+    def cached_headers(self, spreadsheet: Spreadsheet, header_row: int) -> SpreadsheetHeaders | None:
+        cached = self.headers_cache.get((spreadsheet.sheetId, header_row))
+        if cached is not None and cached.grid != spreadsheet.grid():
+            del self.headers_cache[(spreadsheet.sheetId, header_row)]
+            return None
+        return cached
+
+    def cache_headers(self, spreadsheet: Spreadsheet, header_row: int, headers: list[str]) -> SpreadsheetHeaders:
+        info = SpreadsheetHeaders(headers, header_row, spreadsheet.grid())
+        self.headers_cache[(spreadsheet.sheetId, header_row)] = info
+        return info
+
+    def invalidate_headers(self, sheet_id: int | None = None):
+        if sheet_id is None:
+            self.headers_cache.clear()
+        else:
+            for key in [x for x in self.headers_cache.keys() if x[0] == sheet_id]:
+                del self.headers_cache[key]
+
     def get_sheet_by_title(self, title: str) -> Spreadsheet | None:
+        if self.sheets_stale:
+            self.refresh_sheets()
         if title in self.sheets:
             return Spreadsheet(self, self.sheets[title])
         return None
 
     def fetch_range_with_formula(self, sheet_range: str) -> list[list[SpreadsheetValueWithFormula]]:
-        result = self.sheet.get(spreadsheetId=self.spreadsheet_id, ranges=sheet_range, includeGridData=True).execute()
+        result = self._cached_execute('formula', sheet_range, self.sheet.get(
+            spreadsheetId=self.spreadsheet_id, ranges=sheet_range, includeGridData=True))
         sheets = result.get('sheets', [])
 
         result_list: list[list[SpreadsheetValueWithFormula]] = []
@@ -125,27 +278,93 @@ class GoogleSpreadsheetService:
 
         return result_list
 
+    @staticmethod
+    def _unformatted_value(cell: dict[str, Any]) -> Any:
+        effective_value = cell.get('effectiveValue')
+        if effective_value is None:
+            return ''
+        for key in ['numberValue', 'stringValue', 'boolValue']:
+            if key in effective_value:
+                return effective_value[key]
+        # 錯誤的儲存格 (#N/A 等) 與 values.get 相同, 傳回顯示的文字
+        return cell.get('formattedValue', '')
+
+    @staticmethod
+    def trim_trailing(values: list[Any]) -> list[Any]:
+        """
+        與 values.get 相同, 去掉結尾的空白儲存格/空白列
+        """
+        end = len(values)
+        while end > 0 and (values[end - 1] is None or values[end - 1] == '' or values[end - 1] == []):
+            end -= 1
+        return values[:end]
+
     def fetch_range_with_unformatted_value(self, sheet_range: str) -> list[SpreadsheetValueData]:
         # print(sheet_range)
-        formatted_values_request = self.sheet.values().get(
-            spreadsheetId=self.spreadsheet_id, range=sheet_range, valueRenderOption='FORMATTED_VALUE'
-        )
-        formatted_values_response = formatted_values_request.execute()
-        formatted_values = formatted_values_response.get('values', [])
-
-        unformatted_values_request = self.sheet.values().get(
-            spreadsheetId=self.spreadsheet_id, range=sheet_range, valueRenderOption='UNFORMATTED_VALUE'
-        )
-        unformatted_values_response = unformatted_values_request.execute()
-        unformatted_values = unformatted_values_response.get('values', [])
+        # 一次 spreadsheets.get 同時取得格式化及未格式化的值 (原本是兩次 values.get)
+        grids = self.fetch_grid_data(
+            [sheet_range], 'sheets(data(rowMetadata(pixelSize),rowData(values(formattedValue,effectiveValue))))')
+        row_data = grids[0] if len(grids) > 0 else []
+
+        formatted_values = []
+        unformatted_values = []
+        for row in row_data:
+            cells = row.get('values', [])
+            formatted_values.append(self.trim_trailing([x.get('formattedValue', '') for x in cells]))
+            unformatted_values.append(self.trim_trailing([self._unformatted_value(x) for x in cells]))
+        formatted_values = self.trim_trailing(formatted_values)
 
         data: list[SpreadsheetValueData] = []
         for i in range(len(formatted_values)):
             data.append(SpreadsheetValueData(formatted_values[i], unformatted_values[i]))
         return data
 
-    def fetch_range(self, sheet_range: str) -> dict[str, Any]:
-        return self.sheet.values().get(spreadsheetId=self.spreadsheet_id, range=sheet_range).execute()
+    def fetch_grid_data(self, ranges: list[str], fields: str) -> list[list[dict[str, Any]]]:
+        """
+        includeGridData 的 spreadsheets.get, 以 fields 限定回傳的欄位; 傳回每個範圍的 rowData
+        (fields 要包含 rowMetadata, 空白的範圍才不會被省略)
+        """
+        result = self._cached_execute(f'grid:{fields}', ranges, self.sheet.get(
+            spreadsheetId=self.spreadsheet_id, ranges=ranges, includeGridData=True, fields=fields))
+        return [data.get('rowData', []) for sheet in result.get('sheets', []) for data in sheet.get('data', [])]
+
+    def batch_fetch_ranges(self, ranges: list[str],
+                           value_render_option: str = 'FORMATTED_VALUE') -> list[list[list[Any]]]:
+        result = self._cached_execute(f'batch:{value_render_option}', ranges, self.sheet.values().batchGet(
+            spreadsheetId=self.spreadsheet_id, ranges=ranges, valueRenderOption=value_render_option))
+        return [x.get('values', []) for x in result.get('valueRanges', [])]
+
+    def fetch_range(self, sheet_range: str, value_render_option: str = 'FORMATTED_VALUE',
+                    date_time_render_option: str = 'SERIAL_NUMBER') -> dict[str, Any]:
+        return self._cached_execute(f'values:{value_render_option}:{date_time_render_option}', sheet_range,
+                                    self.sheet.values().get(spreadsheetId=self.spreadsheet_id, range=sheet_range,
+                                                            valueRenderOption=value_render_option,
+                                                            dateTimeRenderOption=date_time_render_option))
+
+    def clear_ranges(self, sheet_ranges: list[str]) -> None:
+        if len(sheet_ranges) == 1:
+            result = SpreadsheetRequestScheduler.execute(self.sheet.values().clear(
+                spreadsheetId=self.spreadsheet_id, range=sheet_ranges[0], body={}))
+            cleared = [result.get('clearedRange')]
+        else:
+            result = SpreadsheetRequestScheduler.execute(self.sheet.values().batchClear(
+                spreadsheetId=self.spreadsheet_id, body={'ranges': sheet_ranges}))
+            cleared = result.get('clearedRanges', [])
+        self._written()
+        logger.info(f"{', '.join([x for x in cleared if x is not None])} cleared.")
+
+    def batch_store_ranges(self, data: list[tuple[str, list[list[Any]]]]) -> None:
+        """
+        多個範圍用一次 values.batchUpdate 寫入
+        """
+        body = {
+            'valueInputOption': 'USER_ENTERED',
+            'data': [{'range': sheet_range, 'values': values} for sheet_range, values in data],
+        }
+        result = SpreadsheetRequestScheduler.execute(
+            self.sheet.values().batchUpdate(spreadsheetId=self.spreadsheet_id, body=body))
+        self._written()
+        logger.info(f"{result.get('totalUpdatedCells')} cells updated ({len(data)} ranges).")
 
     def store_range(self, sheet_range: str, values: list[list[Any]]) -> None:
         """
@@ -160,10 +379,11 @@ class GoogleSpreadsheetService:
             # Additional rows ...
         ]
         """
-        result = (self.sheet.values().update(spreadsheetId=self.spreadsheet_id,
-                                             range=sheet_range,
-                                             valueInputOption='USER_ENTERED',
-                                             body={"values": values}).execute())
+        result = SpreadsheetRequestScheduler.execute(self.sheet.values().update(spreadsheetId=self.spreadsheet_id,
+                                                                                range=sheet_range,
+                                                                                valueInputOption='USER_ENTERED',
+                                                                                body={"values": values}))
+        self._written()
         logger.info(f"{result.get('updatedCells')} cells updated.")
 
 
@@ -177,9 +397,11 @@ class SpreadsheetRangeInfo:
     number_of_columns: int
 
     def __init__(self, spreadsheet: Spreadsheet, title: str, col_names: list[str], header_row: int | None = None,
-                 reverse_index: bool = False):
+                 reverse_index: bool = False, header_info: SpreadsheetHeaders | None = None):
         self.title = title
-        headers, h_row = spreadsheet.get_headers(header_row)
+        if header_info is None:
+            header_info = spreadsheet.get_header_info(header_row)
+        headers, h_row = header_info.headers, header_info.header_row
         logger.debug(f'headers: {header_row} {headers}, {h_row}')
         # print(headers)
         # indexes = [headers.index(col_name) for col_name in col_names]
@@ -187,9 +409,9 @@ class SpreadsheetRangeInfo:
         # for col_name in col_names:
         #     if
         if reverse_index:
-            self.indexes = [len(headers) - 1 - headers[::-1].index(col_name) for col_name in col_names]
+            self.indexes = [header_info.last_index_of(col_name) for col_name in col_names]
         else:
-            self.indexes = [safe_index(headers, col_name, -1) for col_name in col_names]
+            self.indexes = [header_info.index_of(col_name) for col_name in col_names]
             # self.indexes = [x for x in [safe_index(headers, col_name, -1) for col_name in col_names] if x >= 0]
         # my_list[::-1].index(element_to_find)
         # len(my_list) - 1 - last_occurrence_index
@@ -197,7 +419,7 @@ class SpreadsheetRangeInfo:
 
         self.starting_row = h_row + 1
         self.ending_row = spreadsheet.rowCount - 1
-        self.starting_index = min([x for x in [safe_index(headers, col_name, -1) for col_name in col_names] if x >= 0])
+        self.starting_index = min([x for x in [header_info.index_of(col_name) for col_name in col_names] if x >= 0])
 
         self.number_of_rows = spreadsheet.rowCount - self.starting_row
         self.number_of_columns = max(self.indexes) - self.starting_index + 1
@@ -208,6 +430,64 @@ class SpreadsheetRangeInfo:
         return f"'{self.title}'!R{self.starting_row}C{self.starting_index + 1}:R{count + self.starting_row }C{max(self.indexes) + 1}"
 
 
+class SpreadsheetReadPlanner:
+    """
+    表頭列和資料列 (整列寬度) 用一次 HTTP 呼叫讀取, 需要的欄位再依表頭在本地取出.
+    只要顯示的值用 values.batchGet (回應不含結尾的空白列, 所以只會下載有資料的範圍);
+    需要公式時先以 values.batchGet 只讀取需要的欄位, 找出最後一筆資料的位置,
+    再用限定 fields 的 spreadsheets.get 讀取到該列及最後一個需要的欄位為止
+    """
+    GRID_FIELDS = 'sheets(data(rowMetadata(pixelSize),rowData(values(formattedValue,userEnteredValue))))'
+
+    service: GoogleSpreadsheetService
+    spreadsheet: Spreadsheet
+    header_row: int
+
+    def __init__(self, service: GoogleSpreadsheetService, spreadsheet: Spreadsheet,
+                 specify_header_row: int | None = None):
+        self.service = service
+        self.spreadsheet = spreadsheet
+        self.header_row = spreadsheet.header_row(specify_header_row)
+
+    def _ranges(self) -> list[str]:
+        return [self.spreadsheet.rows_range(self.header_row, self.header_row),
+                self.spreadsheet.rows_range(self.header_row + 1, self.spreadsheet.rowCount)]
+
+    def read_values(self) -> tuple[SpreadsheetHeaders, list[list[Any]]]:
+        header_values, data_values = self.service.batch_fetch_ranges(self._ranges())
+        headers = Spreadsheet.normalize_headers(header_values[0] if len(header_values) > 0 else [])
+        logger.trace(f'{headers}')
+        return self.service.cache_headers(self.spreadsheet, self.header_row, headers), data_values
+
+    def read_with_formula(self, indexes: list[int]) -> list[list[SpreadsheetValueWithFormula]]:
+        """
+        indexes: 需要的欄位位置 (依 get_header_info 的表頭); 傳回的每一列從第一欄開始, 到最後一個需要的欄位為止
+        """
+        columns = sorted(set([x for x in indexes if x >= 0]))
+        if len(columns) == 0:
+            return []
+
+        # 工作表可能預留了上千列空白, 只讀到需要的欄位中最後一筆有資料的列
+        first_row = self.header_row + 1
+        probes = self.service.batch_fetch_ranges(
+            [self.spreadsheet.cells_range(first_row, self.spreadsheet.rowCount, x + 1, x + 1) for x in columns])
+        populated = max([len(x) for x in probes]) if len(probes) > 0 else 0
+        logger.debug(f'populated rows: {populated} / {self.spreadsheet.rowCount - self.header_row}')
+        if populated == 0:
+            return []
+
+        grids = self.service.fetch_grid_data(
+            [self.spreadsheet.cells_range(first_row, self.header_row + populated, 1, columns[-1] + 1)], self.GRID_FIELDS)
+        data_grid = grids[0] if len(grids) > 0 else []
+
+        rows = []
+        for row_data in data_grid:
+            rows.append([SpreadsheetValueWithFormula(x.get('formattedValue'),
+                                                     x.get('userEnteredValue', {}).get('formulaValue'))
+                         for x in row_data.get('values', [])])
+        return rows
+
+
 class SpreadsheetReadingService:
     service: GoogleSpreadsheetService
 
@@ -250,8 +530,17 @@ class SpreadsheetReadingService:
         if spreadsheet is None:
             logger.error(f'{title} not found')
         else:
+            planner = SpreadsheetReadPlanner(self.service, spreadsheet, header_row)
+            if read_formula:
+                # 表頭通常已在快取中, 先決定需要的欄位, 只讀取這些欄位的範圍
+                header_info = spreadsheet.get_header_info(header_row)
+            else:
+                header_info, full_rows = planner.read_values()
+
             range_info = SpreadsheetRangeInfo(spreadsheet, title, col_names, header_row=header_row,
-                                              reverse_index=reverse_index)
+                                              reverse_index=reverse_index, header_info=header_info)
+            if read_formula:
+                full_rows = planner.read_with_formula(range_info.indexes)
             # headers, h_row = spreadsheet.get_headers(header_row)
             #
             # logger.debug(f'headers: {header_row} {headers}, {h_row}')
@@ -280,19 +569,22 @@ class SpreadsheetReadingService:
 
             rows: list[list[SpreadsheetValueWithFormula]] = []
 
+            # 讀取的是整列, 只保留 data_range 的欄位
+            ending_index = max(indexes) + 1
             if read_formula:
-                results = self.service.fetch_range_with_formula(data_range)
+                results = [row[starting_index:ending_index] for row in full_rows]
                 for row in results:
                     entry: list[SpreadsheetValueWithFormula] = []
                     for i in indexes:
-                        if i >= 0 and i - starting_index <= len(row):
+                        if i >= 0 and i - starting_index < len(row):
                             entry.append(row[i - starting_index])
 
                     if len([x for x in entry if x.value is not None]) > 0:
                         logger.trace(f'{[x.value for x in entry]}')
                         rows.append(entry)
             else:
-                result = self.service.fetch_range(data_range)
+                result = {'values': [self.service.trim_trailing(row[starting_index:ending_index])
+                                     for row in full_rows]}
                 if 'values' in result:
                     for row in result['values']:
                         if row is not None and len(row) > 0:
@@ -312,15 +604,78 @@ class SpreadsheetReadingService:
             info = SpreadsheetRangeInfo(spreadsheet, title, col_names, header_row=header_row)
             logger.debug(f'range: {info.data_range} ({info.number_of_rows}, {info.number_of_columns})')
 
-            data = []
-            for r in range(0, info.number_of_rows):
-                entry = []
-                for c in range(0, info.number_of_columns):
-                    entry.append('')
-                data.append(entry)
-            self.service.store_range(info.data_range, data)
+            # values.clear 只清除值 (保留格式), 不必上傳整個空白字串的矩陣
+            self.service.clear_ranges([info.data_range])
+
+    @staticmethod
+    def _entered_value(value: Any) -> Any:
+        """
+        以 USER_ENTERED 寫入後, 用 FORMULA 讀回的值: 數字及數字文字為 float, TRUE / FALSE 為 bool,
+        開頭的 ' 表示強制為文字
+        """
+        if value is None:
+            return ''
+        if isinstance(value, bool):
+            return value
+        if isinstance(value, (int, float)):
+            return float(value)
+        text = str(value)
+        if text.startswith("'"):
+            return text[1:]
+        if text.upper() in ('TRUE', 'FALSE'):
+            return text.upper() == 'TRUE'
+        if NUMBER_PATTERN.match(text):
+            return float(text)
+        return text
+
+    @staticmethod
+    def _same_cell(value: Any, current: Any) -> bool:
+        """
+        value: 要寫入的資料, current: 以 FORMULA 讀回的目前內容 (公式為公式本身)
+        """
+        entered = SpreadsheetReadingService._entered_value(value)
+        if current is None:
+            current = ''
+        if isinstance(current, str):
+            # 純文字格式的欄位, 數字文字讀回時保持原樣
+            return current == entered or current == ('' if value is None else str(value))
+        if isinstance(current, bool) or isinstance(entered, bool):
+            return current is entered
+        return float(current) == entered
+
+    def _delta_ranges(self, info: SpreadsheetRangeInfo, current: list[list[Any]],
+                      data: list[list[Any]]) -> list[tuple[str, list[list[Any]]]]:
+        """
+        逐列找出有變更的欄位區段, 相鄰且欄位區段相同的列合併成一個範圍.
+        目前的資料比新的資料多出來的列會寫入空白 (取代先清空整個表)
+        """
+        runs: list[list[Any]] = []
+        for r in range(max(len(data), len(current))):
+            new_row = data[r] if r < len(data) else [''] * info.number_of_columns
+            old_row = current[r] if r < len(current) else []
+            changed = [c for c in range(info.number_of_columns)
+                       if not self._same_cell(new_row[c], old_row[c] if c < len(old_row) else None)]
+            if len(changed) == 0:
+                continue
+
+            first, last = changed[0], changed[-1]
+            if len(runs) > 0 and runs[-1][1] == r - 1 and runs[-1][2] == first and runs[-1][3] == last:
+                runs[-1][1] = r
+                runs[-1][4].append(new_row[first:last + 1])
+            else:
+                runs.append([r, r, first, last, [new_row[first:last + 1]]])
+
+        ranges = []
+        for first_row, last_row, first, last, rows in runs:
+            ranges.append((f"'{info.title}'!R{info.starting_row + first_row}C{info.starting_index + first + 1}:"
+                           f"R{info.starting_row + last_row}C{info.starting_index + last + 1}", rows))
+        return ranges
 
-    def write_data(self, title: str, col_names: list[str], values: list[list[Any]], header_row: int | None = None):
+    def write_data(self, title: str, col_names: list[str], values: list[list[Any]], header_row: int | None = None,
+                   delta: bool = False):
+        """
+        delta: 先讀取目前的內容 (公式及未格式化的值), 只用一次 values.batchUpdate 寫入有變更的儲存格 (不必先清空)
+        """
         if len(values) > 0:
             spreadsheet = self.service.get_sheet_by_title(title)
 
@@ -335,12 +690,23 @@ class SpreadsheetReadingService:
                     entry = [''] * info.number_of_columns
                     for i, v in enumerate(info.indexes):
                         try:
-                            entry[v] = value[i]
+                            entry[v - info.starting_index] = value[i]
                         except IndexError:
                             pass
                     # print(entry)
                     data.append(entry)
 
+                if delta:
+                    # 公式讀回公式本身, 其他儲存格讀回未格式化的值 (日期讀回顯示的文字)
+                    current = self.service.fetch_range(info.data_range, 'FORMULA', 'FORMATTED_STRING').get('values', [])
+                    ranges = self._delta_ranges(info, current, data)
+                    logger.debug(f'delta: {len(ranges)} ranges, {sum([len(x[1]) for x in ranges])} rows')
+                    if len(ranges) > 0:
+                        self.service.batch_store_ranges(ranges)
+                    else:
+                        logger.info('沒有需要更新的儲存格')
+                    return
+
                 r = info.re_calculate_range(len(values))
 
                 # data = []
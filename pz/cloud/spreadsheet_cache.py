@@ -0,0 +1,55 @@
+import gzip
+import hashlib
+import json
+import os
+from typing import Any
+
+from loguru import logger
+
+
+class SpreadsheetCache:
+    """
+    Google 試算表讀取結果的本機快取 (gzip 壓縮的 JSON), key 為 (試算表 ID, 讀取方式, 範圍).
+    每筆記錄 Drive 的 version/modifiedTime, 試算表沒有變更時直接讀取檔案; 網路不穩時也可以用上次的資料
+    """
+    folder: str | None = None
+
+    @classmethod
+    def configure(cls, folder: str | None):
+        cls.folder = folder
+
+    @classmethod
+    def enabled(cls) -> bool:
+        return cls.folder is not None
+
+    @classmethod
+    def _path(cls, spreadsheet_id: str, kind: str, ranges: str | list[str]) -> str:
+        key = json.dumps([spreadsheet_id, kind, ranges], ensure_ascii=False)
+        return os.path.join(cls.folder, f'{hashlib.sha1(key.encode("utf-8")).hexdigest()}.json.gz')
+
+    @classmethod
+    def load(cls, spreadsheet_id: str, kind: str, ranges: str | list[str]) -> dict[str, Any] | None:
+        if not cls.enabled():
+            return None
+        path = cls._path(spreadsheet_id, kind, ranges)
+        if not os.path.exists(path):
+            return None
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f'{path}: {e}')
+            return None
+
+    @classmethod
+    def store(cls, spreadsheet_id: str, kind: str, ranges: str | list[str], revision: str | None,
+              response: dict[str, Any]):
+        if not cls.enabled():
+            return
+        os.makedirs(cls.folder, exist_ok=True)
+        path = cls._path(spreadsheet_id, kind, ranges)
+        temp_file = f'{path}.tmp'
+        with gzip.open(temp_file, 'wt', encoding='utf-8') as f:
+            json.dump({'spreadsheet_id': spreadsheet_id, 'kind': kind, 'ranges': ranges, 'revision': revision,
+                       'response': response}, f, ensure_ascii=False)
+        os.replace(temp_file, path)
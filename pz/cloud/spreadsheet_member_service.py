@@ -63,7 +63,7 @@ class PzCloudSpreadsheetMemberService:
             self.settings.sheet_name, model.get_column_names(),
             header_row=self.settings.header_row)
 
-    def write_data(self, models: list[GoogleSpreadSheetModelInterface]):
+    def write_data(self, models: list[GoogleSpreadSheetModelInterface], delta: bool | None = None):
         if len(models) > 0:
 
             data = []
@@ -76,4 +76,5 @@ class PzCloudSpreadsheetMemberService:
             self.service.write_data(
                 self.settings.sheet_name, models[0].get_column_names(),
                 data,
-                header_row=self.settings.header_row)
+                header_row=self.settings.header_row,
+                delta=self.settings.delta_write if delta is None else delta)
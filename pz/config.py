@@ -50,6 +50,19 @@ class PzProjectMySqlConfig(PzProjectBaseConfig):
     password: str
     host: str
     database: str
+    pool_size: int = 5
+    pool_checkout_timeout: int = 30
+    pool_idle_ping_seconds: int = 60
+    batch_size: int = 1000
+    bulk_load: bool = True
+
+    def __init__(self, variables: dict[str, Any]) -> None:
+        super().__init__(variables)
+
+
+class PzProjectDbStatisticsConfig(PzProjectBaseConfig):
+    enabled: bool = False
+    slow_query_ms: int = 500
 
     def __init__(self, variables: dict[str, Any]) -> None:
         super().__init__(variables)
@@ -58,6 +71,7 @@ class PzProjectMySqlConfig(PzProjectBaseConfig):
 class PzProjectMsAccessConfig(PzProjectBaseConfig):
     db_file: str
     target_table: str
+    batch_size: int = 500
 
     def __init__(self, variables: dict[str, Any]) -> None:
         super().__init__(variables)
@@ -69,6 +83,7 @@ class PzProjectGoogleSpreadsheetConfig(PzProjectBaseConfig):
     sheet_name: str
     header_row: int
     fields_map: dict[str, str | list[str]] | None
+    delta_write: bool = False
 
     def __init__(self, variables: dict[str, Any]) -> None:
         self.fields_map = None
@@ -87,6 +102,8 @@ class PzProjectGoogleSpreadsheetConfig(PzProjectBaseConfig):
 class PzProjectGoogleConfig(PzProjectBaseConfig):
     secret_file: str
     spreadsheets: dict[str, PzProjectGoogleSpreadsheetConfig]
+    requests_per_minute: int = 60
+    max_retries: int = 5
 
     def __init__(self, variables: dict[str, Any]) -> None:
         self.spreadsheets = {}
@@ -249,8 +266,13 @@ class PzProjectConfig(PzProjectBaseConfig):
     workspace: str
     template_folder: str
     output_folder: str
+    snapshot_folder: str
+    from_snapshot: bool
+    metadata_cache_file: str
+    google_cache_folder: str | None
     mysql: PzProjectMySqlConfig
     ms_access_db: PzProjectMsAccessConfig
+    db_statistics: PzProjectDbStatisticsConfig
     google: PzProjectGoogleConfig
     excel: PzProjectExcelConfig
     semester: str
@@ -292,6 +314,11 @@ class PzProjectConfig(PzProjectBaseConfig):
 
         PzProjectConfigGlobal.config = self
         self.meditation_class_names = []
+        self.snapshot_folder = os.path.join(self.output_folder, 'snapshots')
+        self.from_snapshot = False
+        self.metadata_cache_file = os.path.join(self.output_folder, 'access_metadata.json')
+        self.google_cache_folder = None
+        self.db_statistics = PzProjectDbStatisticsConfig({})
         super().__init__(variables, self.variable_initializer)
 
     def variable_initializer(self, variable: str, value: Any) -> bool:
@@ -299,6 +326,8 @@ class PzProjectConfig(PzProjectBaseConfig):
             self.mysql = PzProjectMySqlConfig(value)
         elif variable == 'ms_access_db':
             self.ms_access_db = PzProjectMsAccessConfig(value)
+        elif variable == 'db_statistics':
+            self.db_statistics = PzProjectDbStatisticsConfig(value)
         elif variable == 'google':
             self.google = PzProjectGoogleConfig(value)
         elif variable == 'excel':
@@ -0,0 +1,135 @@
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Generator, Iterable
+
+from loguru import logger
+
+
+class PzDbCallSiteStatistics:
+    call_site: str
+    calls: int
+    total_seconds: float
+    max_seconds: float
+    rows: int
+    bytes: int
+
+    def __init__(self, call_site: str):
+        self.call_site = call_site
+        self.calls = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.rows = 0
+        self.bytes = 0
+
+
+class PzDbMeasurement:
+    enabled: bool
+    rows: int
+    bytes: int
+
+    def __init__(self, enabled: bool):
+        self.enabled = enabled
+        self.rows = 0
+        self.bytes = 0
+
+    def fetched(self, rows: Iterable[Iterable[Any]]):
+        if not self.enabled:
+            return
+        for row in rows:
+            self.rows += 1
+            for value in row:
+                if value is None:
+                    continue
+                elif isinstance(value, (bytes, bytearray)):
+                    self.bytes += len(value)
+                elif isinstance(value, str):
+                    self.bytes += len(value.encode('utf-8'))
+                else:
+                    self.bytes += 8
+
+    def affected(self, rows: int):
+        if self.enabled and rows > 0:
+            self.rows += rows
+
+
+class PzDbStatistics:
+    """
+        資料庫操作的計時統計 (預設關閉). 依呼叫的位置累計, 超過門檻的 SQL 會記錄在 log
+    """
+    enabled: bool = False
+    slow_query_seconds: float = 0.5
+    call_sites: dict[str, PzDbCallSiteStatistics] = {}
+    _lock = threading.Lock()
+    _db_modules = (
+        os.path.join('pz', 'mysql'),
+        os.path.join('pz', 'ms_access', 'db.py'),
+        os.path.join('pz', 'sqlite'),
+        'contextlib',
+        'db_statistics.py',
+    )
+
+    @classmethod
+    def configure(cls, enabled: bool, slow_query_ms: int):
+        cls.enabled = enabled
+        cls.slow_query_seconds = slow_query_ms / 1000
+
+    @classmethod
+    def _call_site(cls) -> str:
+        frame = sys._getframe(1)
+        while frame is not None:
+            filename = frame.f_code.co_filename
+            if not any([x in filename for x in cls._db_modules]):
+                return f'{os.path.basename(filename)}:{frame.f_lineno} {frame.f_code.co_name}'
+            frame = frame.f_back
+        return 'unknown'
+
+    @classmethod
+    @contextmanager
+    def measure(cls, db_name: str, operation: str, query: str) -> Generator[PzDbMeasurement, None, None]:
+        measurement = PzDbMeasurement(cls.enabled)
+
+        if not cls.enabled:
+            yield measurement
+            return
+
+        call_site = cls._call_site()
+        start = time.perf_counter()
+        try:
+            yield measurement
+        finally:
+            elapsed = time.perf_counter() - start
+
+            with cls._lock:
+                if call_site not in cls.call_sites:
+                    cls.call_sites[call_site] = PzDbCallSiteStatistics(call_site)
+                statistics = cls.call_sites[call_site]
+                statistics.calls += 1
+                statistics.total_seconds += elapsed
+                statistics.max_seconds = max(statistics.max_seconds, elapsed)
+                statistics.rows += measurement.rows
+                statistics.bytes += measurement.bytes
+
+            if elapsed >= cls.slow_query_seconds:
+                logger.warning(f'slow {db_name} {operation} ({elapsed:.3f}s, {measurement.rows} rows) '
+                               f'at {call_site}: {" ".join(query.split())[:300]}')
+
+    @classmethod
+    def report(cls):
+        with cls._lock:
+            all_statistics = sorted(cls.call_sites.values(), key=lambda x: x.total_seconds, reverse=True)
+
+        if len(all_statistics) == 0:
+            return
+
+        logger.info(f'{"call site":<60} {"calls":>7} {"total(s)":>10} {"max(s)":>9} {"rows":>9} {"bytes":>12}')
+        for s in all_statistics:
+            logger.info(f'{s.call_site:<60} {s.calls:>7} {s.total_seconds:>10.3f} {s.max_seconds:>9.3f} '
+                        f'{s.rows:>9} {s.bytes:>12}')
+
+    @classmethod
+    def reset(cls):
+        with cls._lock:
+            cls.call_sites = {}
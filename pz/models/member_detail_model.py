@@ -48,6 +48,14 @@ class MemberDetailModel(ExcelCreationModelInterface):
     def get_values_in_pecking_order(self) -> list[Any]:
         return [self.__dict__[x] for x, _ in self.VARIABLE_MAP.items()]
 
+    def non_empty_values(self) -> dict[str, str | int]:
+        values: dict[str, str | int] = {}
+        for k in MemberDetailModel.VARIABLE_MAP:
+            if k != 'student_id' and k in self.__dict__ and self.__dict__[k] is not None and self.__dict__[k] != '':
+                v = self.__dict__[k]
+                values[k] = v.strip() if isinstance(v, str) else v
+        return values
+
     def generate_query(self, table_name: str) -> tuple[str, list[str | int]]:
         ignored_tuple = ('id', 'student_id')
         variables = []
@@ -0,0 +1,20 @@
+class MysqlSyncResult:
+    inserted: int
+    updated: int
+    deleted: int
+    unchanged: int
+    failed: int
+
+    def __init__(self):
+        self.inserted = 0
+        self.updated = 0
+        self.deleted = 0
+        self.unchanged = 0
+        self.failed = 0
+
+    def changes(self) -> int:
+        return self.inserted + self.updated + self.deleted
+
+    def __str__(self) -> str:
+        return (f'新增 {self.inserted} 筆, 更新 {self.updated} 筆, 刪除 {self.deleted} 筆, '
+                f'未變動 {self.unchanged} 筆, 失敗 {self.failed} 筆')
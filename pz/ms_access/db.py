@@ -1,8 +1,12 @@
-from typing import Any, Callable
+import re
+from typing import Any, Callable, Generator
 
 import pyodbc
 from loguru import logger
 
+from pz.db_statistics import PzDbStatistics
+from pz.ms_access.metadata_cache import PzAccessMetadataCache
+
 
 class PzAccessDbStructure:
     column_index: int
@@ -67,18 +71,35 @@ class PzAccessDbMySqlCreator:
 
 
 class PzDatabase:
+    SCHEMA_CHANGE = re.compile(r'^\s*(CREATE|ALTER|DROP)\b|\bINTO\s+\S+\s+FROM\b', re.IGNORECASE)
+    SELECT_ALL = re.compile(r'^\s*SELECT\s+\*\s+FROM\s+\[?(\w+)]?\s*$', re.IGNORECASE)
+
+    db_path: str
     conn_str: str
     connection: pyodbc.connect
     debug: bool = False
+    batch_size: int = 500
 
-    def __init__(self, db_path: str, debug: bool = False):
+    def __init__(self, db_path: str, debug: bool = False, batch_size: int | None = None):
+        self.db_path = db_path
         self.conn_str = f"DRIVER={{Microsoft Access Driver (*.mdb, *.accdb)}};DBQ={db_path}"
         self.connection = pyodbc.connect(self.conn_str)
         self.debug = debug
+        if batch_size is not None:
+            self.batch_size = max(1, batch_size)
 
     def __del__(self):
         # body of destructor
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+            logger.debug("Connection closed")
+
+    def close(self):
+        if self.connection is None:
+            return
         self.connection.close()
+        self.connection = None
         logger.debug("Connection closed")
 
     # def copy_table_structure(self, original_table_name: str, new_table_name: str):
@@ -105,45 +126,106 @@ class PzDatabase:
     #     print(column_types)
 
     def perform_update(self, query: str) -> int:
-        cursor = self.connection.cursor()
+        with PzDbStatistics.measure('access', 'perform_update', query) as measurement:
+            cursor = self.connection.cursor()
 
-        if self.debug:
-            logger.debug(f"Update Query: {query}")
+            if self.debug:
+                logger.debug(f"Update Query: {query}")
 
-        cursor.execute(query)
-        affected_rows = cursor.rowcount
-        if self.debug:
-            logger.debug('affected rows: ', affected_rows)
+            if self.SCHEMA_CHANGE.search(query):
+                PzAccessMetadataCache.invalidate(self.db_path)
 
-        self.connection.commit()
-        cursor.close()
-        return affected_rows
+            cursor.execute(query)
+            affected_rows = cursor.rowcount
+            measurement.affected(affected_rows)
+            if self.debug:
+                logger.debug('affected rows: ', affected_rows)
+
+            self.connection.commit()
+            cursor.close()
+            return affected_rows
 
-    def prepared_update(self, query: str, callback) -> int:
+    def prepared_update(self, query: str, callback, batch_size: int | None = None) -> int:
         logger.debug(f"Update Query (prepared statement): {query}")
 
-        cursor = self.connection.cursor()
-        counter = 0
+        if batch_size is None:
+            batch_size = self.batch_size
+
+        with PzDbStatistics.measure('access', 'prepared_update', query) as measurement:
+            cursor = self.connection.cursor()
+            cursor.fast_executemany = True
+            counter = 0
+
+            chunk: list[Any] = []
+            for supplier in callback:
+                params = supplier()
+                logger.trace(params)
+                chunk.append(params)
+                if len(chunk) >= batch_size:
+                    counter += self._execute_chunk(cursor, query, chunk)
+                    chunk = []
+
+            if len(chunk) > 0:
+                counter += self._execute_chunk(cursor, query, chunk)
+
+            logger.debug(f'{counter} record(s) updated successfully!')
+            cursor.close()
+            measurement.affected(counter)
+            return counter
+
+    def _execute_chunk(self, cursor: pyodbc.Cursor, query: str, chunk: list[Any]) -> int:
+        """
+            一次送出一批參數 (fast_executemany), 整批失敗時 rollback 再逐筆執行, 保留原本重複資料的處理方式
+        """
+        if len(chunk) > 1:
+            try:
+                cursor.executemany(query, chunk)
+                self.connection.commit()
+                return len(chunk)
+            except pyodbc.Error as e:
+                self.connection.rollback()
+                logger.debug(f'batch of {len(chunk)} failed, fallback to row by row: {e}')
 
-        for supplier in callback:
-            params = supplier()
-            logger.trace(params)
+        counter = 0
+        for params in chunk:
             try:
                 cursor.execute(query, params)
                 counter += 1
             except pyodbc.IntegrityError:
                 logger.warning("Integrity Error", params)
-            # print(params)
-
         self.connection.commit()
-
-        affected_rows = cursor.rowcount
-
-        logger.debug(f'{counter} record(s) updated successfully!')
-        cursor.close()
         return counter
 
+    def replace_table_rows(self, table_name: str, columns: list[str], rows: list[Any]) -> int:
+        """
+            在同一個交易中清空資料表並批次寫入全部資料, 任何錯誤都會整個 rollback
+        """
+        query = (f'INSERT INTO [{table_name}] ({",".join([f"[{x}]" for x in columns])}) '
+                 f'VALUES ({",".join(["?"] * len(columns))})')
+        logger.debug(f"Replace Query (prepared statement): {query}")
+
+        with PzDbStatistics.measure('access', 'replace_table_rows', query) as measurement:
+            cursor = self.connection.cursor()
+            cursor.fast_executemany = True
+            try:
+                cursor.execute(f'DELETE FROM [{table_name}]')
+                for i in range(0, len(rows), self.batch_size):
+                    cursor.executemany(query, rows[i:i + self.batch_size])
+                self.connection.commit()
+            except pyodbc.Error:
+                self.connection.rollback()
+                raise
+            finally:
+                cursor.close()
+
+            measurement.affected(len(rows))
+            return len(rows)
+
     def get_column_names(self, query: str) -> list[str]:
+        matched = self.SELECT_ALL.match(query)
+        if matched:
+            return [x.column_name for x in self.table_structure(matched.group(1))]
+
         cursor = self.connection.cursor()
         cursor.execute(query)
         des = [col[0] for col in cursor.description]
@@ -151,13 +233,37 @@ class PzDatabase:
         return des
 
     def query(self, query: str) -> tuple[list[str], list[pyodbc.Row]]:
-        cursor = self.connection.cursor()
-        cursor.execute(query)
-        column_names = [col[0] for col in cursor.description]
-        all_rows = cursor.fetchall()
-        cursor.close()
+        with PzDbStatistics.measure('access', 'query', query) as measurement:
+            cursor = self.connection.cursor()
+            cursor.execute(query)
+            column_names = [col[0] for col in cursor.description]
+            all_rows = cursor.fetchall()
+            cursor.close()
+            measurement.fetched(all_rows)
+
+            return column_names, all_rows
+
+    def stream_query(self, query: str, batch_size: int | None = None) -> Generator[
+            tuple[list[str], list[pyodbc.Row]], None, None]:
+        """
+            以 fetchmany 分批讀取, 每次產出 (欄位名稱, 該批資料)
+        """
+        if batch_size is None:
+            batch_size = self.batch_size
 
-        return column_names, all_rows
+        cursor = self.connection.cursor()
+        try:
+            with PzDbStatistics.measure('access', 'stream_query', query):
+                cursor.execute(query)
+            column_names = [col[0] for col in cursor.description]
+
+            while True:
+                rows = cursor.fetchmany(max(1, batch_size))
+                if len(rows) == 0:
+                    break
+                yield column_names, rows
+        finally:
+            cursor.close()
 
     def print_query(self, query: str):
         print(query)
@@ -191,19 +297,24 @@ class PzDatabase:
         print(column_names)
 
     def table_structure(self, table_name: str) -> list[PzAccessDbStructure]:
-        cursor = self.connection.cursor()
-        query = f"SELECT * FROM {table_name} WHERE 1=0"  # Returns no data, but allows to get column info
-        cursor.execute(query)
-
-        # Fetch the column information
-        # columns = [(column.column_name, column.type_name, column.column_size) for column in cursor.description]
+        columns = PzAccessMetadataCache.get(self.db_path, table_name)
+        if columns is None:
+            cursor = self.connection.cursor()
+            query = f"SELECT * FROM {table_name} WHERE 1=0"  # Returns no data, but allows to get column info
+            cursor.execute(query)
+
+            # Fetch the column information
+            # columns = [(column.column_name, column.type_name, column.column_size) for column in cursor.description]
+            columns = [[x[0], x[1].__name__ if isinstance(x[1], type) else x[1], *x[2:7]] for x in cursor.description]
+            cursor.close()
+            PzAccessMetadataCache.put(self.db_path, table_name, columns)
 
         # Print the table structure
         fields: list[PzAccessDbStructure] = []
         i = 0
-        for column in cursor.description:
+        for column in columns:
             i += 1
-            fields.append(PzAccessDbStructure(i, column))
+            fields.append(PzAccessDbStructure(i, tuple(column)))
         return fields
 
     def table_to_mysql_table_creation_query(
@@ -0,0 +1,279 @@
+from typing import Any
+
+from loguru import logger
+
+from pz.ms_access.op import PzDbOperation
+
+
+class PzMemberMergeReport:
+    """
+        合併結果中每個欄位的資料來源
+    """
+    provenance: dict[str, dict[str, int]]
+    record_provenance: dict[str, dict[str, str]]
+    steps: list[tuple[str, int]]
+
+    def __init__(self):
+        self.provenance = {}
+        self.record_provenance = {}
+        self.steps = []
+
+    def assigned(self, student_id: str, field: str, source: str):
+        record = self.record_provenance.setdefault(student_id, {})
+        previous = record.get(field)
+        if previous is not None:
+            self.provenance[field][previous] -= 1
+        record[field] = source
+        counter = self.provenance.setdefault(field, {})
+        counter[source] = counter.get(source, 0) + 1
+
+    def step(self, name: str, rows: int):
+        self.steps.append((name, rows))
+        logger.info(f'>>> {name}: {rows} 筆')
+
+    def log(self):
+        for field, counter in self.provenance.items():
+            sources = ', '.join([f'{k}: {v}' for k, v in counter.items() if v > 0])
+            logger.info(f'[{field}] {sources}')
+
+
+class PzMemberMergeEngine:
+    """
+        一次讀入 member001 ~ member007, 在記憶體中合併後用一個交易寫回目標資料表.
+        結果與 MemberMergingService 原本逐步執行的結果相同, 欄位的優先順序:
+          1. 學員基本資料: 002 > 005 > 001 > 007 (學員編號相同時先匯入的為準, 後面的來源不會覆蓋)
+          2. 法名: 匯入時的法名, 沒有法名時依 002 > 005 > 007 補上
+          3. 性別/身分證字號/出生日期: 依 003 > 004 > 006 以姓名+生日比對補上 (relax 時唯一姓名也補出生日期)
+          4. 緊急聯絡人: 目標沒有緊急聯絡人時用 001 的資料
+          5. 行動電話/住家電話: 依 001 > 005 > 006 比對, 原本格式正確的電話不會被覆蓋
+          6. 空白的身分證字號及法名設為 NULL
+    """
+    PID_SOURCES = [
+        ('003', '003 - 保險資料'),
+        ('004', '004 - 保險資料'),
+        ('006', '006 - 普高資料'),
+    ]
+    SOURCE_QUERIES = {
+        '001': 'SELECT * FROM member001',
+        '002': 'SELECT [學員編號], [姓名], [法名], [性別] FROM member002',
+        '003': 'SELECT [姓名], [性別], [身分證字號], [出生日期] FROM member003 WHERE [身分證字號] IS NOT NULL',
+        '004': 'SELECT [姓名], [性別], [身分證字號], [出生日期] FROM member004 WHERE [身分證字號] IS NOT NULL',
+        '005': 'SELECT [學員編號], [學員姓名] AS 姓名, [法名], [手機] AS 行動電話, [住宅] AS 住家電話 FROM member005',
+        '006': '''SELECT [身份証號], [學員編號], [姓名], [性別], [出生日], [行動] AS 行動電話, [住宅電] AS 住家電話,
+            [緊急連絡人] AS 緊急聯絡人 FROM member006''',
+        '007': 'SELECT [學員編號], [姓名], [法名], [性別] FROM member007',
+    }
+    CONTACT_COLUMNS = ['緊急聯絡人', '緊急聯絡人法名', '緊急聯絡人稱謂', '緊急聯絡人電話']
+
+    operation: PzDbOperation
+    sources: dict[str, tuple[list[str], list[list[Any]]]]
+    records: dict[str, dict[str, Any]]
+    columns: list[str]
+    report: PzMemberMergeReport
+
+    def __init__(self, operation: PzDbOperation):
+        self.operation = operation
+        self.sources = {}
+        self.records = {}
+        self.columns = []
+        self.report = PzMemberMergeReport()
+
+    def load_sources(self, max_workers: int = 4):
+        for name, (cols, rows) in self.operation.load_tables(self.SOURCE_QUERIES, max_workers).items():
+            self.sources[name] = (cols, PzDbOperation.row_to_list(rows))
+            logger.debug(f'member{name}: {len(rows)} 筆')
+
+    def _rows(self, name: str) -> list[dict[str, Any]]:
+        cols, rows = self.sources[name]
+        return [dict(zip(cols, row)) for row in rows]
+
+    def _assign(self, student_id: str, field: str, value: Any, source: str):
+        if field not in self.columns:
+            self.columns.append(field)
+        self.records[student_id][field] = value
+        self.report.assigned(student_id, field, source)
+
+    @staticmethod
+    def _same(a: Any, b: Any) -> bool:
+        return a is not None and b is not None and a == b
+
+    @staticmethod
+    def _blank(value: Any) -> bool:
+        return value is not None and len(str(value).strip(' ')) == 0
+
+    def _copy_members(self, name: str, come_from: str, fix_name: bool, accept=None):
+        counter = 0
+        for row in self._rows(name):
+            student_id = row['學員編號']
+            if student_id is None or student_id in self.records:
+                continue
+            if accept is not None and not accept(student_id):
+                continue
+
+            if fix_name:
+                row['姓名'] = '-' if row['姓名'] is None else PzDbOperation.fix_chinese_name(row['姓名'])
+            if row.get('資料來源') is None:
+                row['資料來源'] = come_from
+
+            self.records[student_id] = {}
+            for field, value in row.items():
+                self._assign(student_id, field, value, come_from)
+            counter += 1
+        self.report.step(f'匯入 ({come_from})', counter)
+
+    def _copy_dharma_name(self, name: str, come_from: str):
+        missing = set([k for k, v in self.records.items() if v.get('法名') is None])
+        counter = 0
+        for row in self._rows(name):
+            dharma_name = row['法名']
+            if row['學員編號'] in missing and dharma_name is not None and not self._blank(dharma_name):
+                self._assign(row['學員編號'], '法名', dharma_name, come_from)
+                counter += 1
+        self.report.step(f'複製法名 ({come_from})', counter)
+
+    def _target_index_by_name(self) -> dict[str, list[list[Any]]]:
+        target = {}
+        for student_id, record in self.records.items():
+            entry = [record.get('姓名'), record.get('性別'), record.get('身分證字號'), record.get('出生日期'),
+                     student_id]
+            target.setdefault(entry[0], []).append(entry)
+        return target
+
+    def _source_index_by_name(self, name: str) -> dict[str, list[list[Any]]]:
+        data = {}
+        for row in self._rows(name):
+            if name == '006':
+                if row['身份証號'] is None:
+                    continue
+                entry = [row['姓名'], row['性別'], PzDbOperation.sanitize_006_personal_id(row['身份証號']),
+                         PzDbOperation.normalize_birthday(row['出生日'])]
+            else:
+                entry = [row['姓名'], row['性別'], row['身分證字號'], row['出生日期']]
+            data.setdefault(entry[0], []).append(entry)
+        return data
+
+    def _merge_pid_and_birthday(self, name: str, note: str, relax: bool):
+        confidence, relax_entries, _, statistics = PzDbOperation.match_pid_and_birthday(
+            self._source_index_by_name(name), self._target_index_by_name(), note)
+
+        for gender, pid, remark, student_id in confidence:
+            self._assign(student_id, '性別', gender, note)
+            self._assign(student_id, '身分證字號', pid, note)
+            self._assign(student_id, '備註', remark, note)
+
+        if relax:
+            for gender, pid, birthday, remark, student_id in relax_entries:
+                self._assign(student_id, '性別', gender, note)
+                self._assign(student_id, '身分證字號', pid, note)
+                self._assign(student_id, '出生日期', birthday, note)
+                self._assign(student_id, '備註', remark, note)
+
+        self.report.step(f'身分證字號及生日 ({note}), {statistics}', len(confidence))
+
+    def _merge_contact_info_from_001(self):
+        missing = set([k for k, v in self.records.items() if v.get('緊急聯絡人') is None])
+        counter = 0
+        for row in self._rows('001'):
+            student_id = row['學員編號']
+            if student_id in missing and row['緊急聯絡人'] is not None and \
+                    self._same(row['姓名'], self.records[student_id].get('姓名')):
+                for field in self.CONTACT_COLUMNS:
+                    self._assign(student_id, field, row[field], '001 - 去年資料')
+                counter += 1
+        self.report.step('聯絡人資料 (001 - 去年資料)', counter)
+
+    def _merge_personal_phone(self, joined: list[tuple[dict[str, Any], dict[str, Any]]], come_from: str):
+        """
+            joined: (來源, 目標) 配對, 先用原本的目標資料算出所有更新, 再依序寫回來源的學員編號
+        """
+        params = []
+        for row, record in joined:
+            phones, modified = PzDbOperation.merge_personal_phone_numbers(
+                [row['行動電話'], row['住家電話'], record.get('行動電話'), record.get('住家電話')])
+            if modified:
+                params.append((phones, row['學員編號']))
+
+        for phones, student_id in params:
+            if student_id in self.records:
+                self._assign(student_id, '行動電話', phones[0], come_from)
+                self._assign(student_id, '住家電話', phones[1], come_from)
+        self.report.step(f'個人電話 ({come_from}), 比對 {len(joined)} 筆', len(params))
+
+    def _joined_by_student_id(self, name: str) -> list[tuple[dict[str, Any], dict[str, Any]]]:
+        joined = []
+        for row in self._rows(name):
+            record = self.records.get(row['學員編號'])
+            if record is not None and self._same(row['姓名'], record.get('姓名')):
+                joined.append((row, record))
+        return joined
+
+    def _joined_by_personal_id(self, name: str) -> list[tuple[dict[str, Any], dict[str, Any]]]:
+        by_pid = {}
+        for record in self.records.values():
+            if record.get('身分證字號') is not None:
+                by_pid.setdefault(record['身分證字號'], []).append(record)
+
+        joined = []
+        for row in self._rows(name):
+            for record in by_pid.get(row['身份証號'], []):
+                if self._same(row['姓名'], record.get('姓名')):
+                    joined.append((row, record))
+        return joined
+
+    def _clear_blank_pid_and_dharma_name(self):
+        counter = 0
+        for student_id, record in self.records.items():
+            for field in ['身分證字號', '法名']:
+                if self._blank(record.get(field)):
+                    self._assign(student_id, field, None, '清除空白')
+                    counter += 1
+        self.report.step('清除空白的身分證字號及法名', counter)
+
+    def merge(self, relax: bool = True) -> PzMemberMergeReport:
+        if len(self.sources) == 0:
+            self.load_sources()
+
+        self.records = {}
+        self.columns = []
+        self.report = PzMemberMergeReport()
+
+        self._copy_members('002', '002 - 上課記錄', True)
+        self._copy_members('005', '005 - 112-2 禪修班', True,
+                           lambda x: x not in ('缺生日', '沒有生日', '缺性別') and len(str(x)) == 9)
+        self._copy_members('001', '001 - 去年資料', False)
+        self._copy_members('007', '007 - 報到系統', True)
+
+        self._copy_dharma_name('002', '002 - 上課記錄')
+        self._copy_dharma_name('005', '005 - 112-2 禪修班')
+        self._copy_dharma_name('007', '007 - 報到系統')
+
+        for name, note in self.PID_SOURCES:
+            self._merge_pid_and_birthday(name, note, relax)
+
+        self._merge_contact_info_from_001()
+
+        self._merge_personal_phone(self._joined_by_student_id('001'), '001 - 去年資料')
+        self._merge_personal_phone(self._joined_by_student_id('005'), '005 - 112-2 禪修班')
+
+        # 006 的聯絡人資料目前只做統計, 不寫回
+        contacts = [x for x, y in self._joined_by_student_id('006')
+                    if y.get('緊急聯絡人') is None and x['緊急聯絡人'] is not None]
+        self.report.step('聯絡人資料 (006 - 普高資料), 未寫回', len(contacts))
+
+        self._merge_personal_phone(self._joined_by_personal_id('006'), '006 - 普高資料')
+
+        self._clear_blank_pid_and_dharma_name()
+
+        return self.report
+
+    def write(self) -> int:
+        rows = [tuple([record.get(x) for x in self.columns]) for record in self.records.values()]
+        counter = self.operation.pzDb.replace_table_rows(self.operation.target_table, self.columns, rows)
+        logger.info(f'>>> {counter} 筆資料寫入 {self.operation.target_table}')
+        return counter
+
+    def run(self, relax: bool = True) -> PzMemberMergeReport:
+        self.merge(relax)
+        self.write()
+        self.report.log()
+        return self.report
@@ -0,0 +1,121 @@
+import json
+import os
+import threading
+from typing import Any
+
+from loguru import logger
+
+
+class PzAccessMetadataCache:
+    """
+        Access 資料表欄位資訊 (名稱, 型別, 長度) 的快取, key 為 (資料庫檔案, 資料表).
+        執行期間只在變更資料表結構 (DDL) 時失效, 新增/修改資料不影響快取.
+        設定 cache_file 後會存到檔案並記錄存檔時的檔案修改時間; 下次執行第一次使用時比對一次,
+        不同表示檔案在程式外被修改過, 整個資料庫的快取失效
+    """
+    cache_file: str | None = None
+    databases: dict[str, dict[str, Any]] = {}
+    _loaded: bool = False
+    _verified: set[str] = set()
+    _dirty: bool = False
+    _lock = threading.Lock()
+
+    @classmethod
+    def configure(cls, cache_file: str | None):
+        with cls._lock:
+            cls.cache_file = cache_file
+            cls.databases = {}
+            cls._loaded = False
+            cls._verified = set()
+            cls._dirty = False
+
+    @staticmethod
+    def _key(db_path: str) -> str:
+        return os.path.normcase(os.path.abspath(db_path))
+
+    @staticmethod
+    def modified_time(db_path: str) -> float | None:
+        try:
+            return os.path.getmtime(db_path)
+        except OSError:
+            return None
+
+    @classmethod
+    def _load(cls):
+        if cls._loaded:
+            return
+        cls._loaded = True
+        if cls.cache_file is None or not os.path.exists(cls.cache_file):
+            return
+        try:
+            with open(cls.cache_file, 'r', encoding='utf-8') as f:
+                cls.databases = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f'{cls.cache_file}: {e}')
+            cls.databases = {}
+
+    @classmethod
+    def _entry(cls, db_path: str) -> dict[str, Any]:
+        """
+            取得資料庫的快取; 每個資料庫只在第一次使用時比對檔案修改時間
+        """
+        cls._load()
+        key = cls._key(db_path)
+        entry = cls.databases.get(key)
+        if key not in cls._verified:
+            cls._verified.add(key)
+            if entry is not None and entry.get('mtime') != cls.modified_time(db_path):
+                logger.debug(f'{db_path} 已在程式外修改, 欄位資訊快取失效')
+                entry = None
+        if entry is None:
+            entry = {'mtime': None, 'tables': {}}
+            cls.databases[key] = entry
+        return entry
+
+    @classmethod
+    def get(cls, db_path: str, table_name: str) -> list[list[Any]] | None:
+        with cls._lock:
+            return cls._entry(db_path)['tables'].get(table_name.lower())
+
+    @classmethod
+    def put(cls, db_path: str, table_name: str, columns: list[list[Any]]):
+        with cls._lock:
+            cls._entry(db_path)['tables'][table_name.lower()] = columns
+            cls._dirty = True
+
+    @classmethod
+    def invalidate(cls, db_path: str):
+        """
+            變更資料表結構後呼叫, 清除該資料庫所有資料表的欄位資訊
+        """
+        with cls._lock:
+            entry = cls._entry(db_path)
+            if len(entry['tables']) > 0:
+                entry['tables'] = {}
+                cls._dirty = True
+
+    @classmethod
+    def save(cls):
+        """
+            存檔時記錄每個資料庫目前的修改時間 (包含這次執行寫入資料造成的改變)
+        """
+        with cls._lock:
+            if cls.cache_file is None or not cls._loaded:
+                return
+            for key, entry in cls.databases.items():
+                if key in cls._verified:
+                    mtime = cls.modified_time(key)
+                    if entry['mtime'] != mtime:
+                        entry['mtime'] = mtime
+                        cls._dirty = True
+            if not cls._dirty:
+                return
+            folder = os.path.dirname(cls.cache_file)
+            if folder != '':
+                os.makedirs(folder, exist_ok=True)
+            temp_file = f'{cls.cache_file}.tmp'
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump(cls.databases, f, ensure_ascii=False)
+            os.replace(temp_file, cls.cache_file)
+            cls._dirty = False
+            logger.debug(f'metadata cache saved: {cls.cache_file}')
@@ -0,0 +1,126 @@
+from typing import Any, Iterable
+
+
+class PzNameJoinStatistics:
+    source_rows: int
+    target_rows: int
+    matched: int
+    already_filled: int
+    unique_name: int
+    ambiguous: int
+    conflicts: int
+    unmatched: int
+
+    def __init__(self):
+        self.source_rows = 0
+        self.target_rows = 0
+        self.matched = 0
+        self.already_filled = 0
+        self.unique_name = 0
+        self.ambiguous = 0
+        self.conflicts = 0
+        self.unmatched = 0
+
+    def __str__(self) -> str:
+        return (f'來源 {self.source_rows} 筆, 目標 {self.target_rows} 筆, 姓名+生日相符 {self.matched} 筆, '
+                f'已有身分證字號 {self.already_filled} 筆, 唯一姓名 {self.unique_name} 筆, 多筆 {self.ambiguous} 筆, '
+                f'性別不符 {self.conflicts} 筆, 無相符 {self.unmatched} 筆')
+
+
+class PzNameJoinResult:
+    matched: list[tuple[list[Any], list[Any]]]
+    unique_name: list[tuple[list[Any], list[Any]]]
+    ambiguous: list[tuple[list[Any], list[Any], list[list[Any]]]]
+    conflicts: list[tuple[list[Any], list[Any]]]
+    unmatched: list[list[Any]]
+    statistics: PzNameJoinStatistics
+
+    def __init__(self):
+        self.matched = []
+        self.unique_name = []
+        self.ambiguous = []
+        self.conflicts = []
+        self.unmatched = []
+        self.statistics = PzNameJoinStatistics()
+
+
+class PzNameBirthdayJoin:
+    """
+        以 (姓名, 性別, 生日) 做 hash join. 資料格式為 [姓名, 性別, 身分證字號, 出生日期, ...]
+        目標資料只建一次索引, 每筆來源資料只查表一次.
+        性別缺值時視為相容, 所以索引的 key 是 (姓名, 生日), 性別在查到後比對.
+        姓名不做任何正規化 (與原本逐筆比對相同), 只差空白的姓名視為不同的人
+    """
+    NAME = 0
+    GENDER = 1
+    PID = 2
+    BIRTHDAY = 3
+
+    by_name: dict[Any, list[list[Any]]]
+    by_name_and_birthday: dict[tuple[Any, Any], list[list[Any]]]
+    target_rows: int
+
+    def __init__(self, targets: Iterable[list[Any]]):
+        self.by_name = {}
+        self.by_name_and_birthday = {}
+        self.target_rows = 0
+
+        for target in targets:
+            key = target[self.NAME]
+            self.by_name.setdefault(key, []).append(target)
+            if target[self.BIRTHDAY] is not None:
+                self.by_name_and_birthday.setdefault((key, target[self.BIRTHDAY]), []).append(target)
+            self.target_rows += 1
+
+    def _gender_conflict(self, entry: list[Any], target: list[Any]) -> bool:
+        return target[self.GENDER] is not None and target[self.GENDER] != entry[self.GENDER]
+
+    def join(self, sources: Iterable[list[Any]]) -> PzNameJoinResult:
+        result = PzNameJoinResult()
+        statistics = result.statistics
+        statistics.target_rows = self.target_rows
+
+        sources_by_name: dict[Any, list[list[Any]]] = {}
+        for entry in sources:
+            sources_by_name.setdefault(entry[self.NAME], []).append(entry)
+            statistics.source_rows += 1
+
+        for key, entries in sources_by_name.items():
+            targets = self.by_name.get(key)
+            if targets is None:
+                result.unmatched.extend(entries)
+                continue
+
+            for entry in entries:
+                found = False
+
+                if entry[self.BIRTHDAY] is not None:
+                    for target in self.by_name_and_birthday.get((key, entry[self.BIRTHDAY]), []):
+                        found = True
+                        if self._gender_conflict(entry, target):
+                            result.conflicts.append((entry, target))
+                        elif target[self.PID] is not None:
+                            statistics.already_filled += 1
+                        else:
+                            result.matched.append((entry, target))
+
+                    # 目標只有一筆同名且缺出生日期
+                    if len(targets) == 1 and targets[0][self.BIRTHDAY] is None:
+                        found = True
+                        target = targets[0]
+                        if self._gender_conflict(entry, target):
+                            result.conflicts.append((entry, target))
+                        elif len(entries) == 1:
+                            result.unique_name.append((entry, target))
+                        else:
+                            result.ambiguous.append((entry, target, entries))
+
+                if not found:
+                    result.unmatched.append(entry)
+
+        statistics.matched = len(result.matched)
+        statistics.unique_name = len(result.unique_name)
+        statistics.ambiguous = len(result.ambiguous)
+        statistics.conflicts = len(result.conflicts)
+        statistics.unmatched = len(result.unmatched)
+        return result
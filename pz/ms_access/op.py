@@ -1,19 +1,55 @@
 import re
-from typing import List, Any, Callable
+from typing import List, Any, Callable, Generator
 
 import pyodbc
 
 from pz.ms_access.db import PzDatabase
+from pz.ms_access.name_join import PzNameBirthdayJoin, PzNameJoinStatistics
+from pz.ms_access.parallel_loader import PzAccessParallelLoader
 from pz.utils import personal_id_verification, normalize_phone_number
 
 
 class PzDbOperation:
+    QUERY_003 = 'SELECT 姓名, 性別, 身分證字號, 出生日期 FROM member003 WHERE 身分證字號 IS NOT NULL'
+    QUERY_004 = 'SELECT 姓名, 性別, 身分證字號, 出生日期 FROM member004 WHERE 身分證字號 IS NOT NULL'
+    QUERY_006 = 'SELECT 姓名, 性別, 身份証號 AS 身分證字號, 出生日 AS 出生日期 FROM member006 WHERE 身份証號 IS NOT NULL'
+
     pzDb: PzDatabase
+    db_path: str
     target_table: str
-
-    def __init__(self, db_path: str, target_table: str):
-        self.pzDb = PzDatabase(db_path)
+    prefetched: dict[str, tuple[list[str], list[pyodbc.Row]]]
+    database_factory: Callable[[], PzDatabase]
+
+    def __init__(self, db_path: str, target_table: str, database_factory: Callable[[], PzDatabase] | None = None):
+        """
+        database_factory: 建立資料庫連線的函式, 預設為 Access (PzDatabase), 可以換成 PzSqliteDatabase 離線執行
+        """
+        self.db_path = db_path
         self.target_table = target_table
+        self.database_factory = database_factory if database_factory is not None else lambda: PzDatabase(db_path)
+        self.pzDb = self.database_factory()
+        self.prefetched = {}
+
+    def close(self):
+        self.pzDb.close()
+
+    def load_tables(self, queries: dict[str, str], max_workers: int = 4) -> \
+            dict[str, tuple[list[str], list[pyodbc.Row]]]:
+        """
+        用獨立的連線同時讀取多個來源資料表 (不可包含會被修改的目標資料表)
+        """
+        return PzAccessParallelLoader(self.database_factory, max_workers).load(queries)
+
+    def prefetch(self, queries: list[str], max_workers: int = 4):
+        """
+        先平行讀取之後會用到的來源查詢, 查詢時直接取用 (每個結果只用一次)
+        """
+        self.prefetched.update(self.load_tables(dict([(x, x) for x in queries]), max_workers))
+
+    def _query(self, query: str) -> tuple[list[str], list[pyodbc.Row]]:
+        if query in self.prefetched:
+            return self.prefetched.pop(query)
+        return self.pzDb.query(query)
 
     @staticmethod
     def fix_chinese_name(name: str) -> str:
@@ -188,7 +224,7 @@ class PzDbOperation:
 
     def index_by_first_column(self, query: str, manipulator: Callable[[list[str]], list[str]] | None) -> tuple[
         list[str], dict[str, list[list[Any]]]]:
-        cols, results = self.pzDb.query(query)
+        cols, results = self._query(query)
         result_list = PzDbOperation.row_to_list(results)
 
         if manipulator is not None and callable(manipulator):
@@ -210,16 +246,14 @@ class PzDbOperation:
         return cols, data
 
     def read_and_index_by_name_from_003(self) -> tuple[list[str], dict[str, list[list[Any]]]]:
-        return self.index_by_first_column(
-            'SELECT 姓名, 性別, 身分證字號, 出生日期 FROM member003 WHERE 身分證字號 IS NOT NULL', None)
+        return self.index_by_first_column(self.QUERY_003, None)
 
     def read_and_index_by_name_from_004(self) -> tuple[list[str], dict[str, list[list[Any]]]]:
-        return self.index_by_first_column(
-            'SELECT 姓名, 性別, 身分證字號, 出生日期 FROM member004 WHERE 身分證字號 IS NOT NULL', None)
+        return self.index_by_first_column(self.QUERY_004, None)
 
     def read_and_index_by_name_from_006(self) -> tuple[list[str], dict[str, list[list[Any]]]]:
         return self.index_by_first_column(
-            'SELECT 姓名, 性別, 身份証號 AS 身分證字號, 出生日 AS 出生日期 FROM member006 WHERE 身份証號 IS NOT NULL',
+            self.QUERY_006,
             lambda x: [x[0], x[1], self.sanitize_006_personal_id(x[2]), self.normalize_birthday(x[3])])
 
     def read_data_from_006(self):
@@ -269,50 +303,45 @@ class PzDbOperation:
     def read_target_db(self, column_names: list[str]) -> tuple[list[str], dict[str, list[list[Any]]]]:
         return self.index_by_first_column(f'SELECT {",".join(column_names)} FROM {self.target_table}', None)
 
+    @staticmethod
+    def match_pid_and_birthday(data: dict[str, list[list[Any]]], target: dict[str, list[list[Any]]], note: str) -> \
+            tuple[list[tuple], list[tuple], list[tuple], PzNameJoinStatistics]:
+        """
+        以姓名比對來源與目標資料 (欄位: 姓名, 性別, 身分證字號, 出生日期 [, 學員編號]),
+        回傳 (姓名+生日相符, 唯一姓名, 多筆相符) 三組更新參數及比對統計
+        """
+        joiner = PzNameBirthdayJoin([x for entries in target.values() for x in entries])
+        result = joiner.join([x for entries in data.values() for x in entries])
+
+        for entry, target_entry in result.conflicts:
+            print("Warning! ", entry, target_entry)
+
+        confidence = [(entry[1], entry[2], f'{note} (姓名+生日)', target_entry[4])
+                      for entry, target_entry in result.matched]
+        relax_entries = [(entry[1], entry[2], entry[3], f'{note} (唯一姓名)', target_entry[4])
+                         for entry, target_entry in result.unique_name]
+
+        multiple_match = []
+        for entry, target_entry, candidates in result.ambiguous:
+            print("Multiple Match: ", entry, target_entry)
+            multiple_ids = ", ".join([m[2] if m[2] is not None else '' for m in candidates])
+            multiple_match.append((entry[1], multiple_ids, target_entry[4]))
+
+        return confidence, relax_entries, multiple_match, result.statistics
+
     def compare_update_pid_and_birthday(self, write_back: bool, relax: bool, note: str, callback):
         print(f'[*] 合併身分證字號及生日資訊 (來源: {note})')
         cols, data = callback()
         cols.append("學員編號")
         _, target = self.read_target_db(cols)
 
-        confidence = []
-        relax_entries = []
-        # possible = []
-        multiple_match = []
-
-        for e in data:
-            if e in target:
-                for entry in data[e]:
-                    for target_entry in target[e]:
-                        if target_entry[3] is not None and target_entry[3] == entry[3]:  # 出生日期相符
-                            if target_entry[1] is not None and target_entry[1] != entry[1]:
-                                print("Warning! ", entry, target_entry)
-                            elif target_entry[2] is not None:
-                                pass
-                            else:
-                                # print(entry)
-                                confidence.append((entry[1], entry[2], f'{note} (姓名+生日)', target_entry[4]))
-                        elif target_entry[3] is None and entry[3] is not None:  # 缺出生日期資訊
-                            if len(target[e]) == 1 and len(data[e]) == 1:
-                                if target_entry[1] is not None and target_entry[1] != entry[1]:
-                                    print("Warning! ", entry, target_entry)
-                                else:
-                                    # print("Unique Match: ", entry, target_entry)
-                                    # possible.append((entry[1], entry[2], entry[3], f'{note} (唯一姓名)', target_entry[4]))
-                                    relax_entries.append(
-                                        (entry[1], entry[2], entry[3], f'{note} (唯一姓名)', target_entry[4]))
-                            elif len(target[e]) == 1:
-                                if target_entry[1] is not None and target_entry[1] != entry[1]:
-                                    print("Warning! ", entry, target_entry)
-                                else:
-                                    print("Multiple Match: ", entry, target_entry)
-                                    multiple_ids = ", ".join([m[2] if m[2] is not None else '' for m in data[e]])
-                                    multiple_match.append((entry[1], multiple_ids, target_entry[4]))
+        confidence, relax_entries, multiple_match, statistics = self.match_pid_and_birthday(data, target, note)
 
         # print(confidence)
         print(f'>>> {len(confidence)} confidence record(s) found ({note})')
         print(f'>>> {len(relax_entries)} relax record(s) found ({note})')
         print(f'>>> {len(multiple_match)} multiple matching record(s) found ({note})')
+        print(f'>>> {statistics}')
 
         if write_back:
             if len(confidence) > 0:
@@ -355,48 +384,58 @@ class PzDbOperation:
         print(f'>>> {len(results)} records updated')
         print()
 
-    def compare_and_update_personal_phone_number(self, query: str):
-        cols, results = self.pzDb.query(query)
+    @staticmethod
+    def merge_personal_phone_numbers(phones: list[str | None]) -> tuple[tuple[str | None, str | None], bool]:
+        """
+        phones: (新行動電話, 新住家電話, 原行動電話, 原住家電話), 回傳合併後的 (行動電話, 住家電話) 及是否有變動
+        """
+        result = [None, None, None, None]
+        valid = [False, False, False, False]
+        for i in range(4):
+            result[i], valid[i] = normalize_phone_number(phones[i])
 
-        cols = cols[:len(cols) - 1]
+        param = [None, None]
+        modified = False
 
-        params = []
-        valid = [False, False, False, False]
-        for result in results:
-            for i in range(4):
-                result[i], valid[i] = normalize_phone_number(result[i])
-
-            param = [None, None, result[4]]
-            modified = False
-
-            if result[0] is not None:
-                if result[2] is not None:
-                    if valid[2]:
-                        param[0] = result[2]
-                    elif valid[0]:
-                        param[0] = result[0]
-                        modified = True
-                else:
+        if result[0] is not None:
+            if result[2] is not None:
+                if valid[2]:
+                    param[0] = result[2]
+                elif valid[0]:
                     param[0] = result[0]
                     modified = True
             else:
-                param[0] = result[2]
-
-            if result[1] is not None:
-                if result[3] is not None:
-                    if valid[3]:
-                        param[1] = result[3]
-                    elif valid[1]:
-                        param[1] = result[1]
-                        modified = True
-                else:
+                param[0] = result[0]
+                modified = True
+        else:
+            param[0] = result[2]
+
+        if result[1] is not None:
+            if result[3] is not None:
+                if valid[3]:
+                    param[1] = result[3]
+                elif valid[1]:
                     param[1] = result[1]
                     modified = True
             else:
-                param[1] = result[3]
+                param[1] = result[1]
+                modified = True
+        else:
+            param[1] = result[3]
+
+        return (param[0], param[1]), modified
+
+    def compare_and_update_personal_phone_number(self, query: str):
+        cols, results = self.pzDb.query(query)
+
+        cols = cols[:len(cols) - 1]
+
+        params = []
+        for result in results:
+            phones, modified = self.merge_personal_phone_numbers(result[:4])
 
             if modified:
-                params.append(tuple(param))
+                params.append((phones[0], phones[1], result[4]))
 
             # value = 0
             # value |= 1 if result[0] is not None else 0  # new value store in 0 and 1
@@ -600,5 +639,9 @@ class PzDbOperation:
     def read_all_from_target(self) -> tuple[list[str], list[pyodbc.Row]]:
         return self.pzDb.query(f'SELECT * FROM {self.target_table}')
 
+    def stream_all_from_target(self, batch_size: int | None = None) -> Generator[
+            tuple[list[str], list[pyodbc.Row]], None, None]:
+        return self.pzDb.stream_query(f'SELECT * FROM {self.target_table}', batch_size)
+
     def read_all_from_table(self, table: str) -> tuple[list[str], list[pyodbc.Row]]:
         return self.pzDb.query(f'SELECT * FROM {table}')
@@ -0,0 +1,52 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+import pyodbc
+from loguru import logger
+
+from pz.ms_access.db import PzDatabase
+
+
+class PzAccessParallelLoader:
+    """
+        同時讀取多個互不相關的資料表, 每個執行緒使用自己的連線, 總時間只取決於最慢的那個資料表
+    """
+    connect: Callable[[], PzDatabase]
+    max_workers: int
+
+    def __init__(self, connect: Callable[[], PzDatabase], max_workers: int = 4):
+        self.connect = connect
+        self.max_workers = max(1, max_workers)
+
+    def load(self, queries: dict[str, str]) -> dict[str, tuple[list[str], list[pyodbc.Row]]]:
+        local = threading.local()
+        databases: list[PzDatabase] = []
+        lock = threading.Lock()
+
+        def fetch(name: str, query: str) -> tuple[list[str], list[pyodbc.Row]]:
+            if not hasattr(local, 'database'):
+                local.database = self.connect()
+                with lock:
+                    databases.append(local.database)
+
+            start = time.perf_counter()
+            cols, rows = local.database.query(query)
+            logger.debug(f'{name}: {len(rows)} 筆 ({time.perf_counter() - start:.3f}s)')
+            return cols, rows
+
+        if len(queries) == 0:
+            return {}
+
+        start = time.perf_counter()
+        workers = min(self.max_workers, len(queries))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='access-loader') as executor:
+            futures = dict([(name, executor.submit(fetch, name, query)) for name, query in queries.items()])
+            results = dict([(name, future.result()) for name, future in futures.items()])
+
+        for database in databases:
+            database.close()
+        databases.clear()
+        logger.debug(f'{len(queries)} 個資料表讀取完成 ({workers} 個連線, {time.perf_counter() - start:.3f}s)')
+        return results
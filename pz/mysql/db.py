@@ -1,35 +1,68 @@
-from typing import Any
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Any, Generator, Iterable
 
-import mysql.connector
 from loguru import logger
 from mysql.connector.abstracts import MySQLConnectionAbstract
-from mysql.connector.pooling import PooledMySQLConnection
 
 from pz.config import PzProjectMySqlConfig
+from pz.db_statistics import PzDbStatistics
+from pz.mysql.pool import PzMysqlConnectionPool
+
+
+class PzMysqlUpdateResult:
+    succeeded: int
+    failed: int
+    affected_rows: int
+
+    def __init__(self):
+        self.succeeded = 0
+        self.failed = 0
+        self.affected_rows = 0
+
+    def __str__(self) -> str:
+        return f'succeeded: {self.succeeded}, failed: {self.failed}, affected rows: {self.affected_rows}'
 
 
 class PzMysqlDatabase:
-    connection: PooledMySQLConnection | MySQLConnectionAbstract
+    pool: PzMysqlConnectionPool
+    batch_size: int
     debug: bool = False
+    # 每個執行緒各自的 session 連線
+    _local: threading.local
 
     def __init__(self, cfg: PzProjectMySqlConfig, debug: bool = False):
         self.debug = debug
+        self.pool = PzMysqlConnectionPool.shared(cfg)
+        self.batch_size = cfg.batch_size
+        self._local = threading.local()
 
-        db_config = {
-            'user': cfg.user,
-            'password': cfg.password,
-            'host': cfg.host,
-            'database': cfg.database,
-            'raise_on_warnings': True
-        }
+    @contextmanager
+    def session(self) -> Generator[MySQLConnectionAbstract, None, None]:
+        """
+            從連線池取出一條連線, 區塊內的操作都使用同一條連線, 結束後歸還.
+            同一個執行緒內巢狀呼叫時沿用外層的連線, 不同執行緒各自取得連線
+        """
+        current = getattr(self._local, 'connection', None)
+        if current is not None:
+            yield current
+            return
 
-        self.connection = mysql.connector.connect(**db_config)
-
-    def __del__(self):
-        # body of destructor
-        self.connection.close()
-        if self.debug:
-            print("Connection closed")
+        connection = self.pool.checkout()
+        self._local.connection = connection
+        error = None
+        try:
+            yield connection
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self._local.connection = None
+            self.pool.checkin(connection, error)
+            if self.debug:
+                print("Connection returned")
 
     # def copy_table_structure(self, original_table_name: str, new_table_name: str):
     #     # query = f"CREATE TABLE {new_table_name} LIKE {original_table_name}"
@@ -55,66 +88,172 @@ class PzMysqlDatabase:
     #     print(column_types)
 
     def perform_update(self, query: str) -> int:
-        cursor = self.connection.cursor()
+        with self.session() as connection, PzDbStatistics.measure('mysql', 'perform_update', query) as measurement:
+            cursor = connection.cursor()
 
-        if self.debug:
-            print(f"Update Query: {query}")
+            if self.debug:
+                print(f"Update Query: {query}")
 
-        cursor.execute(query)
-        affected_rows = cursor.rowcount
-        if self.debug:
-            print('affected rows: ', affected_rows)
+            cursor.execute(query)
+            affected_rows = cursor.rowcount
+            measurement.affected(affected_rows)
+            if self.debug:
+                print('affected rows: ', affected_rows)
 
-        self.connection.commit()
-        cursor.close()
-        return affected_rows
+            connection.commit()
+            cursor.close()
+            return affected_rows
+
+    def prepared_update(self, query: str, callback, batch_size: int | None = None) -> int:
+        return self.batch_update(query, callback, batch_size).affected_rows
 
-    def prepared_update(self, query: str, callback) -> int:
+    def batch_update(self, query: str, callback, batch_size: int | None = None) -> 'PzMysqlUpdateResult':
+        """
+            以 executemany 分批寫入, 每批 commit 一次; 整批失敗時改為逐筆寫入, 記錄錯誤的資料後繼續
+        """
         if self.debug:
             print(f"Update Query (prepared statement): {query}")
 
-        cursor = self.connection.cursor()
-        counter = 0
+        if batch_size is None:
+            batch_size = self.batch_size
+        batch_size = max(1, batch_size)
+
+        result = PzMysqlUpdateResult()
+
+        with self.session() as connection, PzDbStatistics.measure('mysql', 'prepared_update', query) as measurement:
+            cursor = connection.cursor()
+            chunk = []
+
+            for supplier in callback:
+                chunk.append(supplier())
+                if len(chunk) >= batch_size:
+                    self._execute_chunk(connection, cursor, query, chunk, result)
+                    chunk = []
+
+            if len(chunk) > 0:
+                self._execute_chunk(connection, cursor, query, chunk, result)
+
+            if self.debug:
+                logger.debug(f'{result.succeeded} record(s) updated successfully! ({result.failed} failed)')
+            cursor.close()
+            measurement.affected(result.affected_rows)
+            return result
+
+    @staticmethod
+    def _execute_chunk(connection: MySQLConnectionAbstract, cursor, query: str, chunk: list,
+                       result: 'PzMysqlUpdateResult'):
+        if len(chunk) > 1:
+            try:
+                cursor.executemany(query, chunk)
+                connection.commit()
+                result.succeeded += len(chunk)
+                result.affected_rows += max(cursor.rowcount, 0)
+                return
+            except Exception as e:
+                connection.rollback()
+                logger.debug(f'batch of {len(chunk)} failed, fallback to row by row: {e}')
 
-        for supplier in callback:
-            params = supplier()
+        for params in chunk:
             # print(params)
             try:
                 cursor.execute(query, params)
-                counter += 1
+                result.succeeded += 1
+                result.affected_rows += max(cursor.rowcount, 0)
             except Exception as e:
+                result.failed += 1
                 logger.warning(f'{str(e)} : {params}')
                 print(e, params)
-            # print(params)
+        connection.commit()
 
-        self.connection.commit()
+    @staticmethod
+    def _tsv_value(value: Any) -> str:
+        if value is None:
+            return '\\N'
+        if isinstance(value, bool):
+            value = int(value)
+        return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+                .replace('\n', '\\n').replace('\r', '\\r').replace('\0', '\\0'))
 
-        affected_rows = cursor.rowcount
+    def load_data(self, table_name: str, columns: list[str], rows: Iterable[tuple]) -> int:
+        """
+            把資料寫成暫存的 TSV 檔, 再用 LOAD DATA LOCAL INFILE 一次匯入
+        """
+        fd, tsv_file = tempfile.mkstemp(prefix=f'{table_name}-', suffix='.tsv',
+                                        dir=PzMysqlConnectionPool.local_infile_folder())
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8', newline='\n') as f:
+                for row in rows:
+                    f.write('\t'.join([self._tsv_value(v) for v in row]))
+                    f.write('\n')
 
-        if self.debug:
-            logger.debug(f'{counter} record(s) updated successfully!')
-        cursor.close()
-        return affected_rows
+            file_path = tsv_file.replace('\\', '/')
+            query = (f"LOAD DATA LOCAL INFILE '{file_path}' INTO TABLE `{table_name}` CHARACTER SET utf8mb4 "
+                     f"FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' LINES TERMINATED BY '\\n' "
+                     f"({','.join(columns)})")
+            return self.perform_update(query)
+        finally:
+            os.remove(tsv_file)
 
     def get_column_names(self, query: str) -> list[str]:
-        cursor = self.connection.cursor()
-        cursor.execute(query)
-        des = [col[0] for col in cursor.description]
-        cursor.close()
-        return des
+        with self.session() as connection:
+            cursor = connection.cursor()
+            cursor.execute(query)
+            des = [col[0] for col in cursor.description]
+            cursor.fetchall()
+            cursor.close()
+            return des
 
     def query(self, query: str) -> tuple[list[str], list[Any]]:
-        cursor = self.connection.cursor()
-        cursor.execute(query)
-        column_names = [col[0] for col in cursor.description]
-        all_rows = cursor.fetchall()
-        cursor.close()
+        with self.session() as connection, PzDbStatistics.measure('mysql', 'query', query) as measurement:
+            cursor = connection.cursor()
+            cursor.execute(query)
+            column_names = [col[0] for col in cursor.description]
+            all_rows = cursor.fetchall()
+            cursor.close()
+            measurement.fetched(all_rows)
+
+            return column_names, all_rows
+
+    def stream_query(self, query: str, batch_size: int | None = None) -> Generator[
+            tuple[list[str], list[Any]], None, None]:
+        """
+            以 unbuffered cursor 分批讀取 (fetchmany), 每次產出 (欄位名稱, 該批資料)
+            讀取期間獨佔一條連線, 不會影響同一個物件的其它查詢
+        """
+        if batch_size is None:
+            batch_size = self.batch_size
+        batch_size = max(1, batch_size)
 
-        return column_names, all_rows
+        connection = self.pool.checkout()
+        cursor = connection.cursor(buffered=False)
+        try:
+            cursor.execute(query)
+            column_names = [col[0] for col in cursor.description]
+
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if len(rows) == 0:
+                    break
+                yield column_names, rows
+        finally:
+            # 提早結束時, 要把剩下的資料讀完才能歸還連線; 讀不完的連線丟棄
+            try:
+                while len(cursor.fetchmany(batch_size)) > 0:
+                    pass
+                cursor.close()
+                self.pool.checkin(connection)
+            except Exception as e:
+                logger.trace(f'stream_query: {e}')
+                self.pool.discard(connection)
 
     def print_query(self, query: str):
+        with self.session() as connection:
+            self._print_query(connection, query)
+
+    @staticmethod
+    def _print_query(connection: MySQLConnectionAbstract, query: str):
         logger.debug(query)
-        cursor = self.connection.cursor()
+        cursor = connection.cursor()
         cursor.execute(query)
 
         # print(cursor.description)
@@ -0,0 +1,182 @@
+import hashlib
+import os
+import tempfile
+import threading
+import time
+
+import mysql.connector
+from loguru import logger
+from mysql.connector import errors
+from mysql.connector.abstracts import MySQLConnectionAbstract
+
+from pz.config import PzProjectMySqlConfig
+
+MAX_POOL_SIZE = 32
+
+
+class PzMysqlConnectionPool:
+    """
+        整個程式共用的 MySQL 連線池, 同一組連線設定只會建立一個.
+        連線需要時才建立; 閒置超過 idle_ping_seconds 的連線取出時才 ping, 發生連線錯誤的連線直接丟棄.
+        歸還時不重設 session (程式不會修改 session 狀態, 暫存表由使用的一方自行刪除), 只 rollback 未結束的交易
+    """
+    _pools: dict[str, 'PzMysqlConnectionPool'] = {}
+    _pools_lock = threading.Lock()
+
+    name: str
+    db_config: dict
+    pool_size: int
+    checkout_timeout: float
+    idle_ping_seconds: float
+    idle: list[tuple[MySQLConnectionAbstract, float]]
+    connections: set[MySQLConnectionAbstract]
+    opening: int
+    _available: threading.Condition
+
+    def __init__(self, name: str, db_config: dict, pool_size: int, checkout_timeout: float,
+                 idle_ping_seconds: float = 60):
+        self.name = name
+        self.db_config = db_config
+        self.pool_size = max(1, min(pool_size, MAX_POOL_SIZE))
+        self.checkout_timeout = checkout_timeout
+        self.idle_ping_seconds = idle_ping_seconds
+        self.idle = []
+        self.connections = set()
+        self.opening = 0
+        self._available = threading.Condition()
+        logger.debug(f'MySQL connection pool [{name}] created, size: {self.pool_size}')
+
+    @staticmethod
+    def local_infile_folder() -> str:
+        folder = os.path.join(tempfile.gettempdir(), 'pzdb001-load-data')
+        os.makedirs(folder, exist_ok=True)
+        return folder
+
+    @staticmethod
+    def db_config(cfg: PzProjectMySqlConfig) -> dict:
+        db_config = {
+            'user': cfg.user,
+            'password': cfg.password,
+            'host': cfg.host,
+            'database': cfg.database,
+            'raise_on_warnings': True
+        }
+        if cfg.bulk_load:
+            # LOAD DATA LOCAL INFILE 只允許讀取暫存資料夾內的檔案
+            db_config['allow_local_infile_in_path'] = PzMysqlConnectionPool.local_infile_folder()
+        return db_config
+
+    @classmethod
+    def shared(cls, cfg: PzProjectMySqlConfig) -> 'PzMysqlConnectionPool':
+        key = f'{cfg.user}@{cfg.host}/{cfg.database}'
+        with cls._pools_lock:
+            if key not in cls._pools:
+                name = f'pz_{hashlib.md5(key.encode("utf-8")).hexdigest()[:16]}'
+                cls._pools[key] = cls(name, cls.db_config(cfg), cfg.pool_size, cfg.pool_checkout_timeout,
+                                      cfg.pool_idle_ping_seconds)
+            return cls._pools[key]
+
+    @classmethod
+    def close_all(cls):
+        with cls._pools_lock:
+            for pool in cls._pools.values():
+                pool.close()
+            cls._pools.clear()
+
+    @staticmethod
+    def is_connection_error(error: BaseException) -> bool:
+        """
+            連線本身已經不能再用 (斷線, 還有未讀取的結果等), 歸還時應該丟棄
+        """
+        return isinstance(error, (errors.OperationalError, errors.InterfaceError, errors.InternalError))
+
+    @staticmethod
+    def is_healthy(connection: MySQLConnectionAbstract) -> bool:
+        try:
+            connection.ping(reconnect=True, attempts=2, delay=0)
+            return True
+        except errors.Error as e:
+            logger.warning(f'MySQL connection health check failed: {e}')
+            return False
+
+    def discard(self, connection: MySQLConnectionAbstract):
+        with self._available:
+            self.connections.discard(connection)
+            self._available.notify()
+        try:
+            connection.close()
+        except errors.Error as e:
+            logger.trace(f'close connection [{self.name}]: {e}')
+
+    def checkout(self) -> MySQLConnectionAbstract:
+        deadline = time.monotonic() + self.checkout_timeout
+
+        while True:
+            connection: MySQLConnectionAbstract | None = None
+            idle_since = 0.0
+            with self._available:
+                while len(self.idle) == 0 and len(self.connections) + self.opening >= self.pool_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise errors.PoolError(f'No connection available in pool [{self.name}]')
+                    # checkin / 丟棄連線時會叫醒等待的一方
+                    self._available.wait(remaining)
+
+                if len(self.idle) > 0:
+                    connection, idle_since = self.idle.pop()
+                else:
+                    # 先佔住名額, 在鎖外面建立連線
+                    self.opening += 1
+
+            if connection is None:
+                try:
+                    connection = mysql.connector.connect(**self.db_config)
+                    with self._available:
+                        self.connections.add(connection)
+                    return connection
+                finally:
+                    with self._available:
+                        self.opening -= 1
+                        self._available.notify()
+
+            if time.monotonic() - idle_since < self.idle_ping_seconds or self.is_healthy(connection):
+                return connection
+
+            # 連線已經失效, 丟棄後重新取得
+            self.discard(connection)
+            if time.monotonic() >= deadline:
+                raise errors.PoolError(f'No healthy connection available in pool [{self.name}]')
+
+    def checkin(self, connection: MySQLConnectionAbstract, error: BaseException | None = None):
+        """
+            error: 使用連線時發生的例外; 連線錯誤時丟棄這條連線
+        """
+        if error is not None and self.is_connection_error(error):
+            logger.debug(f'discard connection [{self.name}]: {error}')
+            self.discard(connection)
+            return
+
+        try:
+            if connection.in_transaction:
+                connection.rollback()
+        except errors.Error as e:
+            logger.warning(f'failed to return connection to pool [{self.name}]: {e}')
+            self.discard(connection)
+            return
+
+        with self._available:
+            if connection in self.connections:
+                self.idle.append((connection, time.monotonic()))
+                self._available.notify()
+
+    def close(self):
+        with self._available:
+            connections = list(self.connections)
+            self.connections.clear()
+            self.idle.clear()
+            self._available.notify_all()
+        for connection in connections:
+            try:
+                connection.close()
+            except errors.Error as e:
+                logger.warning(f'failed to close connection in pool [{self.name}]: {e}')
@@ -0,0 +1,156 @@
+import queue
+import threading
+import time
+from typing import Any, Callable, Iterable
+
+from loguru import logger
+
+_END = object()
+
+
+class PzPipelineStageStatistics:
+    name: str
+    items: int
+    rows: int
+    busy_seconds: float
+
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.rows = 0
+        self.busy_seconds = 0.0
+
+    def items_per_second(self) -> float:
+        return self.items / self.busy_seconds if self.busy_seconds > 0 else 0.0
+
+    def rows_per_second(self) -> float:
+        return self.rows / self.busy_seconds if self.busy_seconds > 0 else 0.0
+
+    def __str__(self) -> str:
+        text = f'{self.name}: {self.items} 批, {self.busy_seconds:.3f}s, {self.items_per_second():.1f} 批/s'
+        if self.rows > 0:
+            text += f', {self.rows} 筆, {self.rows_per_second():.1f} 筆/s'
+        return text
+
+
+class PzPipeline:
+    """
+        讀取 -> 轉換 -> 寫入 三個階段同時進行, 中間用有界的佇列串接.
+        讀取在獨立的執行緒, 轉換可以有多個執行緒 (多於一個時不保證順序), 寫入在呼叫 run() 的執行緒.
+        writer 回傳寫入的筆數, 任何一個階段出錯都會停止整個 pipeline 並把例外丟回給呼叫端
+    """
+    name: str
+    reader: Iterable[Any]
+    transform: Callable[[Any], Any]
+    writer: Callable[[Any], int | None]
+    workers: int
+    queue_size: int
+    statistics: dict[str, PzPipelineStageStatistics]
+
+    def __init__(self, name: str, reader: Iterable[Any], transform: Callable[[Any], Any],
+                 writer: Callable[[Any], int | None], workers: int = 1, queue_size: int = 4):
+        self.name = name
+        self.reader = reader
+        self.transform = transform
+        self.writer = writer
+        self.workers = max(1, workers)
+        self.queue_size = max(1, queue_size)
+        self.statistics = dict([(x, PzPipelineStageStatistics(x)) for x in ['read', 'transform', 'write']])
+        self._lock = threading.Lock()
+
+    def _account(self, stage: str, seconds: float, rows: int = 0):
+        with self._lock:
+            statistics = self.statistics[stage]
+            statistics.items += 1
+            statistics.rows += rows
+            statistics.busy_seconds += seconds
+
+    def run(self) -> int:
+        source_queue = queue.Queue(maxsize=self.queue_size)
+        result_queue = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        errors: list[Exception] = []
+
+        def put(q: queue.Queue, item: Any) -> bool:
+            while not stop.is_set():
+                try:
+                    q.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def read():
+            try:
+                iterator = iter(self.reader)
+                while not stop.is_set():
+                    start = time.perf_counter()
+                    try:
+                        item = next(iterator)
+                    except StopIteration:
+                        break
+                    self._account('read', time.perf_counter() - start)
+                    if not put(source_queue, item):
+                        break
+            except Exception as e:
+                errors.append(e)
+                stop.set()
+            finally:
+                for _ in range(self.workers):
+                    put(source_queue, _END)
+
+        def work():
+            try:
+                while not stop.is_set():
+                    try:
+                        item = source_queue.get(timeout=0.1)
+                    except queue.Empty:
+                        continue
+                    if item is _END:
+                        break
+                    start = time.perf_counter()
+                    result = self.transform(item)
+                    self._account('transform', time.perf_counter() - start)
+                    if not put(result_queue, result):
+                        break
+            except Exception as e:
+                errors.append(e)
+                stop.set()
+            finally:
+                put(result_queue, _END)
+
+        threads = [threading.Thread(target=read, name=f'{self.name}-read', daemon=True)]
+        threads.extend([threading.Thread(target=work, name=f'{self.name}-transform-{i}', daemon=True)
+                        for i in range(self.workers)])
+        for thread in threads:
+            thread.start()
+
+        written = 0
+        finished = 0
+        try:
+            while finished < self.workers and not stop.is_set():
+                try:
+                    item = result_queue.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if item is _END:
+                    finished += 1
+                    continue
+                start = time.perf_counter()
+                rows = self.writer(item) or 0
+                self._account('write', time.perf_counter() - start, rows)
+                written += rows
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+        if len(errors) > 0:
+            raise errors[0]
+
+        self.log_statistics()
+        return written
+
+    def log_statistics(self):
+        for statistics in self.statistics.values():
+            logger.info(f'[{self.name}] {statistics}')
@@ -0,0 +1,253 @@
+import base64
+import datetime
+import decimal
+import hashlib
+import json
+import os
+import struct
+import zlib
+from typing import Any, Iterable
+
+from loguru import logger
+
+
+class PzTableSnapshot:
+    """
+        資料表的欄式快照 (每個欄位各自壓縮), 檔案格式:
+          MAGIC | header 長度 (8 bytes) | header (JSON: 欄位名稱/型別/位置/雜湊, 筆數, 內容雜湊) | 各欄位壓縮後的資料
+        讀取時只讀入需要的欄位 (壓縮後的資料), 第一次取用欄位時才解壓縮, 驗證及轉換型別.
+        只使用標準函式庫, 不必另外安裝 pyarrow
+    """
+    MAGIC = b'PZSNAP2\n'
+    EXTENSION = '.pzsnap'
+
+    table_name: str
+    columns: list[str]
+    types: list[str]
+    row_count: int
+    content_hash: str
+    created_at: str
+    source: str
+    verify: bool
+    _rows: list[list[Any]] | None
+    _blocks: dict[str, tuple[bytes, str]]
+    _values: dict[str, list[Any]]
+
+    def __init__(self, table_name: str, columns: list[str], rows: list[list[Any]], types: list[str] | None = None,
+                 content_hash: str = '', created_at: str = ''):
+        self.table_name = table_name
+        self.columns = columns
+        self._rows = rows
+        self.row_count = len(rows)
+        self.types = types if types is not None else self._column_types(len(columns), rows)
+        self.content_hash = content_hash
+        self.created_at = created_at
+        self.source = ''
+        self.verify = False
+        self._blocks = {}
+        self._values = {}
+
+    @property
+    def rows(self) -> list[list[Any]]:
+        if self._rows is None:
+            values = [self.column_values(x) for x in self.columns]
+            self._rows = [list(x) for x in zip(*values)] if len(values) > 0 else []
+            self._values = {}
+        return self._rows
+
+    @rows.setter
+    def rows(self, rows: list[list[Any]]):
+        self._rows = rows
+        self.row_count = len(rows)
+        self._blocks = {}
+        self._values = {}
+
+    def column_values(self, column_name: str) -> list[Any]:
+        """
+            單一欄位的所有值, 讀取的快照在第一次取用時才解壓縮
+        """
+        if column_name not in self._values:
+            index = self.columns.index(column_name)
+            if self._rows is not None:
+                return [x[index] for x in self._rows]
+            compressed, sha256 = self._blocks.pop(column_name)
+            block = zlib.decompress(compressed)
+            if self.verify and hashlib.sha256(block).hexdigest() != sha256:
+                raise ValueError(f'{self.source}: content hash mismatch ({column_name})')
+            self._values[column_name] = self._decode_block(block, self.types[index])
+        return self._values[column_name]
+
+    @staticmethod
+    def _type_name(value: Any) -> str:
+        return type(value).__name__
+
+    @classmethod
+    def _column_types(cls, count: int, rows: list[list[Any]]) -> list[str]:
+        types = ['NoneType'] * count
+        for row in rows:
+            for i in range(count):
+                if types[i] == 'NoneType' and row[i] is not None:
+                    types[i] = cls._type_name(row[i])
+            if 'NoneType' not in types:
+                break
+        return types
+
+    @staticmethod
+    def _encode(value: Any) -> Any:
+        if value is None or isinstance(value, (bool, int, float, str)):
+            return value
+        if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+            return value.isoformat()
+        if isinstance(value, (bytes, bytearray)):
+            return base64.b64encode(value).decode('ascii')
+        return str(value)
+
+    @staticmethod
+    def _decoder(type_name: str):
+        if type_name == 'datetime':
+            return datetime.datetime.fromisoformat
+        elif type_name == 'date':
+            return datetime.date.fromisoformat
+        elif type_name == 'time':
+            return datetime.time.fromisoformat
+        elif type_name == 'Decimal':
+            return decimal.Decimal
+        elif type_name in ('bytes', 'bytearray'):
+            return base64.b64decode
+        return None
+
+    def _column_block(self, index: int) -> bytes:
+        """
+            欄位的值及型別與欄位型別不同的儲存格 (例如同一欄混合 date 與 datetime)
+        """
+        column_type = self.types[index]
+        values = []
+        exceptions = {}
+        for i, row in enumerate(self.rows):
+            value = row[index]
+            if value is not None and self._type_name(value) != column_type:
+                exceptions[str(i)] = self._type_name(value)
+            values.append(self._encode(value))
+        return json.dumps({'values': values, 'types': exceptions}, ensure_ascii=False).encode('utf-8')
+
+    @classmethod
+    def _decode_block(cls, block: bytes, column_type: str) -> list[Any]:
+        data = json.loads(block.decode('utf-8'))
+        values = data['values']
+        exceptions = data['types']
+        column_decoder = cls._decoder(column_type)
+        if column_decoder is None and len(exceptions) == 0:
+            return values
+
+        decoded = []
+        for i, value in enumerate(values):
+            decoder = cls._decoder(exceptions[str(i)]) if str(i) in exceptions else column_decoder
+            decoded.append(decoder(value) if decoder is not None and value is not None else value)
+        return decoded
+
+    @staticmethod
+    def _hash(columns: list[str], types: list[str], column_hashes: list[str]) -> str:
+        return hashlib.sha256(json.dumps([columns, types, column_hashes], ensure_ascii=False).encode('utf-8')).hexdigest()
+
+    def write(self, file_path: str) -> str:
+        blocks = [self._column_block(i) for i in range(len(self.columns))]
+        column_hashes = [hashlib.sha256(x).hexdigest() for x in blocks]
+        self.content_hash = self._hash(self.columns, self.types, column_hashes)
+        self.created_at = datetime.datetime.now().isoformat(timespec='seconds')
+
+        compressed = [zlib.compress(x, 6) for x in blocks]
+        offset = 0
+        schema = []
+        for i, name in enumerate(self.columns):
+            schema.append({'name': name, 'type': self.types[i], 'offset': offset, 'length': len(compressed[i]),
+                           'sha256': column_hashes[i]})
+            offset += len(compressed[i])
+
+        header = json.dumps({
+            'table': self.table_name,
+            'rows': len(self.rows),
+            'columns': schema,
+            'compression': 'zlib',
+            'sha256': self.content_hash,
+            'created_at': self.created_at,
+        }, ensure_ascii=False).encode('utf-8')
+
+        # 先寫暫存檔再改名, 讀取端不會看到寫到一半的檔案
+        temp_file = f'{file_path}.tmp'
+        with open(temp_file, 'wb') as f:
+            f.write(self.MAGIC)
+            f.write(struct.pack('<Q', len(header)))
+            f.write(header)
+            for block in compressed:
+                f.write(block)
+        os.replace(temp_file, file_path)
+        return self.content_hash
+
+    @classmethod
+    def read(cls, file_path: str, verify: bool = True, columns: list[str] | None = None) -> 'PzTableSnapshot':
+        """
+            columns: 只讀取這些欄位 (None 表示全部), 其他欄位的資料不會從檔案讀入.
+            欄位的雜湊在第一次取用該欄位時驗證
+        """
+        with open(file_path, 'rb') as f:
+            if f.read(len(cls.MAGIC)) != cls.MAGIC:
+                raise ValueError(f'{file_path} is not a snapshot file (請重新執行 --export-snapshot)')
+            header_length = struct.unpack('<Q', f.read(8))[0]
+            header = json.loads(f.read(header_length).decode('utf-8'))
+            position = f.tell()
+
+            schema = header['columns']
+            if verify and cls._hash([x['name'] for x in schema], [x['type'] for x in schema],
+                                    [x['sha256'] for x in schema]) != header['sha256']:
+                raise ValueError(f'{file_path}: content hash mismatch')
+
+            if columns is not None:
+                by_name = dict([(x['name'], x) for x in schema])
+                missing = [x for x in columns if x not in by_name]
+                if len(missing) > 0:
+                    raise KeyError(f'{file_path}: {missing}')
+                schema = [by_name[x] for x in columns]
+
+            blocks = {}
+            for column in schema:
+                f.seek(position + column['offset'])
+                blocks[column['name']] = (f.read(column['length']), column['sha256'])
+
+        snapshot = cls(header['table'], [x['name'] for x in schema], [], [x['type'] for x in schema],
+                       header['sha256'], header['created_at'])
+        snapshot._rows = None
+        snapshot.row_count = header['rows']
+        snapshot.source = file_path
+        snapshot.verify = verify
+        snapshot._blocks = blocks
+        return snapshot
+
+
+class PzSnapshotStore:
+    """
+        快照資料夾, 每個資料表一個檔案
+    """
+    folder: str
+
+    def __init__(self, folder: str):
+        self.folder = folder
+
+    def path(self, table_name: str) -> str:
+        return os.path.join(self.folder, f'{table_name}{PzTableSnapshot.EXTENSION}')
+
+    def exists(self, table_name: str) -> bool:
+        return os.path.exists(self.path(table_name))
+
+    def export(self, table_name: str, columns: list[str], rows: Iterable[Iterable[Any]]) -> PzTableSnapshot:
+        os.makedirs(self.folder, exist_ok=True)
+        snapshot = PzTableSnapshot(table_name, columns, [list(x) for x in rows])
+        snapshot.write(self.path(table_name))
+        logger.info(f'>>> {table_name}: {len(snapshot.rows)} 筆, sha256: {snapshot.content_hash[:16]}')
+        return snapshot
+
+    def load(self, table_name: str, verify: bool = True, columns: list[str] | None = None) -> PzTableSnapshot:
+        if not self.exists(table_name):
+            raise FileNotFoundError(f'{self.path(table_name)} 不存在, 請先執行 --export-snapshot')
+        snapshot = PzTableSnapshot.read(self.path(table_name), verify, columns)
+        logger.debug(f'snapshot {table_name}: {snapshot.row_count} 筆 ({snapshot.created_at})')
+        return snapshot
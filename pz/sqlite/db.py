@@ -0,0 +1,357 @@
+import re
+import sqlite3
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Generator, Iterable
+
+from loguru import logger
+
+from pz.db_statistics import PzDbStatistics
+from pz.ms_access.db import PzAccessDbStructure, PzDatabase
+from pz.mysql.db import PzMysqlUpdateResult
+
+
+def _update_join(match: re.Match) -> str:
+    """
+        UPDATE a x JOIN b y USING (...) SET x.c = y.c WHERE ... 轉成 SQLite 的 UPDATE ... FROM
+    """
+    table_name, alias, source, source_alias, using, on, assignments, where = match.groups()
+    if using is not None:
+        condition = ' AND '.join([f'{alias}.{x.strip()} = {source_alias}.{x.strip()}' for x in using.split(',')])
+    else:
+        condition = on
+    # SQLite 的 SET 不能加上資料表別名
+    assignments = re.sub(rf'(^|,)\s*{alias}\.', r'\1', assignments)
+    query = f'UPDATE {table_name} AS {alias} SET {assignments} FROM {source} AS {source_alias} WHERE ({condition})'
+    return query if where is None else f'{query} AND ({where})'
+
+
+def _delete_join(match: re.Match) -> str:
+    """
+        DELETE x FROM a x JOIN ... WHERE ... 轉成以 rowid 刪除
+    """
+    alias, table_name, table_alias, joins, where = match.groups()
+    if alias != table_alias:
+        return match.group(0)
+    return (f'DELETE FROM {table_name} WHERE rowid IN '
+            f'(SELECT {alias}.rowid FROM {table_name} {alias} {joins} WHERE {where})')
+
+
+def _auto_increment(match: re.Match) -> str:
+    """
+        AUTO_INCREMENT 欄位要宣告成 INTEGER PRIMARY KEY, 並移除另外定義的 PRIMARY KEY
+    """
+    query = match.group(0)
+    column = re.search(r'(`\w+`)\s+int\s+NOT\s+NULL\s+AUTO_INCREMENT', query, re.IGNORECASE)
+    if column is None:
+        return query
+    query = query.replace(column.group(0), f'{column.group(1)} INTEGER PRIMARY KEY AUTOINCREMENT')
+    return re.sub(rf'\s*PRIMARY\s+KEY\s*\(\s*{column.group(1)}\s*\),', '', query, flags=re.IGNORECASE)
+
+
+def _on_duplicate_key_update(match: re.Match) -> str:
+    """
+        ON DUPLICATE KEY UPDATE c = VALUES(c) 轉成 ON CONFLICT DO UPDATE SET c = excluded.c
+    """
+    assignments = re.sub(r'\bVALUES\s*\(([^()]+)\)', r'excluded.\1', match.group(1))
+    return f' ON CONFLICT DO UPDATE SET {assignments}'
+
+
+class PzSqliteDialect:
+    """
+        把 Access / MySQL 的 SQL 轉成 SQLite 可以執行的語法, 只處理程式中用到的寫法.
+        MySQL 的規則涵蓋的語法與範例見 debugging/sqlite_dialect_check.py
+    """
+    ACCESS = 'access'
+    MYSQL = 'mysql'
+
+    _ACCESS_RULES: list[tuple[re.Pattern, str | Callable[[re.Match], str]]] = [
+        (re.compile(r'\[([^\[\]]+?)\.([^\[\]]+?)]'), r'"\1"."\2"'),
+        (re.compile(r'\[([^\[\]]+?)]'), r'"\1"'),
+        (re.compile(r'\bIsNull\s*\(([^()]*)\)', re.IGNORECASE), r'(\1 IS NULL)'),
+        (re.compile(r'\bLen\s*\(', re.IGNORECASE), 'LENGTH('),
+        (re.compile(r'\bMid\s*\(', re.IGNORECASE), 'SUBSTR('),
+        (re.compile(r'\bVal\s*\(([^()]*)\)', re.IGNORECASE), r'CAST(\1 AS REAL)'),
+        (re.compile(r'(\w+)\s+AUTOINCREMENT\s+PRIMARY\s+KEY', re.IGNORECASE), r'\1 INTEGER PRIMARY KEY AUTOINCREMENT'),
+    ]
+    _MYSQL_RULES: list[tuple[re.Pattern, str | Callable[[re.Match], str]]] = [
+        (re.compile(r'^\s*RENAME\s+TABLE\s+(.+)$', re.IGNORECASE | re.DOTALL),
+         lambda m: ';\n'.join([f'ALTER TABLE {x.split()[0]} RENAME TO {x.split()[-1]}'
+                               for x in m.group(1).split(',')])),
+        (re.compile(r'^\s*CREATE\s+OR\s+REPLACE\s+VIEW\s+(\S+)\s+AS\s', re.IGNORECASE),
+         r'DROP VIEW IF EXISTS \1;\nCREATE VIEW \1 AS '),
+        (re.compile(r'^\s*CREATE\s+TEMPORARY\s+TABLE\s+(\S+)\s+LIKE\s+(\S+?)\s*;?\s*$', re.IGNORECASE),
+         r'CREATE TEMPORARY TABLE \1 AS SELECT * FROM \2 WHERE 0'),
+        (re.compile(r'\bDROP\s+TEMPORARY\s+TABLE\b', re.IGNORECASE), 'DROP TABLE'),
+        (re.compile(r'^\s*TRUNCATE\s+TABLE\b', re.IGNORECASE), 'DELETE FROM'),
+        (re.compile(r'\bSELECT\s+TABLE_NAME\s+FROM\s+information_schema\.TABLES\s+'
+                    r'WHERE\s+TABLE_SCHEMA\s*=\s*DATABASE\(\)\s+AND\s+TABLE_NAME\b', re.IGNORECASE),
+         'SELECT name FROM sqlite_master WHERE name'),
+        (re.compile(r'^\s*UPDATE\s+(\S+)\s+(\w+)\s+(?:INNER\s+)?JOIN\s+(\S+)\s+(\w+)\s+'
+                    r'(?:USING\s*\(([^()]*)\)|ON\s+(.+?))\s+SET\s+(.+?)(?:\s+WHERE\s+(.+?))?\s*$',
+                    re.IGNORECASE | re.DOTALL), _update_join),
+        (re.compile(r'^\s*DELETE\s+(\w+)\s+FROM\s+(\S+)\s+(\w+)\s+(.+?)\s+WHERE\s+(.+?)\s*$',
+                    re.IGNORECASE | re.DOTALL), _delete_join),
+        (re.compile(r'\s+ON\s+DUPLICATE\s+KEY\s+UPDATE\s+(.*)$', re.IGNORECASE | re.DOTALL),
+         _on_duplicate_key_update),
+        (re.compile(r'^.*\bAUTO_INCREMENT\b.*$', re.IGNORECASE | re.DOTALL), _auto_increment),
+        (re.compile(r',(\s*)UNIQUE\s+KEY\s+`[^`]+`\s*(\([^()]*\))', re.IGNORECASE), r',\1UNIQUE \2'),
+        (re.compile(r',\s*KEY\s+`[^`]+`\s*\([^()]*\)', re.IGNORECASE), ''),
+        (re.compile(r"\s+COMMENT\s+'(?:[^'\\]|\\.)*'", re.IGNORECASE), ''),
+        (re.compile(r'\s+CHARACTER\s+SET\s+\w+', re.IGNORECASE), ''),
+        (re.compile(r'\s+COLLATE\s*=?\s*\w+', re.IGNORECASE), ''),
+        (re.compile(r'\s+ON\s+UPDATE\s+CURRENT_TIMESTAMP', re.IGNORECASE), ''),
+        (re.compile(r'\)\s*ENGINE\s*=.*$', re.IGNORECASE | re.DOTALL), ')'),
+        (re.compile(r'<=>'), 'IS'),
+        (re.compile(r'\bAS\s+UNSIGNED\b', re.IGNORECASE), 'AS INTEGER'),
+        (re.compile(r'`'), '"'),
+        (re.compile(r'%s'), '?'),
+    ]
+
+    dialect: str
+
+    def __init__(self, dialect: str):
+        self.dialect = dialect
+
+    def translate(self, query: str) -> str:
+        rules = self._ACCESS_RULES if self.dialect == self.ACCESS else self._MYSQL_RULES
+        for pattern, replacement in rules:
+            query = pattern.sub(replacement, query)
+        return query
+
+
+class PzSqliteCursor:
+    """
+        session() 取得的 cursor, 執行前先轉換語法; 轉換成多個敘述時依序執行
+    """
+    cursor: sqlite3.Cursor
+    translate: Callable[[str], str]
+
+    def __init__(self, cursor: sqlite3.Cursor, translate: Callable[[str], str]):
+        self.cursor = cursor
+        self.translate = translate
+
+    def execute(self, query: str, params: Iterable[Any] = ()):
+        for statement in [x for x in self.translate(query).split(';\n') if x.strip() != '']:
+            self.cursor.execute(statement, tuple(params))
+
+    def executemany(self, query: str, rows: Iterable[Iterable[Any]]):
+        self.cursor.executemany(self.translate(query), [tuple(x) for x in rows])
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.cursor, name)
+
+
+class PzSqliteSession:
+    """
+        與 PzMysqlDatabase.session() 取得的連線用法相同 (cursor / commit / rollback)
+    """
+    connection: sqlite3.Connection
+    translate: Callable[[str], str]
+
+    def __init__(self, connection: sqlite3.Connection, translate: Callable[[str], str]):
+        self.connection = connection
+        self.translate = translate
+
+    def cursor(self) -> PzSqliteCursor:
+        return PzSqliteCursor(self.connection.cursor(), self.translate)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.connection, name)
+
+
+class PzSqliteDatabase:
+    """
+        以 SQLite 取代 PzDatabase / PzMysqlDatabase, 不需要 Access driver 或 MySQL server,
+        可以在任何平台上用測試資料跑 Access 的學員資料合併, 以及 MySQL 的匯入, 同步與批次更新.
+        MySQL 的語法只轉換程式中用到的寫法 (PzSqliteDialect); load_data 直接寫入資料, 不經過 LOAD DATA,
+        information_schema 只支援查詢資料表是否存在.
+        db_path 為 None 時使用共享的 in-memory 資料庫, clone() 的連線會看到同一份資料
+    """
+    uri: str
+    dialect: PzSqliteDialect
+    connection: sqlite3.Connection
+    batch_size: int
+    debug: bool = False
+
+    def __init__(self, db_path: str | None = None, dialect: str = PzSqliteDialect.ACCESS, debug: bool = False,
+                 batch_size: int = 1000):
+        if db_path is None:
+            self.uri = f'file:pz_{uuid.uuid4().hex}?mode=memory&cache=shared'
+        elif db_path.startswith('file:'):
+            self.uri = db_path
+        else:
+            self.uri = f'file:{db_path}'
+        self.dialect = PzSqliteDialect(dialect)
+        self.debug = debug
+        self.batch_size = max(1, batch_size)
+        self.connection = sqlite3.connect(self.uri, uri=True, check_same_thread=False)
+
+    def clone(self) -> 'PzSqliteDatabase':
+        return PzSqliteDatabase(self.uri, self.dialect.dialect, self.debug, self.batch_size)
+
+    def close(self):
+        self.connection.close()
+
+    def _sql(self, query: str) -> str:
+        translated = self.dialect.translate(query)
+        if self.debug:
+            logger.debug(f'SQLite Query: {translated}')
+        return translated
+
+    @contextmanager
+    def session(self) -> Generator[PzSqliteSession, None, None]:
+        yield PzSqliteSession(self.connection, self._sql)
+
+    def perform_update(self, query: str) -> int:
+        with PzDbStatistics.measure('sqlite', 'perform_update', query) as measurement:
+            statements = [x for x in self._sql(query).split(';\n') if x.strip() != '']
+            if len(statements) > 1:
+                # RENAME TABLE a TO b, c TO d 轉成多個 ALTER TABLE, 在同一個 transaction 執行
+                try:
+                    for statement in statements:
+                        self.connection.execute(statement)
+                    self.connection.commit()
+                except sqlite3.Error:
+                    self.connection.rollback()
+                    raise
+                return 0
+            cursor = self.connection.execute(statements[0])
+            affected_rows = cursor.rowcount
+            measurement.affected(affected_rows)
+            self.connection.commit()
+            cursor.close()
+            return affected_rows
+
+    def batch_update(self, query: str, callback, batch_size: int | None = None) -> PzMysqlUpdateResult:
+        """
+            與 PzMysqlDatabase.batch_update 相同: 分批 executemany, 整批失敗時逐筆寫入並略過錯誤的資料
+        """
+        sql = self._sql(query)
+        batch_size = max(1, batch_size if batch_size is not None else self.batch_size)
+        result = PzMysqlUpdateResult()
+
+        def execute_chunk(chunk: list):
+            if len(chunk) > 1:
+                try:
+                    cursor = self.connection.executemany(sql, chunk)
+                    self.connection.commit()
+                    result.succeeded += len(chunk)
+                    result.affected_rows += max(cursor.rowcount, 0)
+                    return
+                except sqlite3.Error:
+                    self.connection.rollback()
+
+            for params in chunk:
+                try:
+                    cursor = self.connection.execute(sql, params)
+                    result.succeeded += 1
+                    result.affected_rows += max(cursor.rowcount, 0)
+                except sqlite3.Error as e:
+                    result.failed += 1
+                    logger.warning(f'{str(e)} : {params}')
+            self.connection.commit()
+
+        with PzDbStatistics.measure('sqlite', 'prepared_update', query) as measurement:
+            chunk = []
+            for supplier in callback:
+                chunk.append(tuple(supplier()))
+                if len(chunk) >= batch_size:
+                    execute_chunk(chunk)
+                    chunk = []
+            if len(chunk) > 0:
+                execute_chunk(chunk)
+            measurement.affected(result.affected_rows)
+            return result
+
+    def prepared_update(self, query: str, callback, batch_size: int | None = None) -> int:
+        return self.batch_update(query, callback, batch_size).affected_rows
+
+    def replace_table_rows(self, table_name: str, columns: list[str], rows: list[Any]) -> int:
+        query = (f'INSERT INTO [{table_name}] ({",".join([f"[{x}]" for x in columns])}) '
+                 f'VALUES ({",".join(["?"] * len(columns))})')
+        with PzDbStatistics.measure('sqlite', 'replace_table_rows', query) as measurement:
+            try:
+                self.connection.execute(self._sql(f'DELETE FROM [{table_name}]'))
+                self.connection.executemany(self._sql(query), rows)
+                self.connection.commit()
+            except sqlite3.Error:
+                self.connection.rollback()
+                raise
+            measurement.affected(len(rows))
+            return len(rows)
+
+    def load_data(self, table_name: str, columns: list[str], rows: Iterable[tuple]) -> int:
+        query = f'INSERT INTO `{table_name}` ({",".join(columns)}) VALUES ({",".join(["%s"] * len(columns))})'
+        cursor = self.connection.executemany(self._sql(query), rows)
+        self.connection.commit()
+        return cursor.rowcount
+
+    def get_column_names(self, query: str) -> list[str]:
+        cursor = self.connection.execute(self._sql(query))
+        des = [col[0] for col in cursor.description]
+        cursor.close()
+        return des
+
+    def query(self, query: str) -> tuple[list[str], list[Any]]:
+        with PzDbStatistics.measure('sqlite', 'query', query) as measurement:
+            cursor = self.connection.execute(self._sql(query))
+            column_names = [col[0] for col in cursor.description]
+            all_rows = cursor.fetchall()
+            cursor.close()
+            measurement.fetched(all_rows)
+            return column_names, all_rows
+
+    def stream_query(self, query: str, batch_size: int | None = None) -> Generator[
+            tuple[list[str], list[Any]], None, None]:
+        batch_size = max(1, batch_size if batch_size is not None else self.batch_size)
+        cursor = self.connection.execute(self._sql(query))
+        try:
+            column_names = [col[0] for col in cursor.description]
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if len(rows) == 0:
+                    break
+                yield column_names, rows
+        finally:
+            cursor.close()
+
+    def print_query(self, query: str):
+        column_names, all_rows = self.query(query)
+        for row in all_rows:
+            print(row)
+        print(column_names)
+
+    def table_structure(self, table_name: str) -> list[PzAccessDbStructure]:
+        type_codes = {'INTEGER': int, 'INT': int, 'REAL': float, 'FLOAT': float, 'DOUBLE': float}
+
+        cursor = self.connection.execute(f'PRAGMA table_info("{table_name}")')
+        fields: list[PzAccessDbStructure] = []
+        for cid, name, declared_type, not_null, _, _ in cursor.fetchall():
+            match = re.match(r'^\s*(\w+)\s*(?:\((\d+)\))?', declared_type or '')
+            base_type = match.group(1).upper() if match else 'TEXT'
+            size = int(match.group(2)) if match and match.group(2) else 255
+            fields.append(PzAccessDbStructure(cid + 1, (name, type_codes.get(base_type, str), None, size, size, 0,
+                                                        not not_null)))
+        cursor.close()
+        return fields
+
+    def table_to_mysql_table_creation_query(
+            self, access_table_name: str, mysql_table_name: str, column_name_mapping: dict[str, str],
+            fine_tunner: Callable[[list[str]], None]) -> str:
+        return PzDatabase.table_to_mysql_table_creation_query(
+            self, access_table_name, mysql_table_name, column_name_mapping, fine_tunner)
+
+    @staticmethod
+    def mysql_creation_query(table_name: str, columns_in_mysql: list[str]) -> str:
+        return PzDatabase.mysql_creation_query(table_name, columns_in_mysql)
+
+    def create_table(self, table_name: str, columns: list[str], rows: Iterable[Iterable[Any]] = ()) -> int:
+        """
+            建立測試用的資料表並寫入資料 (欄位都是 TEXT)
+        """
+        self.connection.execute(f'CREATE TABLE "{table_name}" ({",".join([f"\"{x}\" TEXT" for x in columns])})')
+        cursor = self.connection.executemany(
+            f'INSERT INTO "{table_name}" VALUES ({",".join(["?"] * len(columns))})', [tuple(x) for x in rows])
+        self.connection.commit()
+        return max(cursor.rowcount, 0)
@@ -33,7 +33,8 @@ def from_attend_records_to_class(cfg: PzProjectConfig):
 
         if settings is not None:
             gservice = PzCloudSpreadsheetMemberService(settings, cfg.google.secret_file)
-            gservice.clear_all(models[0])
+            if not settings.delta_write:
+                gservice.clear_all(models[0])
             # results: list[GoogleClassMemberModel] = gservice.read_all(GoogleClassMemberModel([]))
 
             current_group = ''
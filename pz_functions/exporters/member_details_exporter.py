@@ -1,5 +1,3 @@
-from typing import Any
-
 from pz.config import PzProjectConfig
 from pz.models.member_detail_model import MemberDetailModel
 from pz.utils import get_formatted_datetime
@@ -9,19 +7,13 @@ from services.mysql_import_and_fetching import MySqlImportAndFetchingService
 
 def export_member_details(cfg: PzProjectConfig) -> str:
     fetcher = MySqlImportAndFetchingService(cfg)
-    details = fetcher.read_member_details()
     model = MemberDetailModel({})
 
     service = ExcelCreationService(model)
 
-    data: list[list[Any]] = []
-
-    for detail in details:
-        model = MemberDetailModel({}, entity=detail)
-        data.append(model.get_values_in_pecking_order())
-        # print(model.to_json())
-
-    supplier = (lambda y=x: x for x in data)
+    # 邊讀邊寫, 不需要先把整個資料表放在記憶體
+    supplier = (lambda y=detail: MemberDetailModel({}, entity=y).get_values_in_pecking_order()
+                for detail in fetcher.iter_member_details())
     service.write_data(supplier)
 
     formatted_date_time = get_formatted_datetime()
@@ -8,7 +8,10 @@ def member_to_access_db(cfg: PzProjectConfig) -> int:
     access_service = AccessDbService(cfg)
     service.read_google_class_members()
 
-    return access_service.class_members_table_creation(service.read_google_class_members())
+    try:
+        return access_service.class_members_table_creation(service.read_google_class_members())
+    finally:
+        access_service.close()
 
     # table_name = 'ClassMembers'
     # pz_db = PzDatabase(cfg.ms_access_db.db_file, debug=False)
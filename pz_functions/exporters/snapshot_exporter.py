@@ -0,0 +1,39 @@
+from loguru import logger
+
+from pz.config import PzProjectConfig
+from pz.ms_access.db import PzDatabase
+from pz.snapshot import PzSnapshotStore
+from services.access_db_service import AccessDbService
+from services.mysql_import_and_fetching import MySqlImportAndFetchingService
+
+
+def export_snapshots(cfg: PzProjectConfig, include_access: bool = True) -> dict[str, str]:
+    """
+        把學員相關的資料表匯出成快照, 沒有資料庫連線的電腦可以直接讀取快照
+    """
+    store = PzSnapshotStore(cfg.snapshot_folder)
+    hashes: dict[str, str] = {}
+
+    fetcher = MySqlImportAndFetchingService(cfg)
+    queries = {
+        'member_details': 'SELECT * FROM `member_details`',
+        fetcher.current_table: f'SELECT * FROM `{fetcher.current_table}` ORDER BY class_name,class_group,id',
+        fetcher.previous_table: f'SELECT * FROM `{fetcher.previous_table}` ORDER BY class_name,class_group,id',
+    }
+    for table_name in fetcher.existing_tables(list(queries.keys())):
+        cols, rows = fetcher.db.query(queries[table_name])
+        hashes[table_name] = store.export(table_name, cols, rows).content_hash
+
+    if include_access:
+        try:
+            access_db = PzDatabase(cfg.ms_access_db.db_file)
+            try:
+                for table_name in [cfg.ms_access_db.target_table, AccessDbService.CLASS_MEMBER_TABLE]:
+                    cols, rows = access_db.query(f'SELECT * FROM [{table_name}]')
+                    hashes[f'access_{table_name}'] = store.export(f'access_{table_name}', cols, rows).content_hash
+            finally:
+                access_db.close()
+        except Exception as e:
+            logger.warning(f'Access 資料表快照匯出失敗: {e}')
+
+    return hashes
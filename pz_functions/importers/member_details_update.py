@@ -40,7 +40,7 @@ class ImportMemberDetailsUpdateService:
 
         entries: list[MemberDetailModel] = service.read_all(required_attribute='student_id')
 
-        records, count = self.mysql.import_and_update(entries)
+        records, count = self.mysql.import_and_update_in_batch(entries)
         logger.info(f'{excel_file.basename} -  匯入 {records} 筆資料, {count} 筆更新')
         service.close()
 
@@ -1,6 +1,9 @@
+from loguru import logger
+
 from pz.config import PzProjectConfig
 from pz.models.general_processing_error import GeneralProcessingError
 from pz.models.google_member_relation import GoogleMemberRelation
+from pz.models.mysql_sync_result import MysqlSyncResult
 from pz.models.vertical_member_lookup_result import VerticalMemberLookupResult
 from pz.vlookup_commons import vertical_member_lookup
 from services.access_db_migration import AccessDBMigration
@@ -15,8 +18,11 @@ def write_access_to_mysql(cfg: PzProjectConfig) -> int:
         把 Access 資料庫的東西寫到 MySQL
     """
     merging_service = MemberMergingService(cfg.ms_access_db.db_file, cfg.ms_access_db.target_table)
-    mysql_import_and_fetching = MySqlImportAndFetchingService(cfg)
-    return mysql_import_and_fetching.access_db_member_to_mysql(merging_service)
+    try:
+        mysql_import_and_fetching = MySqlImportAndFetchingService(cfg)
+        return mysql_import_and_fetching.access_db_member_to_mysql(merging_service)
+    finally:
+        merging_service.close()
 
 
 def write_google_to_mysql(cfg: PzProjectConfig, check_formula: bool = False) -> int:
@@ -27,6 +33,22 @@ def write_google_to_mysql(cfg: PzProjectConfig, check_formula: bool = False) ->
     return mysql_import_and_fetching.google_class_members_to_mysql(check_formula=check_formula)
 
 
+def sync_google_to_mysql(cfg: PzProjectConfig, check_formula: bool = False) -> MysqlSyncResult | None:
+    """
+        只把 Google 學員學長資料有變動的部份同步到 MySQL
+    """
+    mysql_import_and_fetching = MySqlImportAndFetchingService(cfg)
+    return mysql_import_and_fetching.google_class_members_sync_to_mysql(check_formula=check_formula)
+
+
+def ensure_mysql_indexes(cfg: PzProjectConfig) -> int:
+    """
+        幫 MySQL 既有的資料表補上常用查詢的索引
+    """
+    mysql_import_and_fetching = MySqlImportAndFetchingService(cfg)
+    return mysql_import_and_fetching.ensure_indexes()
+
+
 def handle_lookup(gms: PzGrandMemberService, entry: GoogleMemberRelation) -> VerticalMemberLookupResult:
     student_id: int | None = None
     if entry.studentId is not None and entry.studentId.isdigit():
@@ -48,6 +70,6 @@ def write_google_relation_to_mysql(cfg: PzProjectConfig) -> tuple[int, list[Gene
     return mysql_import_and_fetching.google_relation_to_mysql(lambda x: handle_lookup(gms, x))
 
 
-def migrate_access_table_to_mysql(cfg: PzProjectConfig) -> int:
+def migrate_access_table_to_mysql(cfg: PzProjectConfig, resume: bool = False) -> int:
     mig = AccessDBMigration(cfg)
-    return mig.migrate()
+    return mig.migrate(lambda x, y: logger.info(f'>>> {x}/{y} 筆資料處理完成'), resume=resume)
@@ -15,5 +15,6 @@ def member_data_merging(access_database: str, member_data_table: str):
 def read_merging_data(database_file: str, table_name: str):
     service = MemberMergingService(database_file, table_name)
     cols, results = service.read_all()
+    service.close()
     logger.debug(f'{cols}')
     logger.debug(f'{results}')
@@ -1,3 +1,4 @@
+import atexit
 import os
 import sys
 from getopt import getopt, GetoptError
@@ -8,17 +9,23 @@ from PyQt6.QtWidgets import (
 )
 from loguru import logger
 
+from pz.cloud.request_scheduler import SpreadsheetRequestScheduler
+from pz.cloud.spreadsheet_cache import SpreadsheetCache
 from pz.config import PzProjectConfig
+from pz.db_statistics import PzDbStatistics
+from pz.ms_access.metadata_cache import PzAccessMetadataCache
 from pz.models.pz_questionnaire_info import PzQuestionnaireInfo
 from pz.usb_disk import get_usb_info
 from pz_functions.exporters.member_details_exporter import export_member_details
+from pz_functions.exporters.snapshot_exporter import export_snapshots
 from pz_functions.generaters.graduation import generate_graduation_reports
 from pz_functions.generaters.introducer import generate_introducer_reports
 from pz_functions.generaters.member_comparison import generate_member_comparison_table
 from pz_functions.generaters.senior import generate_senior_reports
 from pz_functions.importers.member_card import import_member_card_from_access
 from pz_functions.importers.member_details_update import member_details_update
-from pz_functions.importers.mysql_functions import write_access_to_mysql, write_google_to_mysql
+from pz_functions.importers.mysql_functions import write_access_to_mysql, write_google_to_mysql, \
+    sync_google_to_mysql, ensure_mysql_indexes
 from pz_functions.mergers.member_merging import member_data_merging
 from services.excel_workbook_service import ExcelWorkbookService
 from services.qrcode_service import QRCodeService
@@ -50,9 +57,14 @@ if __name__ == '__main__':
         "generate-member-comparison",
         "access-to-mysql",
         "google-to-mysql",
+        "google-sync-to-mysql",
         "generate-predefined-senior-reports",
         "export-details",
         "import-details",
+        "ensure-indexes",
+        "db-statistics",
+        "export-snapshot",
+        "from-snapshot",
     ]
 
     try:
@@ -90,6 +102,7 @@ if __name__ == '__main__':
     debug = False
     write_access_to_mysql_flag = False
     write_google_to_mysql_flag = False
+    sync_google_to_mysql_flag = False
     generate_introducer_reports_flag = False
     generate_senior_reports_flag = False
     generate_predefined_senior_reports_flag = False
@@ -99,6 +112,10 @@ if __name__ == '__main__':
     import_details_flag = False
     card_record_to_mysql_flag = False
     generate_member_comparison_flag = False
+    ensure_indexes_flag = False
+    db_statistics_flag = False
+    export_snapshot_flag = False
+    from_snapshot_flag = False
 
     for opt, arg in options:
         if opt in ("-h", "--help"):
@@ -115,6 +132,8 @@ if __name__ == '__main__':
             write_access_to_mysql_flag = True
         elif opt == "--google-to-mysql":
             write_google_to_mysql_flag = True
+        elif opt == "--google-sync-to-mysql":
+            sync_google_to_mysql_flag = True
         elif opt == "--generate-introducer-reports":
             generate_introducer_reports_flag = True
         elif opt == "--generate-senior-reports":
@@ -129,6 +148,14 @@ if __name__ == '__main__':
             import_details_flag = True
         elif opt == "--card-record-to-mysql":
             card_record_to_mysql_flag = True
+        elif opt == "--ensure-indexes":
+            ensure_indexes_flag = True
+        elif opt == "--db-statistics":
+            db_statistics_flag = True
+        elif opt == "--export-snapshot":
+            export_snapshot_flag = True
+        elif opt == "--from-snapshot":
+            from_snapshot_flag = True
         else:
             print(f"Unknown option: {opt}")
             sys.exit(2)
@@ -143,6 +170,18 @@ if __name__ == '__main__':
     )
     logger.add(cfg.logging.log_file, level=cfg.logging.level, format=cfg.logging.format)
 
+    PzDbStatistics.configure(cfg.db_statistics.enabled or db_statistics_flag, cfg.db_statistics.slow_query_ms)
+    if PzDbStatistics.enabled:
+        atexit.register(PzDbStatistics.report)
+    if from_snapshot_flag:
+        cfg.from_snapshot = True
+    PzAccessMetadataCache.configure(cfg.metadata_cache_file)
+    SpreadsheetCache.configure(cfg.google_cache_folder)
+    if getattr(cfg, 'google', None) is not None:
+        SpreadsheetRequestScheduler.configure(cfg.google.requests_per_minute, cfg.google.max_retries)
+    atexit.register(SpreadsheetRequestScheduler.report)
+    atexit.register(PzAccessMetadataCache.save)
+
     # qrcode_svc = QRCodeService(cfg)
     # qrcode_svc.create_qrcode('113022085', '芊小伊')
     # exit(0)
@@ -153,6 +192,9 @@ if __name__ == '__main__':
     elif write_google_to_mysql_flag:
         logger.info("Writing Google spreadsheet to MySQL database ...")
         write_google_to_mysql(cfg)
+    elif sync_google_to_mysql_flag:
+        logger.info("Syncing Google spreadsheet changes to MySQL database ...")
+        sync_google_to_mysql(cfg)
     elif generate_introducer_reports_flag:
         logger.info("Generating introducer reports ...")
         generate_introducer_reports(cfg)
@@ -181,6 +223,13 @@ if __name__ == '__main__':
     elif card_record_to_mysql_flag:
         logger.info("Merging card records to MySQL database ...")
         import_member_card_from_access(cfg)
+    elif ensure_indexes_flag:
+        logger.info("Ensuring MySQL indexes ...")
+        added = ensure_mysql_indexes(cfg)
+        logger.info(f'>>> {added} 個索引新增')
+    elif export_snapshot_flag:
+        logger.info("Exporting table snapshots ...")
+        export_snapshots(cfg)
     else:
         # AttendRecordAsClassMemberService(cfg)
         app = QApplication([])
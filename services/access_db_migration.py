@@ -1,4 +1,5 @@
 import json
+from typing import Any, Callable
 
 from loguru import logger
 
@@ -6,26 +7,30 @@ from pz.config import PzProjectConfig
 from pz.models.mysql_member_basic_entity import MysqlMemberBasicEntity
 from pz.models.mysql_member_more_basic_entity import MysqlMemberMoreBasicEntity
 from pz.ms_access.db import PzDatabase
-from pz.mysql.db import PzMysqlDatabase
+from pz.mysql.db import PzMysqlDatabase, PzMysqlUpdateResult
+from pz.pipeline import PzPipeline
 from services.mysql_import_and_fetching import MySqlImportAndFetchingService
 
 
 class AccessDBMigration:
+    STUDENT_ID_COLUMN = '學員編號'
+
     config: PzProjectConfig
     pzDb: PzDatabase
     db: PzMysqlDatabase
     dbFile: str
 
-    def __init__(self, cfg: PzProjectConfig, db_file: str | None = None) -> None:
+    def __init__(self, cfg: PzProjectConfig, db_file: str | None = None,
+                 pz_db: PzDatabase | None = None, db: PzMysqlDatabase | None = None) -> None:
         self.config = cfg
         if db_file is None:
             self.dbFile = cfg.ms_access_db.db_file
         else:
             self.dbFile = db_file
-        self.pzDb = PzDatabase(self.dbFile)
-        self.db = PzMysqlDatabase(cfg.mysql)
+        self.pzDb = pz_db if pz_db is not None else PzDatabase(self.dbFile)
+        self.db = db if db is not None else PzMysqlDatabase(cfg.mysql)
 
-    def insert_into_basic(self, entities: list[MysqlMemberBasicEntity]):
+    def insert_into_basic(self, entities: list[MysqlMemberBasicEntity]) -> PzMysqlUpdateResult:
         columns = [f'`{k}`' for k in MysqlMemberBasicEntity.PZ_MYSQL_COLUMN_NAMES.values()]
         columns.insert(0, '`id`')
         columns_insert = ','.join(columns)
@@ -41,9 +46,9 @@ class AccessDBMigration:
             params.append(tuple(param))
 
         supplier = (lambda y=x: x for x in params)
-        self.db.prepared_update(query, supplier)
+        return self.db.batch_update(query, supplier)
 
-    def insert_into_more_basic(self, entities: list[MysqlMemberMoreBasicEntity]):
+    def insert_into_more_basic(self, entities: list[MysqlMemberMoreBasicEntity]) -> PzMysqlUpdateResult:
         columns = ["`id`", "`additional`"]
         columns_insert = ','.join(columns)
 
@@ -57,31 +62,11 @@ class AccessDBMigration:
                                                  sort_keys=True, ensure_ascii=False)))
 
         supplier = (lambda y=x: x for x in params)
-        self.db.prepared_update(query, supplier)
-
-    def migrate(self) -> int:
-        # self.pzDb.get_all_tables()
-        # self.pzDb.table_structure('MemberBasic')
-
-        access_table_name = 'MemberBasic'
-        mysql_table_name = MysqlMemberBasicEntity.TABLE_NAME
-
-        query = self.pzDb.table_to_mysql_table_creation_query(
-            access_table_name, mysql_table_name,
-            MysqlMemberBasicEntity.PZ_MYSQL_COLUMN_NAMES,
-            MysqlMemberBasicEntity.MYSQL_SCHEMA_FINE_TUNNER)
-        logger.info(query)
-        mysql_service = MySqlImportAndFetchingService(self.config)
-
-        mysql_service.drop_and_create_table(mysql_table_name, query)
-
-        more_basics = MysqlMemberMoreBasicEntity.TABLE_NAME
-        query = mysql_service.mysql_creation_query(more_basics,
-                                                   MysqlMemberMoreBasicEntity.member_more_basics_creation())
-        mysql_service.drop_and_create_table(more_basics, query)
-
-        headers, rows = self.pzDb.query(f'SELECT * FROM {access_table_name}')
+        return self.db.batch_update(query, supplier)
 
+    @staticmethod
+    def _to_entities(headers: list[str], rows: list[Any]) -> \
+            tuple[list[MysqlMemberBasicEntity], list[MysqlMemberMoreBasicEntity]]:
         attributes: list[tuple[str, int]] = []
         more_attributes: list[tuple[str, int]] = []
         for i, header in enumerate(headers):
@@ -114,8 +99,95 @@ class AccessDBMigration:
                 # print(basic_entity.to_json())
                 # print(more_entity.to_json())
 
-        self.insert_into_basic(basic_entities)
-        self.insert_into_more_basic(more_entities)
+        return basic_entities, more_entities
+
+    def _last_migrated_id(self, mysql_service: MySqlImportAndFetchingService) -> int | None:
+        """
+        已經完成的最大學員編號 (兩個資料表都寫入的才算, 依學員編號順序匯入), 資料表不存在時回傳 None
+        """
+        basics = MysqlMemberBasicEntity.TABLE_NAME
+        more_basics = MysqlMemberMoreBasicEntity.TABLE_NAME
+        if len(mysql_service.existing_tables([basics, more_basics])) != 2:
+            return None
+
+        # 中斷時只寫入 member_basics 的資料要清掉重來
+        self.db.perform_update(f'''
+            DELETE b FROM `{basics}` b LEFT JOIN `{more_basics}` m ON b.`id` = m.`id` WHERE m.`id` IS NULL
+        ''')
+        _, results = self.db.query(f'SELECT MAX(`id`) FROM `{more_basics}`')
+        return results[0][0] if results[0][0] is not None else 0
+
+    def _student_id_column(self, access_table_name: str) -> str:
+        """
+        Access 的學員編號欄位; 文字欄位以 Val() 轉成數字比較及排序
+        """
+        for field in self.pzDb.table_structure(access_table_name):
+            if field.column_name == self.STUDENT_ID_COLUMN and field.type_code == 'str':
+                return f'Val([{self.STUDENT_ID_COLUMN}])'
+        return f'[{self.STUDENT_ID_COLUMN}]'
+
+    def migrate(self, progress: Callable[[int, int], None] | None = None, resume: bool = False) -> int:
+        """
+        分批讀取 Access 的資料並寫入 MySQL, 讀取與寫入同時進行, 記憶體中只保留佇列中的幾批資料.
+        progress: 每批完成後呼叫 (已處理筆數, 總筆數)
+        resume: 接續上次中斷的匯入, 只讀取學員編號大於已完成的最大學員編號的資料
+        """
+        # self.pzDb.get_all_tables()
+        # self.pzDb.table_structure('MemberBasic')
+
+        access_table_name = 'MemberBasic'
+        mysql_table_name = MysqlMemberBasicEntity.TABLE_NAME
+        mysql_service = MySqlImportAndFetchingService(self.config, self.db)
+
+        last_migrated_id = self._last_migrated_id(mysql_service) if resume else None
+
+        if last_migrated_id is None:
+            query = self.pzDb.table_to_mysql_table_creation_query(
+                access_table_name, mysql_table_name,
+                MysqlMemberBasicEntity.PZ_MYSQL_COLUMN_NAMES,
+                MysqlMemberBasicEntity.MYSQL_SCHEMA_FINE_TUNNER)
+            logger.info(query)
+
+            mysql_service.drop_and_create_table(mysql_table_name, query)
+
+            more_basics = MysqlMemberMoreBasicEntity.TABLE_NAME
+            query = mysql_service.mysql_creation_query(more_basics,
+                                                       MysqlMemberMoreBasicEntity.member_more_basics_creation())
+            mysql_service.drop_and_create_table(more_basics, query)
+            last_migrated_id = 0
+        else:
+            logger.info(f'>>> 接續匯入, 從學員編號 {last_migrated_id} 之後開始')
+
+        student_id = self._student_id_column(access_table_name)
+        condition = f'WHERE {student_id} > {int(last_migrated_id)}'
+        _, results = self.pzDb.query(f'SELECT COUNT(*) FROM {access_table_name} {condition}')
+        total = results[0][0]
+
+        processed = 0
+
+        def transform(chunk: tuple[list[str], list[Any]]) -> tuple[int, list, list]:
+            headers, rows = chunk
+            return len(rows), *self._to_entities(headers, rows)
+
+        def write(entities: tuple[int, list, list]) -> int:
+            nonlocal processed
+            rows, basic_entities, more_entities = entities
+
+            # member_more_basics 最後寫入, 作為這一批完成的記錄
+            result = self.insert_into_basic(basic_entities)
+            self.insert_into_more_basic(more_entities)
+
+            processed += rows
+            if progress is not None:
+                progress(processed, total)
+            return result.succeeded
+
+        # 讀取 Access 與寫入 MySQL 同時進行
+        imported = PzPipeline(
+            'access-migration',
+            self.pzDb.stream_query(f'SELECT * FROM {access_table_name} {condition} ORDER BY {student_id}',
+                                   self.config.mysql.batch_size),
+            transform, write).run()
 
-        logger.info(f'>>> {len(basic_entities)} 筆資料匯入')
-        return len(basic_entities)
+        logger.info(f'>>> {imported} 筆資料匯入')
+        return imported
@@ -14,7 +14,10 @@ class AccessDbService:
 
     def __init__(self, cfg: PzProjectConfig):
         self.config = cfg
-        self.pzDb = PzDatabase(cfg.ms_access_db.db_file)
+        self.pzDb = PzDatabase(cfg.ms_access_db.db_file, batch_size=cfg.ms_access_db.batch_size)
+
+    def close(self):
+        self.pzDb.close()
 
     def class_members_table_creation(self, entries: list[MysqlClassMemberEntity]) -> int:
         table_name = 'ClassMembers'
@@ -1,6 +1,6 @@
 import functools
 from collections import OrderedDict
-from typing import Callable
+from typing import Callable, Iterable
 
 from loguru import logger
 
@@ -15,6 +15,7 @@ from pz.models.mysql_member_detail_entity import MysqlMemberDetailEntity
 from pz.models.new_class_senior import NewClassSeniorModel
 from pz.models.pz_class import PzClass
 from pz.models.special_deacon import SpecialDeacon
+from pz.snapshot import PzSnapshotStore
 from pz.utils import full_name_to_names, names_to_pz_full_name
 from services.access_db_service import AccessDbService
 from services.member_merging_service import MemberMergingService
@@ -24,6 +25,7 @@ from services.mysql_import_and_fetching import MySqlImportAndFetchingService
 class PzGrandMemberService:
     config: PzProjectConfig
     mysql_service: MySqlImportAndFetchingService | None
+    snapshot_store: PzSnapshotStore | None
     member_details_by_name: dict[str, list[MysqlMemberDetailEntity]]
     member_details_by_student_id: dict[int, MysqlMemberDetailEntity]
     class_members_by_name: dict[str, list[MysqlClassMemberEntity]]
@@ -38,10 +40,18 @@ class PzGrandMemberService:
 
     def __init__(self, config: PzProjectConfig, from_access: bool = False, from_google: bool = False,
                  all_via_access_db: bool = False,
-                 deacons: list[NewClassSeniorModel] | None = None):
+                 deacons: list[NewClassSeniorModel] | None = None,
+                 from_snapshot: bool | None = None):
+        """
+        from_snapshot: 從 --export-snapshot 匯出的快照讀取學員及學員基本資料, 不需要連線資料庫.
+                       None 時依設定檔的 from_snapshot (沒有指定其他資料來源時才使用)
+        """
         self.config = config
+        if from_snapshot is None:
+            from_snapshot = config.from_snapshot and not (from_access or from_google or all_via_access_db)
+        self.snapshot_store = PzSnapshotStore(config.snapshot_folder) if from_snapshot else None
 
-        if all_via_access_db:
+        if all_via_access_db or from_snapshot:
             self.mysql_service = None
         else:
             self.mysql_service = MySqlImportAndFetchingService(self.config)
@@ -66,19 +76,23 @@ class PzGrandMemberService:
                 if order <= len(config.deacon_order):
                     self.special_deacons[key] = SpecialDeacon(m, title, order)
 
-        if from_google:
+        if from_snapshot:
+            self.init_class_members(self.read_class_members_from_snapshot)
+        elif from_google:
             self.init_class_members(self.read_class_members_from_google)
         elif all_via_access_db:
             self.init_class_members(self.read_class_members_from_access)
         else:
             self.init_class_members(self.read_class_members_from_mysql)
 
-        if from_access or all_via_access_db:
+        if from_snapshot:
+            self.init_member_details(self.read_member_details_from_snapshot)
+        elif from_access or all_via_access_db:
             self.init_member_details(self.read_member_details_from_access)
         else:
             self.init_member_details(self.read_member_details_from_mysql)
 
-    def init_member_details(self, fetching_function: Callable[[], list[MysqlMemberDetailEntity]]):
+    def init_member_details(self, fetching_function: Callable[[], Iterable[MysqlMemberDetailEntity]]):
         self.member_details_by_name = {}
         self.member_details_by_student_id = {}
 
@@ -464,12 +478,13 @@ class PzGrandMemberService:
         else:
             return []
 
-    def read_member_details_from_mysql(self) -> list[MysqlMemberDetailEntity]:
-        return self.mysql_service.read_member_details()
+    def read_member_details_from_mysql(self) -> Iterable[MysqlMemberDetailEntity]:
+        return self.mysql_service.iter_member_details()
 
     def read_member_details_from_access(self) -> list[MysqlMemberDetailEntity]:
         service = MemberMergingService(self.config.ms_access_db.db_file, self.config.ms_access_db.target_table)
         cols, results = service.read_all()
+        service.close()
 
         entities = []
 
@@ -479,9 +494,29 @@ class PzGrandMemberService:
 
         return entities
 
+    def read_class_members_from_snapshot(self) -> list[MysqlClassMemberEntity]:
+        snapshot = self.snapshot_store.load(f'class_members_{self.config.semester}')
+        return [MysqlClassMemberEntity(snapshot.columns, x) for x in snapshot.rows]
+
+    def read_member_details_from_snapshot(self) -> list[MysqlMemberDetailEntity]:
+        snapshot = self.snapshot_store.load('member_details')
+        return [MysqlMemberDetailEntity(snapshot.columns, x) for x in snapshot.rows]
+
+    def _seniors_from_class_members(self) -> list[MysqlClassMemberEntity]:
+        """
+        與 MySqlImportAndFetchingService.read_current_seniors 相同的條件
+        """
+        seniors = set([x.senior for x in self.all_class_members])
+        results = [x for x in self.all_class_members
+                   if x.real_name in seniors and x.real_name == x.senior and x.deacon is not None and x.deacon != '']
+        return sorted(results, key=lambda x: (x.class_name, int(x.class_group)))
+
     def read_class_members_from_access(self) -> list[MysqlClassMemberEntity]:
         service = AccessDbService(self.config)
-        return service.read_all_members_as_mysql()
+        try:
+            return service.read_all_members_as_mysql()
+        finally:
+            service.close()
 
     @staticmethod
     def class_group_as_key(class_name: str, class_group: int):
@@ -489,7 +524,10 @@ class PzGrandMemberService:
 
     def _read_senior_into_cache(self):
         if len(self.senior_by_class_and_group) == 0:
-            self.all_seniors = self.mysql_service.read_current_seniors()
+            if self.mysql_service is None and self.snapshot_store is not None:
+                self.all_seniors = self._seniors_from_class_members()
+            else:
+                self.all_seniors = self.mysql_service.read_current_seniors()
 
             for senior in self.all_seniors:
                 key = self.class_group_as_key(senior.class_name, senior.class_group)
@@ -1,5 +1,9 @@
+from typing import Callable, Generator
+
 import pyodbc
 
+from pz.ms_access.db import PzDatabase
+from pz.ms_access.member_merge import PzMemberMergeEngine, PzMemberMergeReport
 from pz.ms_access.op import PzDbOperation
 
 
@@ -8,12 +12,24 @@ class MemberMergingService:
     target_table: str
     db_path: str
 
-    def __init__(self, db_path: str, target_table: str):
+    def __init__(self, db_path: str, target_table: str, database_factory: Callable[[], PzDatabase] | None = None):
         self.db_path = db_path
         self.target_table = target_table
-        self.pzOperation = PzDbOperation(self.db_path, self.target_table)
+        self.pzOperation = PzDbOperation(self.db_path, self.target_table, database_factory)
+
+    def close(self):
+        self.pzOperation.close()
+
+    def reemerging(self, relax: bool = True, single_pass: bool = True) -> PzMemberMergeReport | None:
+        """
+        single_pass: 一次讀入所有來源在記憶體中合併, 再用一個交易寫回 (結果與逐步執行相同)
+        """
+        if single_pass:
+            return PzMemberMergeEngine(self.pzOperation).run(relax)
+
+        # 003, 004, 006 不會被修改, 先平行讀取
+        self.pzOperation.prefetch([PzDbOperation.QUERY_003, PzDbOperation.QUERY_004, PzDbOperation.QUERY_006])
 
-    def reemerging(self, relax: bool = True):
         self.pzOperation.clear_target_database()  # 清空資料庫
 
         self.pzOperation.copy_members_only_in_002()  # 複製僅在 002 上有的資料 (上課記錄)
@@ -45,6 +61,7 @@ class MemberMergingService:
         # pzOperation.compare_update_pid_and_birthday_from_006(True, relax)
 
         self.pzOperation.set_null_for_blank_pid_and_dharma_name_in_target()
+        return None
 
     def comparing(self):
         self.pzOperation.pid_and_gender_checker()
@@ -57,3 +74,6 @@ class MemberMergingService:
 
     def read_all(self) -> tuple[list[str], list[pyodbc.Row]]:
         return self.pzOperation.read_all_from_target()
+
+    def stream_all(self, batch_size: int | None = None) -> Generator[tuple[list[str], list[pyodbc.Row]], None, None]:
+        return self.pzOperation.stream_all_from_target(batch_size)
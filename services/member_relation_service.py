@@ -11,11 +11,9 @@ class MemberRelationService:
 
     def load_relations(self, gender_care: bool = False):
         service = MySqlImportAndFetchingService(self.config)
-        entries = service.read_member_relations()
-
         relations_by_key: dict[str, list[MysqlMemberRelationEntity]] = {}
 
-        for entry in entries:
+        for entry in service.iter_member_relations():
             for relation_key in entry.relationKeys:
                 if relation_key in relations_by_key:
                     relations_by_key[relation_key].append(entry)
@@ -1,6 +1,6 @@
 import json
 import re
-from typing import Callable
+from typing import Any, Callable, Generator
 
 from loguru import logger
 
@@ -16,8 +16,10 @@ from pz.models.member_in_access import MemberInAccessDB
 from pz.models.mysql_class_member_entity import MysqlClassMemberEntity
 from pz.models.mysql_member_detail_entity import MysqlMemberDetailEntity
 from pz.models.mysql_member_relation_entity import MysqlMemberRelationEntity
+from pz.models.mysql_sync_result import MysqlSyncResult
 from pz.models.vertical_member_lookup_result import VerticalMemberLookupResult
 from pz.mysql.db import PzMysqlDatabase
+from pz.pipeline import PzPipeline
 from pz.utils import full_name_to_real_name, simple_phone_number_normalization
 from services.member_merging_service import MemberMergingService
 
@@ -38,58 +40,130 @@ class MySqlImportAndFetchingService:
     current_table: str
     previous_table: str
 
-    def __init__(self, config: PzProjectConfig):
+    # 常用查詢條件的索引 (班級成員資料表以 'class_members' 代表各學期的資料表)
+    SECONDARY_INDEXES: dict[str, list[tuple[str, list[str]]]] = {
+        'member_details': [
+            ('idx_real_name', ['real_name']),
+        ],
+        'class_members': [
+            ('idx_class_name_group', ['class_name', 'class_group']),
+            ('idx_real_name', ['real_name']),
+            ('idx_senior', ['senior']),
+        ],
+        'member_relationships': [
+            ('idx_real_name', ['real_name']),
+        ],
+    }
+
+    VIEW_VERSION_TABLE = 'pz_view_versions'
+
+    # 報到系統用的 view, 修改 SELECT 時請一併增加版本號碼
+    CHECKIN_VIEWS: dict[str, tuple[int, str]] = {
+        'view_member_only_for_checkin': (1, '''
+        SELECT d.student_id,d.real_name,d.dharma_name,c.class_name,c.class_group,d.gender,d.personal_id,d.mobile_phone 
+        FROM member_details d
+        LEFT JOIN `{class_members}` c USING (student_id)
+        ORDER BY c.class_name,c.class_group,d.student_id
+        '''),
+        'view_class_member_for_checkin': (1, '''
+        SELECT c.student_id,c.real_name,c.dharma_name,c.class_name,c.class_group,c.gender,d.personal_id,d.mobile_phone 
+        FROM `{class_members}` c 
+        LEFT JOIN member_details d USING (student_id) ORDER BY class_name,class_group
+        '''),
+    }
+    # key 為 (host, database, view 名稱), 同一個程序連到不同資料庫時各自檢查
+    _ensured_views: dict[tuple[str, str, str], tuple[int, str]] = {}
+
+    def __init__(self, config: PzProjectConfig, db: PzMysqlDatabase | None = None):
         self.config = config
-        self.db = PzMysqlDatabase(config.mysql)
+        self.db = db if db is not None else PzMysqlDatabase(config.mysql)
         self.current_table = f'class_members_{self.config.semester}'
         self.previous_table = f'class_members_{self.config.previous_semester}'
 
-    def access_db_member_to_mysql(self, service: MemberMergingService) -> int:
+    def access_db_member_to_mysql(self, service: MemberMergingService, bulk_load: bool = True) -> int:
         # cols, results = service.read_all()
+        table_name = 'member_details'
+        staging_table = self._staging_table_name(table_name)
 
         columns = []
         insert_columns = ['`id`']
-        insert_values = ['%s']
         for k, v in MemberInAccessDB.ATTRIBUTES_MAP.items():
             columns.append(f'`{v}` VARCHAR(255) COMMENT \'{k}\',')
             insert_columns.append(f'`{v}`')
-            insert_values.append('%s')
 
         query = (f'''
-            CREATE TABLE IF NOT EXISTS `member_details` (
+            CREATE TABLE `{staging_table}` (
                 id INT NOT NULL COMMENT 'Student ID',
                 {"\n".join(columns)}
-                PRIMARY KEY (`student_id`)
+                PRIMARY KEY (`student_id`),
+                {self._secondary_index_definitions(table_name)}
             ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
                  ''')
 
-        self._drop_table('member_details')
-
+        def transform(chunk: tuple[list[str], list[Any]]) -> list[tuple]:
+            cols, results = chunk
+            params = []
+            for result in results:
+                entry = MemberInAccessDB(cols, result)
+                param = [int(entry.student_id)]
+                for _, v in MemberInAccessDB.ATTRIBUTES_MAP.items():
+                    value = entry.__getattribute__(v)
+                    if v.endswith('_phone'):
+                        value = simple_phone_number_normalization(value)
+
+                    param.append(value)
+                # print(param)
+                params.append(tuple(param))
+            return params
+
+        self._drop_table(staging_table)
         self.db.perform_update(query)
 
-        cols, results = service.read_all()
+        # 讀取 Access 與寫入 MySQL 同時進行, 失敗時正式的資料表不受影響
+        imported = PzPipeline('access-to-mysql', service.stream_all(self.config.mysql.batch_size), transform,
+                              self._chunk_loader(staging_table, insert_columns, bulk_load)).run()
+        logger.info(f'>>> {imported} 筆資料匯入')
+        self._swap_in_staging_table(table_name)
+        return imported
 
-        query = f'INSERT INTO `member_details` ({",".join(insert_columns)}) VALUES ({",".join(insert_values)})'
-        # print(query)
+    @staticmethod
+    def _index_kind(table_name: str) -> str:
+        if table_name.startswith('class_members'):
+            return 'class_members'
+        return table_name
 
-        params = []
-        for result in results:
-            entry = MemberInAccessDB(cols, result)
-            param = [int(entry.student_id)]
-            for _, v in MemberInAccessDB.ATTRIBUTES_MAP.items():
-                value = entry.__getattribute__(v)
-                if v.endswith('_phone'):
-                    value = simple_phone_number_normalization(value)
+    @staticmethod
+    def _secondary_index_definitions(table_name: str) -> str:
+        indexes = MySqlImportAndFetchingService.SECONDARY_INDEXES.get(
+            MySqlImportAndFetchingService._index_kind(table_name), [])
+        return ',\n'.join([f'KEY `{name}` ({",".join([f"`{x}`" for x in columns])})' for name, columns in indexes])
 
-                param.append(value)
-            # print(param)
-            params.append(tuple(param))
+    def ensure_indexes(self) -> int:
+        """
+            幫已經存在的資料表補上缺少的索引, 回傳新增的索引數
+        """
+        tables = ['member_details', self.current_table, self.previous_table, 'member_relationships']
+        added = 0
 
-        supplier = (lambda y=x: x for x in params)
-        self.db.prepared_update(query, supplier)
+        for table_name in sorted(self.existing_tables(tables)):
+            _, results = self.db.query(f'''
+            SELECT DISTINCT INDEX_NAME FROM information_schema.STATISTICS 
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = '{table_name}'
+            ''')
+            existing_indexes = set([x[0] for x in results])
+
+            for name, columns in self.SECONDARY_INDEXES.get(self._index_kind(table_name), []):
+                if name not in existing_indexes:
+                    logger.info(f'{table_name}: 新增索引 {name} ({",".join(columns)})')
+                    self.db.perform_update(
+                        f'ALTER TABLE `{table_name}` ADD INDEX `{name}` ({",".join([f"`{x}`" for x in columns])})')
+                    added += 1
 
-        logger.info(f'>>> {len(params)} 筆資料匯入')
-        return len(params)
+        return added
+
+    @staticmethod
+    def _staging_table_name(table_name: str) -> str:
+        return f'{table_name}_staging'
 
     def _drop_table(self, table_name: str):
         try:
@@ -97,82 +171,165 @@ class MySqlImportAndFetchingService:
         except Exception as ignored:
             pass
 
-    def _rename_table(self, from_name: str, to_name: str):
-        try:
-            self.db.perform_update(f'ALTER TABLE `{from_name}` RENAME TO `{to_name}`')
-        except Exception as ignored:
-            pass
+    def existing_tables(self, table_names: list[str]) -> set[str]:
+        names = ','.join([f"'{x}'" for x in table_names])
+        _, results = self.db.query(f'''
+        SELECT TABLE_NAME FROM information_schema.TABLES 
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME IN ({names})
+        ''')
+        return set([x[0] for x in results])
 
-    def _backup_table(self, current_table: str):
-        number_of_backups = 3
+    def _load_into_table(self, table_name: str, columns: list[str], params: list[tuple], bulk_load: bool) -> int:
+        if bulk_load and self.config.mysql.bulk_load:
+            try:
+                imported = self.db.load_data(table_name, columns, params)
+                logger.info(f'>>> {imported} 筆資料匯入 (LOAD DATA)')
+                return imported
+            except Exception as e:
+                logger.warning(f'LOAD DATA 匯入失敗, 改用逐筆匯入: {e}')
+                self.db.perform_update(f'TRUNCATE TABLE `{table_name}`')
 
-        from_table = f'{current_table}_{number_of_backups + 1}'
-        self._drop_table(from_table)
+        query = f'INSERT INTO `{table_name}` ({",".join(columns)}) VALUES ({",".join(["%s"] * len(columns))})'
+        logger.info(f'Query: {query}')
 
-        for i in range(number_of_backups, 0, -1):
-            try:
-                to_table = from_table
-                from_table = f'{current_table}_{i}'
-                self._rename_table(from_table, to_table)
-            except Exception as ignored:
-                pass
-        self._rename_table(current_table, from_table)
-
-    def _create_the_checkin_member_only_view(self):
-        query = f"""
-        CREATE OR REPLACE VIEW view_member_only_for_checkin AS 
-        SELECT d.student_id,d.real_name,d.dharma_name,c.class_name,c.class_group,d.gender,d.personal_id,d.mobile_phone 
-        FROM member_details d
-        LEFT JOIN {self.current_table} c USING (student_id)
-        ORDER BY c.class_name,c.class_group,d.student_id
+        supplier = (lambda y=x: x for x in params)
+        result = self.db.batch_update(query, supplier)
+
+        logger.info(f'>>> {result.succeeded} 筆資料匯入, {result.failed} 筆失敗')
+        return result.succeeded
+
+    def _chunk_loader(self, table_name: str, columns: list[str], bulk_load: bool) -> Callable[[list[tuple]], int]:
+        """
+            分批寫入用的 writer, 以 LOAD DATA 寫入失敗時, 刪除該批資料 (以第一個欄位 (整數) 為 key) 後改用逐筆匯入
         """
+        use_load_data = bulk_load and self.config.mysql.bulk_load
+        query = f'INSERT INTO `{table_name}` ({",".join(columns)}) VALUES ({",".join(["%s"] * len(columns))})'
+
+        def load(params: list[tuple]) -> int:
+            nonlocal use_load_data
+            if len(params) == 0:
+                return 0
+
+            if use_load_data:
+                try:
+                    return self.db.load_data(table_name, columns, params)
+                except Exception as e:
+                    logger.warning(f'LOAD DATA 匯入失敗, 改用逐筆匯入: {e}')
+                    use_load_data = False
+                    keys = ','.join([str(int(x[0])) for x in params])
+                    self.db.perform_update(f'DELETE FROM `{table_name}` WHERE {columns[0]} IN ({keys})')
 
-        try:
-            self.db.perform_update(query)
-        except Exception as e:
-            logger.warning(e)
+            supplier = (lambda y=x: x for x in params)
+            result = self.db.batch_update(query, supplier)
+            if result.failed > 0:
+                logger.warning(f'>>> {result.failed} 筆失敗')
+            return result.succeeded
 
-    def _create_the_checkin_class_member_view(self):
-        query = f"""
-        CREATE OR REPLACE VIEW view_class_member_for_checkin AS 
-        SELECT c.student_id,c.real_name,c.dharma_name,c.class_name,c.class_group,c.gender,d.personal_id,d.mobile_phone 
-        FROM {self.current_table} c 
-        LEFT JOIN member_details d USING (student_id) ORDER BY class_name,class_group
+        return load
+
+    def _swap_in_staging_table(self, table_name: str, number_of_backups: int = 0):
+        """
+            用一個 RENAME TABLE 同時輪替備份 (table_1 為最新的備份) 並把 staging 換成正式的資料表,
+            讀取的一方不會看到空的或是只匯入一半的資料表
+        """
+        staging_table = self._staging_table_name(table_name)
+        backups = [f'{table_name}_{i}' for i in range(1, number_of_backups + 2)]
+
+        self._drop_table(backups[-1])
+        existing_tables = self.existing_tables([table_name] + backups)
+
+        renames = []
+        for i in range(number_of_backups, 0, -1):
+            if backups[i - 1] in existing_tables:
+                renames.append(f'`{backups[i - 1]}` TO `{backups[i]}`')
+        if table_name in existing_tables:
+            renames.append(f'`{table_name}` TO `{backups[0]}`')
+        renames.append(f'`{staging_table}` TO `{table_name}`')
+
+        self.db.perform_update(f'RENAME TABLE {", ".join(renames)}')
+
+        if number_of_backups == 0:
+            self._drop_table(backups[0])
+
+    def _checkin_view_select(self, view_name: str) -> str:
+        _, template = self.CHECKIN_VIEWS[view_name]
+        return template.format(class_members=self.current_table)
+
+    def _view_key(self, view_name: str) -> tuple[str, str, str]:
+        return self.config.mysql.host, self.config.mysql.database, view_name
+
+    def _ensure_checkin_view(self, view_name: str) -> bool:
+        """
+            只有在 view 不存在, 版本不同或學期資料表變更時才重建 view, 避免每次匯出都執行 DDL
         """
+        version, _ = self.CHECKIN_VIEWS[view_name]
+        expected = (version, self.current_table)
+
+        if MySqlImportAndFetchingService._ensured_views.get(self._view_key(view_name)) == expected:
+            return True
 
         try:
-            self.db.perform_update(query)
+            existing_tables = self.existing_tables([view_name, self.VIEW_VERSION_TABLE])
+
+            if self.VIEW_VERSION_TABLE not in existing_tables:
+                self.db.perform_update(f'''
+                CREATE TABLE `{self.VIEW_VERSION_TABLE}` (
+                    `view_name` varchar(64) NOT NULL,
+                    `version` int NOT NULL,
+                    `source_table` varchar(64) NOT NULL,
+                    `updated_at` datetime DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                    PRIMARY KEY (`view_name`)
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci
+                ''')
+                current = None
+            else:
+                _, results = self.db.query(f"SELECT `version`,`source_table` FROM `{self.VIEW_VERSION_TABLE}` "
+                                           f"WHERE `view_name` = '{view_name}'")
+                current = tuple(results[0]) if len(results) > 0 else None
+
+            if view_name not in existing_tables or current != expected:
+                logger.info(f'建立 {view_name} (版本: {version}, 資料表: {self.current_table})')
+                self.db.perform_update(f'CREATE OR REPLACE VIEW `{view_name}` AS {self._checkin_view_select(view_name)}')
+                self.db.prepared_update(
+                    f'INSERT INTO `{self.VIEW_VERSION_TABLE}` (`view_name`,`version`,`source_table`) '
+                    f'VALUES (%s,%s,%s) '
+                    f'ON DUPLICATE KEY UPDATE `version`=VALUES(`version`),`source_table`=VALUES(`source_table`)',
+                    (lambda y=x: x for x in [(view_name, version, self.current_table)]))
+
+            MySqlImportAndFetchingService._ensured_views[self._view_key(view_name)] = expected
+            return True
         except Exception as e:
-            logger.warning(e)
-
-    def read_checkin_member_only_view(self) -> list[ClassMemberForCheckinModel]:
-        self._create_the_checkin_member_only_view()
-        cols, results = self.db.query('SELECT * FROM view_member_only_for_checkin')
-        entities = []
-        for result in results:
-            entity = ClassMemberForCheckinModel(cols, result)
-            entities.append(entity)
-        return entities
+            logger.warning(f'{view_name}: {e}')
+            return False
 
-    def read_checkin_class_member_view(self) -> list[ClassMemberForCheckinModel]:
-        self._create_the_checkin_class_member_view()
-        cols, results = self.db.query('SELECT * FROM view_class_member_for_checkin')
+    def _read_checkin_view(self, view_name: str, use_view: bool) -> list[ClassMemberForCheckinModel]:
+        if use_view and self._ensure_checkin_view(view_name):
+            try:
+                cols, results = self.db.query(f'SELECT * FROM `{view_name}`')
+            except Exception as e:
+                # view 在這次執行期間被刪除或修改, 下次重新檢查; 這次直接查詢
+                logger.warning(f'{view_name}: {e}')
+                MySqlImportAndFetchingService._ensured_views.pop(self._view_key(view_name), None)
+                cols, results = self.db.query(self._checkin_view_select(view_name))
+        else:
+            # 直接查詢, 不需要任何 DDL
+            cols, results = self.db.query(self._checkin_view_select(view_name))
         entities = []
         for result in results:
             entity = ClassMemberForCheckinModel(cols, result)
             entities.append(entity)
         return entities
 
-    def google_class_members_to_mysql(self, check_formula: bool = False) -> int:
-        settings: PzProjectGoogleSpreadsheetConfig = self.config.google.spreadsheets.get('class_members')
-
-        if settings is not None:
+    def read_checkin_member_only_view(self, use_view: bool = True) -> list[ClassMemberForCheckinModel]:
+        return self._read_checkin_view('view_member_only_for_checkin', use_view)
 
-            GoogleClassMemberModel.remap_variables(settings.fields_map)
-            service = PzCloudSpreadsheetMemberService(settings, self.config.google.secret_file)
+    def read_checkin_class_member_view(self, use_view: bool = True) -> list[ClassMemberForCheckinModel]:
+        return self._read_checkin_view('view_class_member_for_checkin', use_view)
 
-            query = (f'''
-CREATE TABLE `{self.current_table}`  (
+    @staticmethod
+    def _class_members_creation_query(table_name: str) -> str:
+        return f'''
+CREATE TABLE `{table_name}`  (
   `id` int NOT NULL AUTO_INCREMENT,
   `student_id` int NOT NULL COMMENT '學員編號',
   `class_name` varchar(5) CHARACTER SET utf8mb4 COLLATE utf8mb4_general_ci NOT NULL COMMENT '班級',
@@ -186,92 +343,186 @@ CREATE TABLE `{self.current_table}`  (
   `notes` varchar(64) CHARACTER SET utf8mb4 COLLATE utf8mb4_general_ci DEFAULT NULL COMMENT '調查備註',
   `updated_at` datetime DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
   PRIMARY KEY (`id`),
-  UNIQUE KEY `student_id` (`student_id`,`class_name`)
+  UNIQUE KEY `student_id` (`student_id`,`class_name`),
+  {MySqlImportAndFetchingService._secondary_index_definitions('class_members')}
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
-            ''')
+            '''
 
-            self._backup_table(self.current_table)
-            self.db.perform_update(query)
+    def _read_google_class_member_params(self, check_formula: bool) -> list[tuple] | None:
+        settings: PzProjectGoogleSpreadsheetConfig = self.config.google.spreadsheets.get('class_members')
 
-            columns_insert = ','.join([f'`{k}`' for k in MysqlClassMemberEntity.VARIABLE_MAP.keys()])
-            values_insert = ','.join(['%s' for _ in MysqlClassMemberEntity.VARIABLE_MAP.keys()])
-            query = f'INSERT INTO `{self.current_table}` ({columns_insert}) VALUES ({values_insert})'
-            logger.info(f'Query: {query}')
+        if settings is None:
+            return None
 
-            members: list[GoogleClassMemberModel] = service.read_all(
-                GoogleClassMemberModel([]), settings.sheet_name, check_formula=check_formula)
-            params = []
-            for member in members:
-                # logger.info(member.to_json())
-                param = []
-                have_error = False
-                for k, v in MysqlClassMemberEntity.VARIABLE_MAP.items():
-                    value = member.__getattribute__(v)
+        GoogleClassMemberModel.remap_variables(settings.fields_map)
+        service = PzCloudSpreadsheetMemberService(settings, self.config.google.secret_file)
 
-                    if k == 'student_id' and (value is None or not value.isdigit()):
+        columns_insert = [f'`{k}`' for k in MysqlClassMemberEntity.VARIABLE_MAP.keys()]
+
+        members: list[GoogleClassMemberModel] = service.read_all(
+            GoogleClassMemberModel([]), settings.sheet_name, check_formula=check_formula)
+        params = []
+        for member in members:
+            # logger.info(member.to_json())
+            param = []
+            have_error = False
+            for k, v in MysqlClassMemberEntity.VARIABLE_MAP.items():
+                value = member.__getattribute__(v)
+
+                if k == 'student_id' and (value is None or not value.isdigit()):
+                    param.append(value)
+                    have_error = True
+                elif k == 'id' or k == 'student_id' or k == 'class_group':
+                    try:
+                        param.append(int(value))
+                    except ValueError as e:
+                        logger.trace(f'k:[{k}], value:[{value}], error:{e}')
                         param.append(value)
                         have_error = True
-                    elif k == 'id' or k == 'student_id' or k == 'class_group':
-                        try:
-                            param.append(int(value))
-                        except ValueError as e:
-                            logger.trace(f'k:[{k}], value:[{value}], error:{e}')
-                            param.append(value)
-                            have_error = True
-                        except TypeError as e:
-                            logger.trace(f'k:[{k}], value:[{value}], error:{e}')
-                            param.append(value)
-                            have_error = True
-                    elif k == 'real_name':
-                        param.append(full_name_to_real_name(value))
-                    elif k == 'next_classes':
-                        if isinstance(value, list) and len(value) > 0:
-                            param.append(json.dumps(value))
-                        # elif isinstance(value, str):
-                        #     param.append(value)
-                        else:
-                            param.append(None)
-                    else:
+                    except TypeError as e:
+                        logger.trace(f'k:[{k}], value:[{value}], error:{e}')
                         param.append(value)
-                if have_error:
-                    logger.warning(f'Error: {param} {columns_insert}')
+                        have_error = True
+                elif k == 'real_name':
+                    param.append(full_name_to_real_name(value))
+                elif k == 'next_classes':
+                    if isinstance(value, list) and len(value) > 0:
+                        param.append(json.dumps(value))
+                    # elif isinstance(value, str):
+                    #     param.append(value)
+                    else:
+                        param.append(None)
                 else:
-                    params.append(tuple(param))
+                    param.append(value)
+            if have_error:
+                logger.warning(f'Error: {param} {",".join(columns_insert)}')
+            else:
+                params.append(tuple(param))
 
-            supplier = (lambda y=x: x for x in params)
-            self.db.prepared_update(query, supplier)
+        return params
+
+    def google_class_members_to_mysql(self, check_formula: bool = False, bulk_load: bool = True) -> int:
+        params = self._read_google_class_member_params(check_formula)
+
+        if params is not None:
+            return self._full_import_class_members(params, bulk_load)
+
+    def _full_import_class_members(self, params: list[tuple], bulk_load: bool) -> int:
+        staging_table = self._staging_table_name(self.current_table)
+        columns_insert = [f'`{k}`' for k in MysqlClassMemberEntity.VARIABLE_MAP.keys()]
+
+        self._drop_table(staging_table)
+        self.db.perform_update(self._class_members_creation_query(staging_table))
+
+        imported = self._load_into_table(staging_table, columns_insert, params, bulk_load)
+
+        self._swap_in_staging_table(self.current_table, number_of_backups=3)
+        return imported
+
+    @staticmethod
+    def _class_member_comparable(values: tuple) -> tuple:
+        results = []
+        for k, v in zip(MysqlClassMemberEntity.VARIABLE_MAP.keys(), values):
+            if k == 'next_classes' and v is not None and v != '':
+                results.append(json.loads(v))
+            else:
+                results.append(v)
+        return tuple(results)
+
+    def google_class_members_sync_to_mysql(self, check_formula: bool = False) -> MysqlSyncResult | None:
+        """
+            只把 Google 試算表與資料庫的差異 (新增/修改/刪除) 寫回資料庫, 以 (學員編號, 班級) 為鍵值
+        """
+        params = self._read_google_class_member_params(check_formula)
+
+        if params is None:
+            return None
+
+        sync_result = MysqlSyncResult()
+
+        if len(self.existing_tables([self.current_table])) == 0:
+            sync_result.inserted = self._full_import_class_members(params, True)
+            sync_result.failed = len(params) - sync_result.inserted
+            logger.info(f'>>> {sync_result}')
+            return sync_result
+
+        keys = list(MysqlClassMemberEntity.VARIABLE_MAP.keys())
+        student_id_index = keys.index('student_id')
+        class_name_index = keys.index('class_name')
+        columns = [f'`{k}`' for k in keys]
+
+        current: dict[tuple[int, str], tuple] = {}
+        for _, rows in self.db.stream_query(f'SELECT {",".join(columns)} FROM `{self.current_table}`'):
+            for row in rows:
+                current[(row[student_id_index], row[class_name_index])] = self._class_member_comparable(row)
+
+        upserts: list[tuple] = []
+        seen: set[tuple[int, str]] = set()
+        for param in params:
+            key = (param[student_id_index], param[class_name_index])
+            if key in seen:
+                logger.warning(f'重複的學員編號及班級: {key}')
+                continue
+            seen.add(key)
+
+            if key not in current:
+                sync_result.inserted += 1
+                upserts.append(param)
+            elif current[key] != self._class_member_comparable(param):
+                sync_result.updated += 1
+                upserts.append(param)
+            else:
+                sync_result.unchanged += 1
+
+        deletes = [key for key in current.keys() if key not in seen]
+        sync_result.deleted = len(deletes)
+
+        if len(upserts) > 0:
+            updates = ','.join([f'{x}=VALUES({x})' for x in columns if x != '`student_id`' and x != '`class_name`'])
+            query = (f'INSERT INTO `{self.current_table}` ({",".join(columns)}) '
+                     f'VALUES ({",".join(["%s"] * len(columns))}) '
+                     f'ON DUPLICATE KEY UPDATE {updates}')
+            logger.info(f'Query: {query}')
+            result = self.db.batch_update(query, (lambda y=x: x for x in upserts))
+            sync_result.failed += result.failed
 
-            logger.info(f'>>> {len(params)} 筆資料匯入')
-            return len(params)
+        if len(deletes) > 0:
+            query = f'DELETE FROM `{self.current_table}` WHERE `student_id`=%s AND `class_name`=%s'
+            result = self.db.batch_update(query, (lambda y=x: x for x in deletes))
+            sync_result.failed += result.failed
+
+        logger.info(f'>>> {sync_result}')
+        return sync_result
 
     # def google_relationships_to_mysql(self):
     #     settings: PzProjectGoogleSpreadsheetConfig = self.config.google.spreadsheets.get('relationships')
 
     def read_google_class_members(self) -> list[MysqlClassMemberEntity]:
-        cols, results = self.db.query(f'SELECT * FROM `{self.current_table}` ORDER BY class_name,class_group,id')
-        entities = []
-        for result in results:
-            entity = MysqlClassMemberEntity(cols, result)
-            entities.append(entity)
-        return entities
+        return list(self.iter_google_class_members())
+
+    def iter_google_class_members(self) -> Generator[MysqlClassMemberEntity, None, None]:
+        for cols, results in self.db.stream_query(
+                f'SELECT * FROM `{self.current_table}` ORDER BY class_name,class_group,id'):
+            for result in results:
+                yield MysqlClassMemberEntity(cols, result)
 
     def read_member_details(self) -> list[MysqlMemberDetailEntity]:
+        return list(self.iter_member_details())
+
+    def iter_member_details(self) -> Generator[MysqlMemberDetailEntity, None, None]:
         table_name = 'member_details'
-        cols, results = self.db.query(f'SELECT * FROM `{table_name}`')
-        entities = []
-        for result in results:
-            entity = MysqlMemberDetailEntity(cols, result)
-            entities.append(entity)
-        return entities
+        for cols, results in self.db.stream_query(f'SELECT * FROM `{table_name}`'):
+            for result in results:
+                yield MysqlMemberDetailEntity(cols, result)
 
     def read_member_relations(self) -> list[MysqlMemberRelationEntity]:
+        return list(self.iter_member_relations())
+
+    def iter_member_relations(self) -> Generator[MysqlMemberRelationEntity, None, None]:
         table_name = 'member_relationships'
-        cols, results = self.db.query(f'SELECT * FROM `{table_name}`')
-        entities = []
-        for result in results:
-            entity = MysqlMemberRelationEntity(cols, result)
-            entities.append(entity)
-        return entities
+        for cols, results in self.db.stream_query(f'SELECT * FROM `{table_name}`'):
+            for result in results:
+                yield MysqlMemberRelationEntity(cols, result)
 
     def _read_seniors_from_table(self, table: str) -> list[MysqlClassMemberEntity]:
         cols, results = self.db.query(f'''
@@ -319,8 +570,121 @@ CREATE TABLE `{self.current_table}`  (
                     logger.warning(f'student_id:{entry.student_id}')
         return records, count
 
-    def google_relation_to_mysql(self, lookup: Callable[[GoogleMemberRelation], VerticalMemberLookupResult]) -> tuple[
-        int, list[GeneralProcessingError]]:
+    def import_and_update_in_batch(self, entries: list[MemberDetailModel]) -> tuple[int, int]:
+        """
+            結果與 import_and_update 相同. 先把所有資料放進暫存表, 再依欄位組合各用一個 UPDATE ... JOIN 更新,
+            全部在同一個 transaction 內完成; 失敗時改用逐筆更新
+        """
+        table_name = 'member_details'
+        tmp_table = 'tmp_member_details_update'
+        columns = [x for x in MemberDetailModel.VARIABLE_MAP.keys() if x != 'student_id']
+
+        records = 0
+        real_names: dict[int, str] = {}
+        deletes: set[int] = set()
+        updates: dict[int, dict[str, str | int]] = {}
+
+        for entry in entries:
+            if entry.student_id is None:
+                continue
+            records += 1
+            if not re.match(r'\d{9}', str(entry.student_id)) or not str(entry.student_id).strip().isdigit():
+                logger.warning(f'student_id:{entry.student_id}')
+                continue
+
+            student_id = int(str(entry.student_id).strip())
+            real_names[student_id] = entry.real_name
+            values = entry.non_empty_values()
+
+            if len(values) == 0:
+                # 沒有任何資料的列表示刪除該學員
+                deletes.add(student_id)
+                updates.pop(student_id, None)
+            elif student_id in updates:
+                updates[student_id].update(values)
+            else:
+                updates[student_id] = values
+
+        column_sets: dict[tuple[str, ...], int] = {}
+        rows = []
+        for student_id in deletes | updates.keys():
+            values = updates.get(student_id, {})
+            column_set = tuple([x for x in columns if x in values])
+            if len(column_set) > 0 and column_set not in column_sets:
+                column_sets[column_set] = len(column_sets) + 1
+            rows.append(tuple([str(student_id), column_sets.get(column_set, 0), 1 if student_id in deletes else 0] +
+                              [values.get(x) for x in columns]))
+
+        if len(rows) == 0:
+            return records, 0
+
+        changed: set[int] = set()
+
+        with self.db.session() as connection:
+            cursor = connection.cursor()
+            try:
+                cursor.execute(f'''
+                CREATE TEMPORARY TABLE `{tmp_table}` (
+                    `student_id` VARCHAR(255) NOT NULL,
+                    `column_set` INT NOT NULL,
+                    `is_delete` TINYINT NOT NULL,
+                    {",".join([f'`{x}` VARCHAR(255) NULL' for x in columns])},
+                    PRIMARY KEY (`student_id`),
+                    KEY `column_set` (`column_set`)
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci
+                ''')
+                tmp_columns = ','.join(['`student_id`', '`column_set`', '`is_delete`'] + [f'`{x}`' for x in columns])
+                cursor.executemany(f'INSERT INTO `{tmp_table}` ({tmp_columns}) '
+                                   f'VALUES ({",".join(["%s"] * (len(columns) + 3))})', rows)
+
+                cursor.execute(f'SELECT t.student_id FROM `{tmp_table}` t '
+                               f'JOIN `{table_name}` d USING (student_id) WHERE t.is_delete = 1')
+                # 刪除後又有新資料的學員, 會在下面新增時計入
+                changed.update([int(x[0]) for x in cursor.fetchall() if int(x[0]) not in updates])
+                cursor.execute(f'DELETE d FROM `{table_name}` d '
+                               f'JOIN `{tmp_table}` t USING (student_id) WHERE t.is_delete = 1')
+
+                for column_set, index in column_sets.items():
+                    update_columns = ','.join([f'`{x}`' for x in column_set])
+                    same_values = ' AND '.join([f'd.`{x}` <=> t.`{x}`' for x in column_set])
+                    cursor.execute(f'SELECT t.student_id FROM `{tmp_table}` t JOIN `{table_name}` d USING (student_id) '
+                                   f'WHERE t.column_set = {index} AND NOT ({same_values})')
+                    changed.update([int(x[0]) for x in cursor.fetchall()])
+
+                    cursor.execute(f'UPDATE `{table_name}` d JOIN `{tmp_table}` t USING (student_id) '
+                                   f'SET {",".join([f"d.`{x}` = t.`{x}`" for x in column_set])} '
+                                   f'WHERE t.column_set = {index}')
+
+                    cursor.execute(f'SELECT t.student_id FROM `{tmp_table}` t '
+                                   f'LEFT JOIN `{table_name}` d USING (student_id) '
+                                   f'WHERE t.column_set = {index} AND d.student_id IS NULL')
+                    changed.update([int(x[0]) for x in cursor.fetchall()])
+
+                    cursor.execute(f'INSERT INTO `{table_name}` (`id`,`student_id`,{update_columns}) '
+                                   f'SELECT CAST(t.student_id AS UNSIGNED),t.student_id,'
+                                   f'{",".join([f"t.`{x}`" for x in column_set])} FROM `{tmp_table}` t '
+                                   f'LEFT JOIN `{table_name}` d USING (student_id) '
+                                   f'WHERE t.column_set = {index} AND d.student_id IS NULL')
+
+                connection.commit()
+            except Exception as e:
+                connection.rollback()
+                logger.error(f'批次更新失敗, 改用逐筆更新: {e}')
+                return self.import_and_update(entries)
+            finally:
+                try:
+                    cursor.execute(f'DROP TEMPORARY TABLE IF EXISTS `{tmp_table}`')
+                except Exception as e:
+                    logger.trace(e)
+                cursor.close()
+
+        for student_id in sorted(changed):
+            logger.info(f'學員: {real_names[student_id]}, 學號: {student_id} 資料更新')
+
+        return records, len(changed)
+
+    def google_relation_to_mysql(self, lookup: Callable[[GoogleMemberRelation], VerticalMemberLookupResult],
+                                 bulk_load: bool = True) -> tuple[int, list[GeneralProcessingError]]:
         settings: PzProjectGoogleSpreadsheetConfig = self.config.google.spreadsheets.get('relationships')
 
         relation_table_name = 'member_relationships'
@@ -330,9 +694,10 @@ CREATE TABLE `{self.current_table}`  (
                 GoogleMemberRelation.remap_variables(settings.fields_map)
 
             service = PzCloudSpreadsheetRelationsService(settings, self.config.google.secret_file)
+            staging_table = self._staging_table_name(relation_table_name)
 
             query = (f'''
-CREATE TABLE `{relation_table_name}`  (
+CREATE TABLE `{staging_table}`  (
   `id` int NOT NULL AUTO_INCREMENT,
   `real_name` varchar(12) CHARACTER SET utf8mb4 COLLATE utf8mb4_general_ci NOT NULL COMMENT '姓名',
   `dharma_name` varchar(2) CHARACTER SET utf8mb4 COLLATE utf8mb4_general_ci DEFAULT NULL COMMENT '法名',
@@ -343,18 +708,12 @@ CREATE TABLE `{relation_table_name}`  (
   `relation_keys` json DEFAULT NULL COMMENT '親眷朋友關係',
   `updated_at` datetime DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
   PRIMARY KEY (`id`),
-  UNIQUE KEY `student_id` (`student_id`)
+  UNIQUE KEY `student_id` (`student_id`),
+  {self._secondary_index_definitions(relation_table_name)}
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
             ''')
 
-            self._backup_table(relation_table_name)
-            # self._drop_table(relation_table_name)
-            self.db.perform_update(query)
-
-            columns_insert = ','.join([f'`{k}`' for k in MysqlMemberRelationEntity.VARIABLE_MAP.keys()])
-            values_insert = ','.join(['%s' for _ in MysqlMemberRelationEntity.VARIABLE_MAP.keys()])
-            query = f'INSERT INTO `{relation_table_name}` ({columns_insert}) VALUES ({values_insert})'
-            logger.info(f'Query: {query}')
+            columns_insert = [f'`{k}`' for k in MysqlMemberRelationEntity.VARIABLE_MAP.keys()]
 
             errors: list[GeneralProcessingError] = []
             members: list[GoogleMemberRelation] = service.read_all()
@@ -429,11 +788,12 @@ CREATE TABLE `{relation_table_name}`  (
                 else:
                     logger.warning(f'Error: {have_name} {have_relation} {param}')
 
-            supplier = (lambda y=x: x for x in params)
-            self.db.prepared_update(query, supplier)
+            self._drop_table(staging_table)
+            self.db.perform_update(query)
 
-            logger.info(f'>>> {len(params)} 筆資料匯入')
-            return len(params), errors
+            imported = self._load_into_table(staging_table, columns_insert, params, bulk_load)
+            self._swap_in_staging_table(relation_table_name, number_of_backups=3)
+            return imported, errors
 
     def drop_and_create_table(self, table_name: str, creation_query: str):
         self._drop_table(table_name)
@@ -29,6 +29,9 @@ class AccessDatabaseDialog(QDialog):
             [
                 ('🔜 [A->M] 匯入學員基本資料 (Basics)', self.migrate_access_table_to_mysql),
             ],
+            [
+                ('🔜 [A->M] 接續中斷的匯入 (Basics)', self.resume_access_table_to_mysql),
+            ],
             [
                 ('🔙 [M->A] 班級學員資料匯入 Access', self.member_to_access),
             ],
@@ -61,9 +64,9 @@ class AccessDatabaseDialog(QDialog):
             self.uiCommons.show_error_dialog(e)
             logger.error(e)
 
-    def migrate_access_table_to_mysql(self):
+    def migrate_access_table_to_mysql(self, resume: bool = False):
         try:
-            count = migrate_access_table_to_mysql(self.configHolder.get_config())
+            count = migrate_access_table_to_mysql(self.configHolder.get_config(), resume=resume)
             self.uiCommons.done()
             self.uiCommons.show_message_dialog(
                 '資料表移轉', f'完成由 MS-Access 表匯入 {count} 筆資料到 MySQL')
@@ -71,6 +74,9 @@ class AccessDatabaseDialog(QDialog):
             self.uiCommons.show_error_dialog(e)
             logger.error(e)
 
+    def resume_access_table_to_mysql(self):
+        self.migrate_access_table_to_mysql(resume=True)
+
     def merge_access_database(self):
         try:
             member_data_merging(self.configHolder.get_config().ms_access_db.db_file, self.configHolder.get_config().ms_access_db.target_table)
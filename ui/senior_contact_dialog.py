@@ -95,7 +95,7 @@ class SeniorContactDialog(QDialog):
 
     #
     def google_to_mysql(self):
-        self.uiCommons.google_to_mysql(check_formula=True)
+        self.uiCommons.google_sync_to_mysql(check_formula=True)
 
     #     try:
     #         write_google_to_mysql(self.config)
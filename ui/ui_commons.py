@@ -5,7 +5,7 @@ from PyQt6.QtWidgets import QMessageBox, QWidget, QPushButton
 from loguru import logger
 
 from pz.config import PzProjectConfig
-from pz_functions.importers.mysql_functions import write_google_to_mysql
+from pz_functions.importers.mysql_functions import write_google_to_mysql, sync_google_to_mysql
 from ui.config_holder import ConfigHolder
 
 
@@ -81,6 +81,15 @@ class PzUiCommons:
             self.show_error_dialog(e)
             logger.error(e)
 
+    def google_sync_to_mysql(self, check_formula: bool = False):
+        try:
+            result = sync_google_to_mysql(self.configHolder.get_config(), check_formula=check_formula)
+            self.done()
+            self.show_message_dialog('Google 同步', f'Google 的班級及升班資料同步到資料庫: {result}')
+        except Exception as e:
+            self.show_error_dialog(e)
+            logger.error(e)
+
     @staticmethod
     def done():
         logger.info(f'##### 完成 #####')